@@ -0,0 +1,535 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from chart_data import CHART_ROW_THRESHOLD, SCATTER_SAMPLE, density_grid, lttb, rebin
+from data_store import load_students, update_students
+from instrumentation import timed
+from rankings import Rankings
+from schema import SUBJECTS
+from stats_cube import StatsCube
+
+# CSVs larger than this are streamed into aggregates instead of loaded
+STREAMING_FILE_SIZE = 2 * 2**30
+
+# Subsystems only some pages use (risk, peers, correlations, terms) are
+# imported where their structures are built, so a page that never needs
+# one does not load it.
+
+CLASS_COLUMNS = ['StudentID', 'Name', 'OverallPercentage', 'Grade', 'Attendance']
+
+# Rows per leaderboard page
+CLASS_LEADERBOARD_SIZE = 10
+SUBJECT_LEADERBOARD_SIZE = 15
+WATCHLIST_SIZE = 20
+WATCHLIST_COLUMNS = ['StudentID', 'Name', 'Class', 'Risk', 'Main Factor', 'OverallPercentage', 'Attendance',
+                     'AssignmentCompletion', 'ExamParticipation']
+# Students listed as having a similar subject profile
+PEER_COUNT = 10
+
+
+def use_streaming(csv_file):
+    """Stream when DASHBOARD_STREAMING=1, or when the file is too big to load"""
+    setting = os.environ.get('DASHBOARD_STREAMING')
+    if setting is not None:
+        return setting == '1'
+    return os.path.getsize(csv_file) > STREAMING_FILE_SIZE
+
+
+def _ranked(table, columns, start=1):
+    """Table of the given columns numbered from ``start``, as the leaderboards show it"""
+    table = table[columns].reset_index(drop=True)
+    table.index += start
+    return table
+
+
+class StudentAnalytics:
+    """Statistics behind every dashboard page, usable without Streamlit
+
+    Each page has one method returning the frames, series and numbers it
+    shows; the dashboard only turns them into widgets and charts.
+    """
+
+    def __init__(self, csv_file='students_data.csv', columnar=True, streaming=False,
+                 chart_rows=CHART_ROW_THRESHOLD, terms_dir=None, filters=None, policy=None):
+        self.csv_file = csv_file
+        self.columnar = columnar
+        self.streaming = streaming
+        self.chart_rows = chart_rows
+        self.subjects = list(SUBJECTS)
+        self.filters = dict(filters or {})
+        if streaming and policy is not None:
+            raise RuntimeError('Streamed data keeps aggregates only, not rows')
+        self.policy = policy
+        # Earlier (and current) terms of the roster, one file each, for the trend views
+        self.terms = None
+        if terms_dir and os.path.isdir(terms_dir):
+            from terms import TermStore
+
+            self.terms = TermStore(terms_dir, columnar=columnar)
+        self.load_data()
+
+    @timed
+    def load_data(self):
+        """Load student data from the shared, version-keyed cache"""
+        self._attach(load_students(self.csv_file, columnar=self.columnar, streaming=self.streaming))
+
+    @timed
+    def upsert(self, batch):
+        """Replace or append students (matched on StudentID) without reloading the roster
+
+        The statistics cube and rankings are updated from the batch alone, and
+        every session loading the same file picks up the new snapshot.
+        """
+        self._attach(update_students(self.source_data, batch))
+
+    @timed
+    def set_filters(self, filters):
+        """Narrow every page to the students matching ``filters``; empty selections keep everyone
+
+        ``filters`` maps a column of bitmaps.FILTER_COLUMNS to the values to
+        keep, e.g. ``{'Class': ['10A', '10B'], 'Attendance': ['≥95']}``.
+        """
+        if self.streaming and any(len(values) for values in (filters or {}).values()):
+            raise RuntimeError('Streamed data keeps aggregates only, not rows')
+        self.filters = dict(filters or {})
+        self._attach(self.source_data)
+
+    @timed
+    def set_policy(self, policy):
+        """Derive OverallPercentage and Grade from a grading.GradingPolicy; None uses the stored columns
+
+        Every page, filter and ranking follows the policy. Each policy is
+        computed once per data snapshot and kept, so switching between
+        policies does not read the source again.
+        """
+        if self.streaming and policy is not None:
+            raise RuntimeError('Streamed data keeps aggregates only, not rows')
+        self.policy = policy
+        self._attach(self.source_data)
+
+    def filter_options(self):
+        """Values each filter column can be narrowed to"""
+        return self.graded_data.bitmaps.options
+
+    @property
+    def total_students(self):
+        """Students in the roster before any filter"""
+        return self.graded_data.bitmaps.rows
+
+    @property
+    def matching_students(self):
+        """Students the filters keep, counted from the bitmaps"""
+        bitmaps = self.graded_data.bitmaps
+        return bitmaps.count(bitmaps.mask(self.filters))
+
+    def _attach(self, data):
+        """Point the analytics at a data snapshot, regraded by the policy and narrowed by the filters"""
+        self.source_data = data
+        self.graded_data = data if self.streaming else data.graded(self.policy)
+        self.data = self.graded_data if self.streaming else self.graded_data.filtered(self.filters)
+        self._df = None
+        self.classes = self.data.classes
+        self.data_version = self.data.version
+
+        # Streamed data only has aggregates; the row-level structures below do not exist
+        self.aggregates = self.data.aggregates
+        if self.streaming:
+            self.cube = self.aggregates.cube
+            return
+
+        self.cube = self.data.derived('stats_cube', self._build_cube)
+        self.index = self.data.index
+        self.class_rows = self.index.class_rows
+
+    @property
+    def df(self):
+        """Full student frame, only materialized when a page needs every column"""
+        if self._df is None:
+            self._df = self.data.view()
+        return self._df
+
+    def columns(self, names):
+        """Frame of just the columns a page needs"""
+        return self.data.columns(names)
+
+    @property
+    def rankings(self):
+        """Per-class score order of every subject and the overall percentage, built on first use"""
+        return self.data.derived('rankings', self._build_rankings)
+
+    @property
+    def correlations(self):
+        """Pairwise co-moments of attendance, assignments and every score, per class and gender"""
+        if self.streaming:
+            return self.aggregates.correlations
+        return self.data.derived('correlations', self._build_correlations)
+
+    @property
+    def risk(self):
+        """Risk score of every student and the watchlist order, built on first use"""
+        if self.streaming:
+            raise RuntimeError('Streamed data keeps aggregates only, not rows')
+        return self.data.derived('risk', self._build_risk)
+
+    def _build_risk(self, data):
+        from risk import RISK_COLUMNS, RiskIndex
+
+        return RiskIndex.from_frame(data.columns(['Class'] + RISK_COLUMNS))
+
+    @property
+    def peers(self):
+        """Nearest-neighbour index over every student's subject scores, built on first use"""
+        if self.streaming:
+            raise RuntimeError('Streamed data keeps aggregates only, not rows')
+        # Subject scores depend on neither the grading policy nor the filters: one index serves them all
+        return self.source_data.derived('peers', self._build_peers)
+
+    def _build_peers(self, data):
+        from peers import PeerIndex
+
+        return PeerIndex.from_frame(data.columns(self.subjects))
+
+    def _build_correlations(self, data):
+        from correlations import VARIABLES, CorrelationCube
+
+        return CorrelationCube.from_frame(data.columns(['Class', 'Gender'] + VARIABLES))
+
+    def _build_rankings(self, data):
+        metrics = self.subjects + ['OverallPercentage']
+        return Rankings.from_frame(data.columns(['Class'] + metrics), metrics)
+
+    def _build_cube(self, data):
+        """Precompute per-(Class, Gender, metric) statistics for a data version"""
+        metrics = self.subjects + ['OverallPercentage', 'Attendance']
+        return StatsCube.from_frame(data.columns(['Class', 'Gender', 'Grade'] + metrics), metrics)
+
+    def get_class_frame(self, class_name, columns=None):
+        """Rows of one class, taken by position instead of a full-frame scan"""
+        return self.get_classes_frame([class_name], columns)
+
+    def get_classes_frame(self, class_names, columns=None):
+        """Rows of several classes, in the order the classes are given"""
+        frame = self.df if columns is None else self.columns(columns)
+        rows = [self.class_rows[name] for name in class_names if name in self.class_rows]
+        subset = frame.take(np.concatenate(rows) if rows else [])
+
+        # Dictionary-encoded columns keep every category; charts should only see the ones present
+        for column in subset.select_dtypes('category').columns:
+            subset[column] = subset[column].cat.remove_unused_categories()
+        return subset
+
+    @timed
+    def get_student_stats(self, student_id):
+        """Get comprehensive statistics for a student"""
+        student = self.data.row(self.index.position(student_id))
+
+        scores = [student[subject] for subject in self.subjects]
+
+        # Calculate rank in class
+        rank, total_in_class = self.index.class_rank(student['Class'], student['OverallPercentage'])
+
+        return {
+            'student': student,
+            'scores': scores,
+            'class_average': self.cube.means(['OverallPercentage'], classes=[student['Class']]).iloc[0],
+            'rank': rank,
+            'total_in_class': total_in_class,
+            'class_percentile': self.index.class_percentile(student['Class'], student['OverallPercentage']),
+            'school_percentile': self.cube.percentile_rank('OverallPercentage', student['OverallPercentage'])
+        }
+
+    @timed
+    def get_class_stats(self, class_name, columns=None):
+        """Get comprehensive statistics for a class"""
+        class_df = None if self.streaming else self.get_class_frame(class_name, columns)
+        overall = self.cube.summary('OverallPercentage', classes=[class_name])
+
+        stats = {
+            'total_students': int(self.cube.row_counts(classes=[class_name]).sum()),
+            'mean_score': overall['mean'],
+            'median_score': overall['median'],
+            'std_dev': overall['std'],
+            'min_score': overall['min'],
+            'max_score': overall['max'],
+            'avg_attendance': self.cube.summary('Attendance', classes=[class_name])['mean'],
+            'pass_rate': overall['pass_rate']
+        }
+
+        return stats, class_df
+
+    def top_students(self, class_name, n=10, bottom=False, offset=0, columns=None):
+        """Best (or weakest) students of a class by OverallPercentage, ``n`` from ``offset`` on"""
+        if self.streaming:
+            return self.aggregates.top_students(class_name, n, bottom=bottom, offset=offset)
+        rows = self.rankings.page('OverallPercentage', offset, offset + n, class_name=class_name, bottom=bottom)
+        return (self.df if columns is None else self.columns(columns)).take(rows)
+
+    def top_in_subject(self, subject, n=15, offset=0):
+        """Best students school-wide in one subject, ``n`` from ``offset`` on"""
+        if self.streaming:
+            return self.aggregates.top_in_subject(subject, n, offset=offset)
+        rows = self.rankings.page(subject, offset, offset + n)
+        return self.columns(['StudentID', 'Name', 'Class', subject, 'OverallPercentage']).take(rows)
+
+    def leaderboard_pages(self, metric, size, class_name=None):
+        """Number of pages a leaderboard of ``size`` rows per page runs to"""
+        if self.streaming:
+            # Only the best and worst ``top_k`` of each class and subject are kept
+            count = min(self.aggregates.top_k, self.cube.summary(
+                metric, classes=None if class_name is None else [class_name])['count'])
+        else:
+            count = self.rankings.count(metric, class_name)
+        return max(1, -(-count // size))
+
+    def class_leaderboard(self, class_name, page=0, bottom=False):
+        """One page of a class's best, or weakest, students"""
+        columns = ['StudentID', 'Name', 'OverallPercentage', 'Grade'] + (['Attendance'] if bottom else [])
+        offset = page * CLASS_LEADERBOARD_SIZE
+        return _ranked(self.top_students(class_name, CLASS_LEADERBOARD_SIZE, bottom=bottom, offset=offset,
+                                         columns=columns), columns, start=offset + 1)
+
+    def subject_leaderboard(self, subject, page=0):
+        """One page of the school's best students in a subject"""
+        offset = page * SUBJECT_LEADERBOARD_SIZE
+        return _ranked(self.top_in_subject(subject, SUBJECT_LEADERBOARD_SIZE, offset=offset),
+                       ['StudentID', 'Name', 'Class', subject, 'OverallPercentage'], start=offset + 1)
+
+    def watchlist_pages(self, class_name=None):
+        """Number of pages the watchlist of a class, or of the school, runs to"""
+        return max(1, -(-self.risk.count(class_name) // WATCHLIST_SIZE))
+
+    def watchlist(self, class_name=None, page=0):
+        """One page of the students most at risk, in a class or school-wide, highest score first"""
+        risk = self.risk
+        offset = page * WATCHLIST_SIZE
+        rows = risk.page(offset, min(offset + WATCHLIST_SIZE, risk.count(class_name)), class_name=class_name)
+        table = self.columns([column for column in WATCHLIST_COLUMNS if column not in ('Risk', 'Main Factor')])
+        table = table.take(rows)
+        table['Risk'] = risk.scores[rows]
+        table['Main Factor'] = risk.factors(rows)
+        return _ranked(table, WATCHLIST_COLUMNS, start=offset + 1)
+
+    @timed
+    def similar_students(self, student_ids, k=PEER_COUNT, workers=1):
+        """For each student, the ``k`` across the school whose subject scores are closest, nearest first
+
+        Returns a table per StudentID. Score Gap is the root-mean-square
+        difference over the subjects, in percentage points. ``workers``
+        threads share the queries of a large batch.
+        """
+        positions = [self.source_data.index.position(student_id) for student_id in student_ids]
+        found = self.peers.nearest(positions, k, workers=workers)
+        columns = ['StudentID', 'Name', 'Class', 'OverallPercentage', 'Grade'] + self.subjects
+        # One take for the whole batch, then a slice per student
+        rows = np.concatenate([rows for rows, _ in found] + [[]]).astype(np.int64)
+        table = self.graded_data.columns(columns).take(rows)
+        distances = np.concatenate([distances for _, distances in found] + [[]])
+        table.insert(3, 'Score Gap', (distances / np.sqrt(len(self.subjects))).round(2))
+        bounds = np.cumsum([0] + [len(rows) for rows, _ in found])
+        return {student_id: _ranked(table.iloc[start:stop], table.columns)
+                for student_id, start, stop in zip(student_ids, bounds[:-1], bounds[1:])}
+
+    def raw_chart(self, rows):
+        """Whether a chart over ``rows`` points should get the points themselves
+
+        Above the threshold (and always when streaming) charts get binned
+        counts, quartiles or density grids whose size does not grow with
+        the roster.
+        """
+        return not self.streaming and rows <= self.chart_rows
+
+    def score_histogram(self, metric, nbins, classes=None):
+        """Equal-width histogram bars of a metric, folded from the cube"""
+        return rebin(self.cube.histogram(metric, classes=classes), self.cube.bins_per_point, nbins)
+
+    # ==================== PAGE COMPUTATIONS ====================
+
+    @timed
+    def overview(self):
+        """School-wide headline numbers and the series behind the Overview charts"""
+        overall = self.cube.summary('OverallPercentage')
+        return {
+            'total_students': self.cube.total_rows,
+            'total_classes': len(self.classes),
+            'avg_performance': overall['mean'],
+            'avg_attendance': self.cube.summary('Attendance')['mean'],
+            'pass_rate': overall['pass_rate'],
+            'grade_counts': self.cube.grade_counts(),
+            'performance': (self.columns(['OverallPercentage'])['OverallPercentage']
+                            if self.raw_chart(self.cube.total_rows) else None),
+            'class_performance': self.cube.mean_table(['OverallPercentage'])['OverallPercentage'].sort_values(
+                ascending=False),
+            'gender_counts': self.cube.row_counts(by='Gender').sort_values(ascending=False),
+            'subject_averages': self.cube.means(self.subjects).sort_values(ascending=False),
+        }
+
+    @timed
+    def student_profile(self, student_id):
+        """One student's scores, rank and standing against their class"""
+        from risk import student_risk
+
+        stats = self.get_student_stats(student_id)
+        scores = pd.Series(stats['scores'], index=self.subjects, dtype=np.float64)
+        return {
+            **stats,
+            'subject_scores': pd.DataFrame({'Subject': self.subjects, 'Score': scores.to_numpy()}).sort_values(
+                'Score', ascending=False),
+            'class_subject_averages': self.cube.means(self.subjects, classes=[stats['student']['Class']]),
+            'summary': pd.Series({
+                'Mean': scores.mean(),
+                'Median': scores.median(),
+                'Std Dev': scores.std(ddof=0),
+                'Min Score': scores.min(),
+                'Max Score': scores.max(),
+                'Range': scores.max() - scores.min(),
+            }),
+            # Strongest subject first; ties keep the subject order
+            'ranked_subjects': scores.sort_values(ascending=False, kind='stable'),
+            'risk': student_risk(stats['student']),
+        }
+
+    @timed
+    def risk_overview(self):
+        """At-risk counts per class and by main factor, plus the first page of the school-wide watchlist"""
+        from risk import AT_RISK_SCORE, RISK_FACTORS
+
+        risk = self.risk
+        by_class = risk.counts()
+        class_sizes = self.cube.row_counts(by='Class').reindex(by_class.index)
+        at_risk = risk.scores >= AT_RISK_SCORE
+        by_factor = pd.Series(np.bincount(risk.main[at_risk & (risk.main >= 0)], minlength=len(RISK_FACTORS)),
+                              index=RISK_FACTORS)
+        return {
+            'at_risk': int(by_class.sum()),
+            'total': len(risk.scores),
+            'mean_score': float(risk.scores.mean()) if len(risk.scores) else np.nan,
+            'by_class': pd.DataFrame({'At Risk': by_class, 'Share (%)': by_class / class_sizes * 100}),
+            'by_factor': by_factor.sort_values(ascending=False, kind='stable'),
+            'watchlist': self.watchlist(),
+        }
+
+    @timed
+    def class_report(self, class_name):
+        """Class statistics, per-subject summary, leaderboards and attendance relationship"""
+        stats, class_df = self.get_class_stats(class_name, columns=CLASS_COLUMNS)
+        subject_stats = pd.DataFrame([
+            {'Subject': subject, 'Mean': summary['mean'], 'Median': summary['median'],
+             'Std Dev': summary['std'], 'Min': summary['min'], 'Max': summary['max']}
+            for subject, summary in
+            ((subject, self.cube.summary(subject, classes=[class_name])) for subject in self.subjects)
+        ])
+        report = {
+            'stats': stats,
+            'students': class_df,
+            'grade_counts': self.cube.grade_counts(classes=[class_name]).sort_values(ascending=False),
+            'subject_stats': subject_stats,
+            'top': self.class_leaderboard(class_name),
+            'bottom': self.class_leaderboard(class_name, bottom=True),
+            'watchlist': None,
+            'scores': None,
+            'density': None,
+            'sample': None,
+        }
+        report['fit'] = self.correlations.fit('Attendance', 'OverallPercentage', classes=[class_name])
+        if self.streaming:
+            # No rows at all: density grid from the streamed chunks
+            report['density'] = self.aggregates.density_grid(class_name)
+        else:
+            report['watchlist'] = self.watchlist(class_name)
+            x, y = class_df['Attendance'].to_numpy(), class_df['OverallPercentage'].to_numpy()
+            if self.raw_chart(len(class_df)):
+                report['scores'] = class_df['OverallPercentage']
+            else:
+                # Too many points to scatter: density grid plus a shape-preserving sample to hover over
+                report['density'] = density_grid(x, y)
+                report['sample'] = class_df.iloc[lttb(x, y, SCATTER_SAMPLE)]
+        report['correlation'] = report['fit']['r']
+        return report
+
+    @timed
+    def subject_report(self, subject):
+        """School-wide distribution of one subject, its class breakdown and leaderboard"""
+        return {
+            'summary': self.cube.summary(subject),
+            'scores': self.columns([subject])[subject] if self.raw_chart(self.cube.total_rows) else None,
+            'box': self.cube.box_stats(subject),
+            'by_class': self.cube.group_summary(subject, by='Class')[['mean', 'median', 'std']].reset_index(),
+            'top': self.subject_leaderboard(subject),
+        }
+
+    @timed
+    def class_comparison(self, class_names):
+        """Score rows and the class x subject mean matrix for the selected classes"""
+        subject_averages = self.cube.mean_table(self.subjects, by='Class', labels=class_names)
+        rows = self.cube.row_counts(classes=class_names).sum()
+        return {
+            'scores': (self.get_classes_frame(class_names, columns=['Class', 'OverallPercentage'])
+                       if self.raw_chart(rows) else None),
+            'boxes': self.cube.group_box_stats('OverallPercentage', by='Class', labels=class_names),
+            'subject_averages': subject_averages,
+            'subject_long': subject_averages.reset_index().melt(
+                id_vars='Class', var_name='Subject', value_name='Average Score'
+            ),
+        }
+
+    @timed
+    def class_correlations(self, class_names):
+        """How attendance, assignments and each subject relate to OverallPercentage, class by class
+
+        Every number is read from the correlation cube, so comparing any
+        set of classes costs no pass over their rows.
+        """
+        fits = {
+            variable: self.correlations.group_fits(variable, 'OverallPercentage', by='Class', labels=class_names)
+            for variable in ['Attendance', 'AssignmentCompletion']
+        }
+        return {
+            'by_class': self.correlations.group_correlations('OverallPercentage', by='Class', labels=class_names),
+            'fits': pd.concat(fits, names=['Variable']).reset_index(),
+            'matrix': self.correlations.matrix(classes=class_names),
+        }
+
+    @timed
+    def gender_comparison(self):
+        """Overall and per-subject performance by gender"""
+        return {
+            'summary': self.cube.group_summary('OverallPercentage', by='Gender')[['mean', 'median', 'std']],
+            'scores': (self.columns(['Gender', 'OverallPercentage'])
+                       if self.raw_chart(self.cube.total_rows) else None),
+            'boxes': self.cube.group_box_stats('OverallPercentage', by='Gender'),
+            'subject_long': self.cube.mean_table(self.subjects, by='Gender').reset_index().melt(
+                id_vars='Gender', var_name='Subject', value_name='Average Score'
+            ),
+        }
+
+    # ==================== TERM TRENDS ====================
+
+    def has_terms(self):
+        """Whether a term directory with at least one term is attached"""
+        return self.terms is not None and bool(self.terms.terms)
+
+    @timed
+    def student_terms(self, student_id):
+        """A student's scores in every term they appear in, and the change since their previous term"""
+        trajectory = self.terms.student_trajectory(student_id)
+        metrics = self.subjects + ['OverallPercentage', 'Attendance']
+        return {
+            'trajectory': trajectory,
+            'changes': trajectory[metrics].diff().iloc[-1] if len(trajectory) > 1 else None,
+        }
+
+    @timed
+    def class_terms(self, class_name):
+        """A class's averages per term against the school's, term-over-term changes and its most improved students"""
+        terms = self.terms.terms
+        trend = self.terms.class_trend(class_name)
+        metrics = ['OverallPercentage', 'Attendance'] + self.subjects
+        return {
+            'trend': trend,
+            'school': self.terms.class_trend()['OverallPercentage'],
+            'deltas': trend[metrics].diff().iloc[1:],
+            'improved': (self.terms.student_changes('OverallPercentage', terms[-2], terms[-1], class_name)
+                         .head(CLASS_LEADERBOARD_SIZE) if len(terms) > 1 else None),
+        }
@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+from urllib.parse import parse_qs, unquote
+
+import numpy as np
+import pandas as pd
+
+from analytics import PEER_COUNT, StudentAnalytics, use_streaming
+from data_store import load_students
+from figure_cache import FigureCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bodies smaller than this are sent uncompressed; gzip would barely shrink them
+MIN_COMPRESS_BYTES = 1024
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_MAX_BYTES = 64 * 2**20
+# Most similar students one request may ask for
+MAX_PEERS = 100
+
+
+class NotFound(Exception):
+    pass
+
+
+def to_json(value):
+    """Plain JSON types for the frames, series and NumPy values the analytics return"""
+    if isinstance(value, pd.DataFrame):
+        return [to_json(row) for row in value.to_dict(orient='records')]
+    if isinstance(value, (dict, pd.Series)):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_json(item) for item in value]
+    if isinstance(value, (float, np.floating)):
+        # Scores are stored as float32, which holds about seven significant digits;
+        # printing more would turn 76.7 into 76.69999694824219
+        return None if np.isnan(value) else float(f'{value:.7g}')
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if value is pd.NA or value is pd.NaT:
+        return None
+    return value
+
+
+def encode(value):
+    if orjson is not None:
+        return orjson.dumps(to_json(value))
+    return json.dumps(to_json(value), separators=(',', ':')).encode()
+
+
+def _numbered(table):
+    """Leaderboard rows with their rank as a field"""
+    return table.rename_axis('Rank').reset_index()
+
+
+class StatsAPI:
+    """ASGI application serving the dashboard's statistics as JSON
+
+    Numbers come from the same StudentAnalytics methods and the same shared
+    snapshot as the dashboard, so an upsert or a changed file shows up in
+    both. Encoded responses are kept in an LRU keyed by data version, path
+    and query. Each one carries a weak ETag derived from the data version,
+    so clients revalidating an unchanged roster get a bodiless 304, answered
+    from the cached response once the path and query have resolved. Bodies are gzipped for clients that accept it.
+    """
+
+    def __init__(self, data_file='students_data.csv', streaming=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.data_file = data_file
+        self.streaming = use_streaming(data_file) if streaming is None else streaming
+        self.analytics = StudentAnalytics(data_file, streaming=self.streaming)
+        self.responses = FigureCache(max_entries=max_entries, max_bytes=max_bytes)
+        # (pattern, handler, needs rows); streamed data only has aggregates
+        self.routes = [
+            (r'/overview', self.overview, False),
+            (r'/students/(?P<student_id>[^/]+)', self.student, True),
+            (r'/students/(?P<student_id>[^/]+)/peers', self.student_peers, True),
+            (r'/classes', self.classes, False),
+            (r'/classes/(?P<class_name>[^/]+)', self.class_stats, False),
+            (r'/classes/(?P<class_name>[^/]+)/leaderboard', self.class_leaderboard, False),
+            (r'/subjects', self.subjects, False),
+            (r'/subjects/(?P<subject>[^/]+)', self.subject_stats, False),
+            (r'/subjects/(?P<subject>[^/]+)/leaderboard', self.subject_leaderboard, False),
+            (r'/compare/classes', self.compare_classes, False),
+            (r'/compare/gender', self.compare_gender, False),
+            (r'/compare/correlations', self.compare_correlations, False),
+            (r'/watchlist', self.watchlist, True),
+        ]
+        self.routes = [(re.compile(f'^{pattern}/?$'), handler, rows) for pattern, handler, rows in self.routes]
+
+    # ==================== ENDPOINTS ====================
+
+    def overview(self, analytics, query):
+        data = analytics.overview()
+        data.pop('performance')
+        return data
+
+    def student(self, analytics, query, student_id):
+        try:
+            stats = analytics.get_student_stats(student_id)
+        except KeyError:
+            raise NotFound(f"Unknown student {student_id}")
+        stats['scores'] = dict(zip(analytics.subjects, stats['scores']))
+        return stats
+
+    def student_peers(self, analytics, query, student_id):
+        k = int(query.get('k', PEER_COUNT))
+        if not 1 <= k <= MAX_PEERS:
+            raise ValueError(f'k must be between 1 and {MAX_PEERS}')
+        try:
+            peers = analytics.similar_students([student_id], k)[student_id]
+        except KeyError:
+            raise NotFound(f"Unknown student {student_id}")
+        return _numbered(peers)
+
+    def classes(self, analytics, query):
+        return analytics.classes
+
+    def class_stats(self, analytics, query, class_name):
+        self._check(class_name, analytics.classes, 'class')
+        report = analytics.class_report(class_name)
+        return {
+            'stats': report['stats'],
+            'grade_counts': report['grade_counts'],
+            'subject_stats': report['subject_stats'],
+            'attendance_fit': report['fit'],
+        }
+
+    def class_leaderboard(self, analytics, query, class_name):
+        self._check(class_name, analytics.classes, 'class')
+        bottom = query.get('bottom', '0') in ('1', 'true')
+        return _numbered(analytics.class_leaderboard(class_name, _page(query), bottom=bottom))
+
+    def subjects(self, analytics, query):
+        return analytics.subjects
+
+    def subject_stats(self, analytics, query, subject):
+        self._check(subject, analytics.subjects, 'subject')
+        report = analytics.subject_report(subject)
+        return {'summary': report['summary'], 'box': report['box'], 'by_class': report['by_class']}
+
+    def subject_leaderboard(self, analytics, query, subject):
+        self._check(subject, analytics.subjects, 'subject')
+        return _numbered(analytics.subject_leaderboard(subject, _page(query)))
+
+    def compare_classes(self, analytics, query):
+        names = [name for name in query.get('classes', '').split(',') if name] or analytics.classes
+        for name in names:
+            self._check(name, analytics.classes, 'class')
+        comparison = analytics.class_comparison(names)
+        return {
+            'boxes': comparison['boxes'].rename_axis('Class').reset_index(),
+            'subject_averages': comparison['subject_averages'].rename_axis('Class').reset_index(),
+        }
+
+    def compare_correlations(self, analytics, query):
+        names = [name for name in query.get('classes', '').split(',') if name] or analytics.classes
+        for name in names:
+            self._check(name, analytics.classes, 'class')
+        correlations = analytics.class_correlations(names)
+        return {
+            'by_class': correlations['by_class'].reset_index(),
+            'fits': correlations['fits'],
+            'matrix': correlations['matrix'].rename_axis('Variable').reset_index(),
+        }
+
+    def compare_gender(self, analytics, query):
+        comparison = analytics.gender_comparison()
+        return {
+            'summary': comparison['summary'].rename_axis('Gender').reset_index(),
+            'boxes': comparison['boxes'].rename_axis('Gender').reset_index(),
+            'subject_averages': comparison['subject_long'],
+        }
+
+    def watchlist(self, analytics, query):
+        class_name = query.get('class') or None
+        if class_name is not None:
+            self._check(class_name, analytics.classes, 'class')
+        return {
+            'at_risk': analytics.risk.count(class_name),
+            'pages': analytics.watchlist_pages(class_name),
+            'students': _numbered(analytics.watchlist(class_name, _page(query))),
+        }
+
+    @staticmethod
+    def _check(value, known, kind):
+        if value not in known:
+            raise NotFound(f"Unknown {kind} {value}")
+
+    # ==================== ASGI ====================
+
+    def current(self):
+        """Analytics over the latest shared snapshot; requests in flight keep the one they started with"""
+        analytics = self.analytics
+        data = load_students(self.data_file, columnar=analytics.columnar, streaming=self.streaming)
+        if data is not analytics.source_data:
+            analytics = self.analytics = StudentAnalytics(self.data_file, streaming=self.streaming)
+        return analytics
+
+    def resolve(self, path):
+        for pattern, handler, needs_rows in self.routes:
+            match = pattern.match(path)
+            if match:
+                if needs_rows and self.streaming:
+                    raise NotFound(f"{path} needs student rows, which streamed data does not keep")
+                return handler, {key: unquote(value) for key, value in match.groupdict().items()}
+        raise NotFound(f"No endpoint at {path}")
+
+    def body(self, analytics, path, query_string):
+        """Encoded response for a path, from the cache or computed and stored"""
+        key = (analytics.data_version, path, query_string)
+        body = self.responses.get(key)
+        if body is None:
+            handler, arguments = self.resolve(path)
+            query = {name: values[-1] for name, values in parse_qs(query_string).items()}
+            body = encode(handler(analytics, query, **arguments))
+            self.responses.put(key, body)
+        return body
+
+    def compressed(self, key, body):
+        gzipped = self.responses.get(key)
+        if gzipped is None:
+            gzipped = gzip.compress(body, compresslevel=6)
+            self.responses.put(key, gzipped)
+        return gzipped
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        if scope['method'] not in ('GET', 'HEAD'):
+            await _respond(send, 405, encode({'error': 'Only GET and HEAD are supported'}), [(b'allow', b'GET, HEAD')])
+            return
+
+        headers = dict(scope['headers'])
+        analytics = self.current()
+        etag = f'W/"{hashlib.sha1(str(analytics.data_version).encode()).hexdigest()[:20]}"'.encode()
+        cache_headers = [(b'etag', etag), (b'cache-control', b'no-cache'), (b'vary', b'Accept-Encoding')]
+
+        path = scope['path']
+        query_string = scope.get('query_string', b'').decode()
+        try:
+            body = self.responses.get((analytics.data_version, path, query_string))
+            if body is None:
+                # Misses may scan columns; keep the event loop free for cached hits meanwhile
+                body = await asyncio.get_running_loop().run_in_executor(
+                    None, self.body, analytics, path, query_string)
+        except NotFound as error:
+            await _respond(send, 404, encode({'error': str(error)}))
+            return
+        except ValueError as error:
+            await _respond(send, 400, encode({'error': str(error)}))
+            return
+
+        # Only a request that resolved is answered as unchanged; a bad path or parameter still gets its error
+        if etag in [tag.strip() for tag in headers.get(b'if-none-match', b'').split(b',')]:
+            await _respond(send, 304, b'', cache_headers)
+            return
+        if len(body) >= MIN_COMPRESS_BYTES and b'gzip' in headers.get(b'accept-encoding', b''):
+            body = self.compressed((analytics.data_version, path, query_string, 'gzip'), body)
+            cache_headers.append((b'content-encoding', b'gzip'))
+        await _respond(send, 200, b'' if scope['method'] == 'HEAD' else body, cache_headers,
+                       length=len(body))
+
+
+def _page(query):
+    """Zero-based leaderboard page from the ``page`` parameter"""
+    page = int(query.get('page', 0))
+    if page < 0:
+        raise ValueError('page must be 0 or more')
+    return page
+
+
+async def _respond(send, status, body, headers=(), length=None):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body) if length is None else length).encode()), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def local_request(app, path, headers=None, method='GET'):
+    """Call the app in-process, with no server or network: returns (status, headers, body)
+
+    ``path`` may carry a query string. Header names are lower-cased.
+    """
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    response = {}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode(): value.decode() for name, value in message['headers']}
+        else:
+            response['body'] = response.get('body', b'') + message.get('body', b'')
+
+    asyncio.run(app(scope, receive, send))
+    return response['status'], response['headers'], response.get('body', b'')
+
+
+def create_app():
+    """App over DASHBOARD_DATA (default students_data.csv), for ``uvicorn --factory api:create_app``"""
+    return StatsAPI(os.environ.get('DASHBOARD_DATA', 'students_data.csv'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the dashboard statistics as a JSON API')
+    parser.add_argument('--host', default='127.0.0.1', help='bind address (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8000, help='port (default: %(default)s)')
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        parser.error('serving over HTTP needs an ASGI server: pip install uvicorn')
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == "__main__":
+    main()
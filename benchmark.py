@@ -0,0 +1,326 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import data_store
+from analytics import StudentAnalytics
+from column_store import default_store_path
+from correlations import VARIABLES, CorrelationCube
+from generate_data import generate
+from grading import GradingPolicy
+from peers import PeerIndex
+from publisher import Publisher
+from risk import RISK_COLUMNS, RiskIndex
+from schema import SUBJECTS
+from shared_store import default_shared_path, write_shared
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+SIZE_LABELS = {1_000: '1k', 100_000: '100k', 1_000_000: '1M', 10_000_000: '10M'}
+DATA_DIR = '.bench_data'
+
+
+def dataset_path(rows, data_dir=DATA_DIR):
+    """Generate (once) a roster of ``rows`` students from generate_data's model"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"students_{rows}.csv")
+    if not os.path.exists(path):
+        generate(rows, path, seed=42)
+    return path
+
+
+# ==================== MEASUREMENT ====================
+
+def measure(func, repeat=1):
+    """Median and best wall time of ``func`` over ``repeat`` runs, plus its peak traced allocation
+
+    tracemalloc slows allocation-heavy code down, so the memory run is a
+    separate, untimed call after the timed ones.
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'repeat': repeat,
+        'min_s': min(timings),
+        'median_s': statistics.median(timings),
+        'peak_mb': peak / 2**20,
+    }
+
+
+def benchmark_size(rows, repeat=5, lookups=200, render=False):
+    """Every measurement for one dataset size"""
+    path = dataset_path(rows)
+    store = default_store_path(path)
+    results = {}
+
+    def fresh_load(convert):
+        data_store.clear_cache()
+        if convert and os.path.isdir(store):
+            shutil.rmtree(store)
+        return StudentAnalytics(path)
+
+    results['load_csv_convert'] = measure(lambda: fresh_load(convert=True))
+    results['load_cold'] = measure(lambda: fresh_load(convert=False), repeat)
+    analytics = StudentAnalytics(path)
+    results['load_warm'] = measure(lambda: StudentAnalytics(path), repeat)
+
+    rng = np.random.default_rng(0)
+    ids = rng.choice(analytics.index.student_ids, size=min(lookups, rows))
+    results['get_student_stats'] = _per_call(measure(lambda: [analytics.get_student_stats(i) for i in ids]), len(ids))
+    results['get_class_stats'] = _per_call(
+        measure(lambda: [analytics.get_class_stats(c) for c in analytics.classes], repeat), len(analytics.classes)
+    )
+
+    pages = {
+        'Overview': analytics.overview,
+        'Student Analysis': lambda: analytics.student_profile(ids[0]),
+        'Class Analysis': lambda: analytics.class_report(analytics.classes[0]),
+        'Subject Analysis': lambda: analytics.subject_report(analytics.subjects[0]),
+        'Comparative Analysis': lambda: (analytics.class_comparison(analytics.classes[:3]),
+                                         analytics.gender_comparison()),
+        'At-Risk Students': analytics.risk_overview,
+    }
+    for page, compute in pages.items():
+        results[f"page:{page}"] = measure(compute, repeat)
+    # Paging through a class's weakest students, as counselors do
+    results['class_leaderboard_pages'] = _per_call(measure(
+        lambda: [analytics.class_leaderboard(analytics.classes[0], page, bottom=True) for page in range(20)], repeat
+    ), 20)
+
+    # Correlations: the per-class/gender co-moments, then every class's fits and matrix read from them
+    frame = analytics.columns(['Class', 'Gender'] + VARIABLES)
+    results['correlations_build'] = measure(lambda: CorrelationCube.from_frame(frame), repeat)
+    results['correlations_all_classes'] = measure(lambda: analytics.class_correlations(analytics.classes), repeat)
+
+    # Risk: every student scored and each class's watchlist sorted, then paging the school-wide one
+    frame = analytics.columns(['Class'] + RISK_COLUMNS)
+    results['risk_build'] = measure(lambda: RiskIndex.from_frame(frame), repeat)
+    results['watchlist_pages'] = _per_call(measure(
+        lambda: [analytics.watchlist(page=page) for page in range(20)], repeat
+    ), 20)
+
+    # Similar students: the index over every student's scores, one student's peers, then a batch across threads
+    scores = analytics.columns(analytics.subjects)
+    results['peers_build'] = measure(lambda: PeerIndex.from_frame(scores), repeat)
+    analytics.peers  # built here, so the queries below time the search alone
+    results['peers_query'] = _per_call(measure(lambda: [analytics.similar_students([i]) for i in ids]), len(ids))
+    results['peers_batch'] = _per_call(measure(
+        lambda: analytics.similar_students(ids, workers=os.cpu_count() or 1), repeat), len(ids))
+
+    # Filters: bitmap ops alone, then a combination not seen before narrowed into its own snapshot
+    bitmaps = analytics.data.bitmaps
+    combination = {'Class': analytics.classes[:3], 'Gender': ['Female'], 'Attendance': ['85-95', '≥95']}
+    results['filter_mask'] = measure(lambda: bitmaps.count(bitmaps.mask(combination)), repeat)
+    unseen = iter(analytics.classes)
+
+    def new_filter():
+        analytics.set_filters({**combination, 'Class': [next(unseen)]})
+        analytics.overview()
+        analytics.class_report(analytics.classes[0])
+    results['filter_new_pages'] = measure(new_filter, min(repeat, len(analytics.classes) - 1))
+    analytics.set_filters({})
+
+    # Grading policies: the regrade alone, then a policy not seen before through to its first pages
+    policies = (GradingPolicy({SUBJECTS[0]: weight}) for weight in itertools.count(2))
+    results['grading_regrade'] = measure(lambda: analytics.source_data.graded(next(policies)), repeat)
+
+    def new_policy():
+        analytics.set_policy(next(policies))
+        analytics.overview()
+        analytics.class_report(analytics.classes[0])
+    results['grading_new_pages'] = measure(new_policy, repeat)
+    analytics.set_policy(None)
+
+    # Rewrite the scores of a small batch of existing students
+    batch = analytics.columns(['StudentID', 'OverallPercentage']).take(rng.choice(rows, size=min(100, rows)))
+    batch = batch.assign(OverallPercentage=rng.uniform(0, 100, len(batch)).round(2))
+    results['upsert_100'] = measure(lambda: analytics.upsert(batch), repeat)
+
+    # One loader publishing for worker processes, and a worker attaching to what it published;
+    # the loader starts from the file, as a process of its own would
+    data_store.clear_cache()
+    publisher = Publisher(path, default_shared_path(path))
+    publisher.refresh()
+    results['shared_publish'] = measure(
+        lambda: write_shared(publisher.analytics.source_data, publisher.path, publisher.structures()), repeat
+    )
+    results['shared_upsert_100'] = measure(lambda: publisher.upsert(batch), repeat)
+
+    def attach():
+        data_store.clear_cache()
+        return StudentAnalytics(publisher.path)
+
+    results['shared_attach'] = measure(attach, repeat)
+
+    if render:
+        for page, seconds in render_pages(path, list(pages)).items():
+            results[f"render:{page}"] = {'repeat': 1, 'min_s': seconds, 'median_s': seconds, 'peak_mb': None}
+    return results
+
+
+def _per_call(result, calls):
+    result = dict(result)
+    result['calls'] = calls
+    result['per_call_ms'] = result['median_s'] / calls * 1000
+    return result
+
+
+def render_pages(path, pages):
+    """Full script runs of each page through Streamlit's headless test runner"""
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['DASHBOARD_DATA'] = os.path.abspath(path)
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard.py'),
+                            default_timeout=600)
+    app.run()
+    timings = {}
+    for page in pages:
+        radio = next(r for r in app.sidebar.radio if r.label == 'Select View')
+        start = time.perf_counter()
+        radio.set_value(page).run()
+        timings[page] = time.perf_counter() - start
+    return timings
+
+
+# Runs in a fresh interpreter under -X importtime; the marker separates Streamlit's
+# own start-up from what the dashboard script imports on its first run
+_STARTUP_SCRIPT = '''
+import sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+sys.stderr.write("startup-profile: first render\\n")
+start = time.perf_counter()
+app.run()
+print(time.perf_counter() - start)
+'''
+_IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def startup_profile(path):
+    """Time to first render of the dashboard in a fresh process, and what its imports cost
+
+    Streamlit itself is imported before the clock starts, as the server has
+    it loaded before running the script. Returns the render time and, for
+    each module the first run imported, its own and cumulative import time.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dashboard.py')
+    env = dict(os.environ, DASHBOARD_DATA=os.path.abspath(path))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _STARTUP_SCRIPT, script],
+                          capture_output=True, text=True, env=env, check=True)
+    _, _, imports = proc.stderr.partition('startup-profile: first render')
+    modules = [
+        {'module': name, 'self_ms': int(own) / 1000, 'cumulative_ms': int(total) / 1000,
+         'top_level': not indent}
+        for own, total, indent, name in _IMPORT_TIME.findall(imports)
+    ]
+    return {
+        'first_render_s': float(proc.stdout.split()[-1]),
+        'import_s': sum(m['cumulative_ms'] for m in modules if m['top_level']) / 1000,
+        'modules': sorted(modules, key=lambda m: -m['cumulative_ms']),
+    }
+
+
+def print_startup(profile, top=15):
+    print(f"  first render {profile['first_render_s'] * 1000:.0f} ms, of which imports "
+          f"{profile['import_s'] * 1000:.0f} ms")
+    print(f"    {'module':<44} {'self ms':>9} {'total ms':>9}")
+    for module in profile['modules'][:top]:
+        name = module['module'] if module['top_level'] else f"  {module['module']}"
+        print(f"    {name:<44} {module['self_ms']:>9.1f} {module['cumulative_ms']:>9.1f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    """Print median time ratios against an earlier report"""
+    print(f"\n{'size':>6} {'step':<34} {'before':>10} {'after':>10} {'ratio':>7}")
+    for size, steps in report['results'].items():
+        for step, result in steps.items():
+            before = baseline['results'].get(size, {}).get(step)
+            if before is None:
+                continue
+            ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('nan')
+            print(f"{size:>6} {step:<34} {before['median_s']:>10.4f} {result['median_s']:>10.4f} {ratio:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark data loading, lookups and page computations')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='comma-separated row counts (default: %(default)s; add 10000000 for 10M)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (default: 5)')
+    parser.add_argument('--render', action='store_true', help='also time full headless Streamlit page runs')
+    parser.add_argument('--startup', action='store_true',
+                        help='also profile cold start: time to first render and import cost per module')
+    parser.add_argument('--output', default='benchmark.json', help='JSON report path (default: %(default)s)')
+    parser.add_argument('--compare', help='earlier JSON report to compare against')
+    args = parser.parse_args(argv)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': {},
+    }
+    for rows in [int(size) for size in args.sizes.split(',')]:
+        label = SIZE_LABELS.get(rows, str(rows))
+        print(f"Benchmarking {label} rows...")
+        report['results'][label] = benchmark_size(rows, repeat=args.repeat, render=args.render)
+        for step, result in report['results'][label].items():
+            print(f"  {step:<34} {result['median_s'] * 1000:>10.2f} ms"
+                  + (f"  peak {result['peak_mb']:.1f} MB" if result['peak_mb'] is not None else ''))
+        if args.startup:
+            profile = startup_profile(dataset_path(rows))
+            report.setdefault('startup', {})[label] = profile
+            for step, seconds in (('startup:first_render', profile['first_render_s']),
+                                  ('startup:imports', profile['import_s'])):
+                report['results'][label][step] = {'repeat': 1, 'min_s': seconds, 'median_s': seconds,
+                                                  'peak_mb': None}
+            print_startup(profile)
+
+    try:
+        import resource
+        # ru_maxrss is in KiB on Linux; peak resident set size of the whole run
+        report['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        report['max_rss_mb'] = None
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+# Columns filtered by value, one bitmap per value
+VALUE_COLUMNS = ['Class', 'Gender', 'Grade', 'ExamParticipation']
+# Numeric columns filtered by band; the edges split them into len(edges) + 1 bands
+BANDS = {
+    'Attendance': [75, 85, 95],
+    'AssignmentCompletion': [70, 80, 90],
+}
+FILTER_COLUMNS = VALUE_COLUMNS + list(BANDS)
+
+# Set bits in every byte value
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def band_labels(edges):
+    """Labels of the bands between edges: [75, 85, 95] -> <75, 75-85, 85-95, ≥95"""
+    return ([f'<{edges[0]:g}'] + [f'{low:g}-{high:g}' for low, high in zip(edges, edges[1:])]
+            + [f'≥{edges[-1]:g}'])
+
+
+def filter_key(filters):
+    """Hashable, order-free form of a filter; columns with nothing selected are dropped"""
+    return tuple(sorted((column, tuple(sorted(map(str, values))))
+                        for column, values in (filters or {}).items() if len(values)))
+
+
+def _codes(series, column):
+    """Integer code of every row's filter value (-1 where it has none) and the value of each code"""
+    if column in BANDS:
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        codes = np.digitize(values, BANDS[column])
+        codes[np.isnan(values)] = -1
+        return codes, band_labels(BANDS[column])
+    if pd.api.types.is_bool_dtype(series.dtype):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        codes = np.where(np.isnan(values), -1, values).astype(np.int64)
+        return codes, ['No', 'Yes']
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), [str(category) for category in series.cat.categories]
+    codes, values = pd.factorize(series, use_na_sentinel=True)
+    return codes, [str(value) for value in values]
+
+
+def _options(column, present):
+    """Values of a column in the order the sidebar lists them"""
+    if column in BANDS:
+        return [label for label in band_labels(BANDS[column]) if label in present]
+    return sorted(present)
+
+
+class BitmapIndex:
+    """Packed bitset of the rows holding each filter value, combined with bitwise ops
+
+    Every selectable value of a filter column (a class, a gender, a grade,
+    an attendance band) has one bit per row, packed eight to a byte. A
+    filter ORs the bitmaps of the values picked within a column and ANDs
+    the columns together, so any combination costs a few passes over n/8
+    bytes however many rows it matches. Upserts flip just the changed
+    rows' bits.
+    """
+
+    def __init__(self, bitmaps, options, rows):
+        self.bitmaps = bitmaps
+        self.options = options
+        self.rows = rows
+
+    @classmethod
+    def from_frame(cls, df, columns=FILTER_COLUMNS):
+        bitmaps, options = {}, {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+            codes, values = _codes(df[column], column)
+            present = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(values)))
+            bitmaps[column] = {values[code]: np.packbits(codes == code, bitorder='little') for code in present}
+            options[column] = _options(column, set(bitmaps[column]))
+        return cls(bitmaps, options, len(df))
+
+    def mask(self, filters):
+        """Packed bitset of the rows matching ``filters`` ({column: values}), or None for no filter
+
+        Values a column never holds match nothing.
+        """
+        combined = None
+        for column, values in filters.items():
+            if not len(values):
+                continue
+            column_bitmaps = self.bitmaps.get(column)
+            if column_bitmaps is None:
+                raise KeyError(f"No filter on column {column}")
+            selected = np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+            for value in values:
+                bits = column_bitmaps.get(str(value))
+                if bits is not None:
+                    selected |= bits
+            combined = selected if combined is None else combined & selected
+        return combined
+
+    def count(self, bits):
+        """Number of rows set in a bitset"""
+        return self.rows if bits is None else int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+    def positions(self, bits):
+        """Row positions set in a bitset, ascending"""
+        if bits is None:
+            return np.arange(self.rows)
+        return np.flatnonzero(np.unpackbits(bits, count=self.rows, bitorder='little'))
+
+    def regraded(self, data):
+        """Index of a regraded snapshot: only the Grade bitmaps are built again"""
+        if 'Grade' not in self.bitmaps:
+            return self
+        grades = BitmapIndex.from_frame(data.columns(['Grade']), columns=['Grade'])
+        return BitmapIndex({**self.bitmaps, **grades.bitmaps}, {**self.options, **grades.options}, self.rows)
+
+    def updated(self, delta):
+        """Index after an upsert: replaced rows move between values, appended rows are added"""
+        rows = self.rows + len(delta.appended)
+        size = (rows + 7) // 8
+        bitmaps, options = {}, {}
+        for column, old in self.bitmaps.items():
+            changes = []
+            for frame, clear in ((delta.before, True), (delta.after, False)):
+                codes, values = _codes(frame[column], column)
+                positions = frame.index.to_numpy()
+                for code in np.unique(codes[codes >= 0]):
+                    changes.append((values[code], positions[codes == code], clear))
+
+            # Old snapshots keep their arrays: touched or grown bitmaps are copies
+            column_bitmaps = dict(old)
+            for value in {value for value, _, _ in changes} | {value for value, bits in old.items() if len(bits) < size}:
+                bits = np.zeros(size, dtype=np.uint8)
+                if value in old:
+                    bits[:len(old[value])] = old[value]
+                column_bitmaps[value] = bits
+            for value, where, clear in changes:
+                masks = (1 << (where & 7)).astype(np.uint8)
+                if clear:
+                    np.bitwise_and.at(column_bitmaps[value], where >> 3, ~masks)
+                else:
+                    np.bitwise_or.at(column_bitmaps[value], where >> 3, masks)
+
+            bitmaps[column] = column_bitmaps
+            options[column] = _options(column, set(column_bitmaps))
+        return BitmapIndex(bitmaps, options, rows)
@@ -0,0 +1,137 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# Above this many points a chart is drawn from aggregates (binned counts,
+# quartiles, density grids, sampled points) instead of shipping every row
+CHART_ROW_THRESHOLD = 20_000
+
+# Cells per axis of attendance x score density grids
+DENSITY_BINS = 50
+
+# Points kept when a scatter is downsampled
+SCATTER_SAMPLE = 500
+
+
+def rebin(hist, bins_per_point, nbins, low=0, high=100):
+    """Fold a fine score histogram into ``nbins`` equal-width bars
+
+    Returns a frame with the left edge, right edge, centre and count of each bar.
+    """
+    edges = np.linspace(low, high, nbins + 1)
+    values = np.arange(len(hist)) / bins_per_point
+    # The top edge is inclusive, so a score of 100 lands in the last bar
+    positions = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, nbins - 1)
+    counts = np.bincount(positions, weights=hist, minlength=nbins)
+    return pd.DataFrame({
+        'start': edges[:-1],
+        'end': edges[1:],
+        'center': (edges[:-1] + edges[1:]) / 2,
+        'count': counts.astype(np.int64),
+    })
+
+
+def fit_moments(x, y):
+    """n, sum x, sum y, sum xy, sum xx, sum yy over the pairs where both values are present
+
+    Moments add up, so chunks or classes can be fitted separately and combined.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    return np.array([len(x), x.sum(), y.sum(), (x * y).sum(), (x * x).sum(), (y * y).sum()])
+
+
+def t_critical(df, z=1.959963984540054):
+    """Two-sided Student t critical value for ``df`` degrees of freedom, 95% unless ``z`` says otherwise
+
+    Exact for one and two degrees of freedom; above that, the Cornish-Fisher
+    expansion around the normal quantile ``z``, within 0.01 of the exact value
+    at three degrees of freedom and far closer beyond.
+    """
+    if df < 1:
+        return np.nan
+    if df == 1:
+        return np.tan(np.pi * (_normal_cdf(z) - 0.5))
+    if df == 2:
+        p = _normal_cdf(z)
+        return (2 * p - 1) / np.sqrt(2 * p * (1 - p))
+    return (z + (z ** 3 + z) / (4 * df)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+            + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
+
+
+def _normal_cdf(z):
+    return 0.5 * (1 + math.erf(z / np.sqrt(2)))
+
+
+def ols_fit(moments):
+    """Correlation and least-squares line of y on x, in closed form from fit_moments()
+
+    Also gives 95% confidence intervals: for the slope from its standard
+    error and the t distribution, for r through Fisher's z transform.
+    """
+    n, sx, sy, sxy, sxx, syy = moments
+    sxx_c, syy_c, sxy_c = n * sxx - sx * sx, n * syy - sy * sy, n * sxy - sx * sy
+    fit = {'n': int(n), 'r': np.nan, 'slope': np.nan, 'intercept': np.nan,
+           'r_low': np.nan, 'r_high': np.nan, 'slope_low': np.nan, 'slope_high': np.nan}
+    if n < 2 or sxx_c <= 0:
+        return fit
+    slope = sxy_c / sxx_c
+    fit['slope'] = slope
+    fit['intercept'] = (sy - slope * sx) / n
+    if syy_c > 0:
+        r = float(np.clip(sxy_c / np.sqrt(sxx_c * syy_c), -1, 1))
+        fit['r'] = r
+        if n > 3 and abs(r) < 1:
+            half = 1.959963984540054 / np.sqrt(n - 3)
+            fit['r_low'], fit['r_high'] = np.tanh(np.arctanh(r) - half), np.tanh(np.arctanh(r) + half)
+    if n > 2:
+        # Residual variance over the variance of x, both from the centred sums
+        residual = max(syy_c - slope * sxy_c, 0) / (n - 2)
+        half = t_critical(n - 2) * np.sqrt(residual / sxx_c)
+        fit['slope_low'], fit['slope_high'] = slope - half, slope + half
+    return fit
+
+
+def density_grid(x, y, bins=DENSITY_BINS, low=0, high=100):
+    """Points per (x, y) cell of a square grid, with the shared bin edges"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    edges = np.linspace(low, high, bins + 1)
+    grid, _, _ = np.histogram2d(x[valid], y[valid], bins=[edges, edges])
+    return grid, edges
+
+
+def lttb(x, y, n_out):
+    """Positions of ``n_out`` points that keep the visual shape of a scatter (Largest-Triangle-Three-Buckets)
+
+    Points are taken in x order. The first and last are always kept; from
+    each bucket in between, the point spanning the largest triangle with the
+    previously kept point and the next bucket's centroid is kept, so peaks
+    and outliers survive the downsampling.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.argsort(x, kind='stable')
+    n = len(order)
+    if n_out >= n or n_out < 3:
+        return order
+    xs, ys = x[order], y[order]
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = bounds[i], bounds[i + 1]
+        next_end = bounds[i + 2] if i + 2 < len(bounds) else n
+        cx, cy = xs[end:next_end].mean(), ys[end:next_end].mean()
+        area = np.abs((xs[previous] - cx) * (ys[start:end] - ys[previous])
+                      - (xs[previous] - xs[start:end]) * (cy - ys[previous]))
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return order[kept]
@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from schema import TEXT_DTYPE, apply_schema, read_students_csv
+
+MANIFEST = 'manifest.json'
+STORE_SUFFIX = '.columns'
+
+# Text columns with at most this many distinct values are dictionary-encoded
+MAX_DICTIONARY_SIZE = 32767
+
+
+def default_store_path(csv_path):
+    """Column store that sits next to a CSV, e.g. students_data.columns/"""
+    return os.path.splitext(csv_path)[0] + STORE_SUFFIX
+
+
+def is_column_store(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def _encode(values):
+    """Split a text column into integer codes and its dictionary, when it pays off"""
+    codes, categories = pd.factorize(values, use_na_sentinel=True)
+    if len(categories) > MAX_DICTIONARY_SIZE or len(categories) * 2 > max(len(values), 2):
+        return None, None
+    dtype = np.int8 if len(categories) < 127 else np.int16
+    return codes.astype(dtype), [str(category) for category in categories]
+
+
+def _pack_text(values):
+    """UTF-8 bytes of a text column plus Arrow-style offsets into them"""
+    encoded = [('' if pd.isna(value) else str(value)).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, offsets.astype(np.int32) if offsets[-1] < 2**31 else offsets
+
+
+def _unpack_text(data, offsets):
+    """Rebuild a text column; with pyarrow the mapped buffers are used without a copy"""
+    if TEXT_DTYPE != 'object' and offsets.dtype == np.int32:
+        import pyarrow as pa
+
+        array = pa.StringArray.from_buffers(
+            len(offsets) - 1, pa.py_buffer(np.asarray(offsets)), pa.py_buffer(np.asarray(data))
+        )
+        return pd.arrays.ArrowStringArray(array)
+    raw = bytes(data)
+    values = np.empty(len(offsets) - 1, dtype=object)
+    for i in range(len(values)):
+        values[i] = raw[offsets[i]:offsets[i + 1]].decode('utf-8')
+    return values
+
+
+def write_store(df, store_path, source_version=None):
+    """Write a frame as one .npy file per column plus a JSON manifest
+
+    Column files carry a fresh generation tag and the manifest is swapped in
+    last, so readers holding the previous generation keep a consistent view.
+    """
+    os.makedirs(store_path, exist_ok=True)
+    generation = uuid.uuid4().hex[:12]
+    manifest = {'rows': len(df), 'source_version': source_version,
+                'generation': generation, 'memory': df.attrs.get('memory'), 'columns': {}}
+
+    for column in df.columns:
+        series = df[column]
+        entry = {}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            values = series.cat.codes.to_numpy()
+            entry['categories'] = [str(category) for category in series.cat.categories]
+        elif series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+            values, categories = _encode(series.to_numpy())
+            if values is not None:
+                entry['categories'] = categories
+            else:
+                values, offsets = _pack_text(series.to_numpy())
+                entry['offsets'] = f"{column}.{generation}.offsets.npy"
+                np.save(os.path.join(store_path, entry['offsets']), offsets, allow_pickle=False)
+        elif pd.api.types.is_extension_array_dtype(series.dtype):
+            # Nullable ints/bools are saved as float32 with NaN and restored on read
+            values = series.to_numpy(dtype=np.float32, na_value=np.nan)
+            entry['dtype'] = str(series.dtype)
+        else:
+            values = series.to_numpy()
+        entry['file'] = f"{column}.{generation}.npy"
+        np.save(os.path.join(store_path, entry['file']), values, allow_pickle=False)
+        manifest['columns'][column] = entry
+
+    manifest_tmp = os.path.join(store_path, f"{MANIFEST}.{generation}")
+    with open(manifest_tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_tmp, os.path.join(store_path, MANIFEST))
+
+    # Drop column files of older generations; open memory maps stay valid
+    for name in os.listdir(store_path):
+        if name.endswith('.npy') and f".{generation}." not in name:
+            os.remove(os.path.join(store_path, name))
+    return manifest
+
+
+def convert_csv(csv_path, store_path=None, source_version=None, reader=read_students_csv):
+    """Parse a CSV once and write it as a column store"""
+    store_path = store_path or default_store_path(csv_path)
+    write_store(reader(csv_path), store_path, source_version=source_version)
+    return store_path
+
+
+def ensure_store(csv_path, source_version, store_path=None, reader=read_students_csv):
+    """Return a column store for a CSV, converting it if missing or built from another version"""
+    store_path = store_path or default_store_path(csv_path)
+    if is_column_store(store_path):
+        with open(os.path.join(store_path, MANIFEST), encoding='utf-8') as f:
+            if json.load(f).get('source_version') == source_version:
+                return store_path
+    return convert_csv(csv_path, store_path, source_version=source_version, reader=reader)
+
+
+class ColumnStore:
+    """Read-only view of a column store; each column is memory-mapped on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.columns = list(self.manifest['columns'])
+        self.rows = self.manifest['rows']
+        self._raw = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.manifest['generation']
+
+    @property
+    def memory(self):
+        """Memory report recorded when the store was converted, if any"""
+        return self.manifest.get('memory')
+
+    def raw(self, column, part='file'):
+        """Memory-mapped values (dictionary codes, or text bytes/offsets) of a column"""
+        values = self._raw.get((column, part))
+        if values is None:
+            entry = self.manifest['columns'][column]
+            values = np.load(os.path.join(self.path, entry[part]), mmap_mode='r')
+            self._raw[column, part] = values
+        return values
+
+    def map_all(self):
+        """Map every column file now; the store then stays readable after its files are removed"""
+        for column, entry in self.manifest['columns'].items():
+            for part in ('file', 'offsets'):
+                if part in entry:
+                    self.raw(column, part)
+
+    def column(self, column):
+        """Decoded column: categorical for dictionary columns, zero-copy for numbers"""
+        try:
+            return self._cache[column]
+        except KeyError:
+            pass
+        with self._lock:
+            if column not in self._cache:
+                entry = self.manifest['columns'][column]
+                values = self.raw(column)
+                if 'categories' in entry:
+                    values = pd.Categorical.from_codes(values, categories=entry['categories'])
+                elif 'offsets' in entry:
+                    values = _unpack_text(values, self.raw(column, 'offsets'))
+                elif 'dtype' in entry:
+                    values = pd.array(values).astype(entry['dtype'])
+                self._cache[column] = values
+            return self._cache[column]
+
+    def frame(self, columns=None):
+        """DataFrame of just the requested columns"""
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({column: self.column(column) for column in columns}, copy=False)
+
+    def row(self, position, columns=None):
+        """One student as a Series, read without building a frame"""
+        columns = self.columns if columns is None else list(columns)
+        values = {}
+        for column in columns:
+            entry = self.manifest['columns'][column]
+            value = self.raw(column)[position]
+            if 'offsets' in entry:
+                start, end = self.raw(column, 'offsets')[position:position + 2]
+                value = bytes(self.raw(column)[start:end]).decode('utf-8')
+            elif 'categories' in entry:
+                value = entry['categories'][value] if value >= 0 else np.nan
+            values[column] = value.item() if isinstance(value, np.generic) else value
+        return pd.Series(values, name=position)
+
+
+class ArrowFileStore:
+    """Column source over a Parquet or Feather file, reading only requested columns"""
+
+    memory = None
+
+    def __init__(self, path):
+        self.path = path
+        self.reader = pd.read_feather if path.endswith('.feather') else pd.read_parquet
+        self._columns = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self):
+        """Column names from the file's schema, without reading any data"""
+        if self._columns is None:
+            import pyarrow.feather as feather
+            import pyarrow.parquet as parquet
+
+            if self.path.endswith('.feather'):
+                schema = feather.read_table(self.path, columns=[], memory_map=True).schema
+            else:
+                schema = parquet.read_schema(self.path)
+            self._columns = [name for name in schema.names if not name.startswith('__index_level_')]
+        return self._columns
+
+    def column(self, column):
+        try:
+            return self._cache[column]
+        except KeyError:
+            pass
+        with self._lock:
+            if column not in self._cache:
+                self._cache[column] = apply_schema(self.reader(self.path, columns=[column]))[column].array
+            return self._cache[column]
+
+    def frame(self, columns=None):
+        columns = self.columns if columns is None else list(columns)
+        return pd.DataFrame({column: self.column(column) for column in columns}, copy=False)
+
+    def row(self, position, columns=None):
+        """One student as a Series, from the cached columns rather than a frame of the file"""
+        columns = self.columns if columns is None else list(columns)
+        return pd.Series({column: self.column(column)[position] for column in columns}, name=position)
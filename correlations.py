@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+from chart_data import ols_fit
+from schema import SUBJECTS
+
+# Variables whose pairwise relationships are kept; OverallPercentage is the usual response
+VARIABLES = ['Attendance', 'AssignmentCompletion'] + SUBJECTS + ['OverallPercentage']
+
+# Rows grouped into cells at a time; a block of every variable stays within the CPU caches
+BLOCK_ROWS = 65_536
+
+# Layout of the co-moments kept for each cell: [count, sum x, sum x², sum xy], each variables x variables
+_COUNT, _SUM, _SUMSQ, _CROSS = range(4)
+
+
+def co_moments(values):
+    """Co-moments of every column pair of an (n, k) matrix, over the rows where both are present
+
+    Entry [i, j] of each k x k layer covers the rows where columns i and j
+    are both present: their count, the sums of column i and of its squares,
+    and the sum of the products of i and j. Every layer is a matrix product
+    of the values (missing as 0) and the presence mask; with nothing
+    missing, the sums reduce to column sums and one Gram matrix.
+    """
+    n, k = values.shape
+    present = ~np.isnan(values)
+    if present.all():
+        sums = values.sum(axis=0)
+        squares = np.einsum('ij,ij->j', values, values)
+        return np.stack([
+            np.full((k, k), float(n)),
+            np.repeat(sums[:, None], k, axis=1),
+            np.repeat(squares[:, None], k, axis=1),
+            values.T @ values,
+        ])
+    mask = present.astype(np.float64)
+    filled = np.where(present, values, 0.0)
+    return np.stack([mask.T @ mask, filled.T @ mask, (filled * filled).T @ mask, filled.T @ filled])
+
+
+def _float_values(series):
+    """A column's values as floats, without a copy when it already holds NumPy floats"""
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind == 'f':
+        return series.to_numpy()
+    return series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+class CorrelationCube:
+    """Pairwise co-moments of every variable for every (Class, Gender) cell
+
+    Each cell holds, for every ordered pair of variables, the count, sums,
+    sums of squares and cross-products over the students who have both.
+    These add up across cells, so the correlation matrix and the
+    least-squares fit of any pair over any set of classes and genders is a
+    sum of a few small arrays followed by closed-form arithmetic, and
+    upserts fold the replaced rows out and their new values in.
+    """
+
+    def __init__(self, variables=VARIABLES):
+        self.variables = list(variables)
+        self._positions = {variable: i for i, variable in enumerate(self.variables)}
+        # (class, gender) -> 4 x k x k co-moments
+        self.cells = {}
+
+    @classmethod
+    def from_frame(cls, df, variables=VARIABLES):
+        cube = cls(variables)
+        cube.add_frame(df)
+        return cube
+
+    @property
+    def classes(self):
+        return sorted({class_name for class_name, _ in self.cells})
+
+    @property
+    def genders(self):
+        return sorted({gender for _, gender in self.cells})
+
+    def add_frame(self, df, sign=1):
+        """Fold the rows of a frame into the cells (``sign=-1`` removes them)
+
+        Rows are taken a block at a time and sorted by cell, so each cell's
+        rows are gathered from memory the caches already hold; its
+        co-moments are then a few matrix products over a contiguous slice.
+        """
+        if len(df) == 0:
+            return
+        class_codes, class_labels = pd.factorize(df['Class'])
+        gender_codes, gender_labels = pd.factorize(df['Gender'])
+        n_cells = len(class_labels) * len(gender_labels)
+        # Small integer codes let the stable sort below run as a radix sort
+        cells = np.where((class_codes >= 0) & (gender_codes >= 0),
+                         class_codes * len(gender_labels) + gender_codes, n_cells)
+        cells = cells.astype(np.int16 if n_cells < 2**15 else np.int64)
+        columns = [_float_values(df[variable]) for variable in self.variables]
+
+        totals = np.zeros((n_cells, 4, len(columns), len(columns)))
+        for start in range(0, len(cells), BLOCK_ROWS):
+            block = cells[start:start + BLOCK_ROWS]
+            order = np.argsort(block, kind='stable')
+            values = np.empty((len(block), len(columns)), order='F')
+            for i, column in enumerate(columns):
+                values[:, i] = column[start:start + BLOCK_ROWS][order]
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(block, minlength=n_cells + 1))])
+            for cell in range(n_cells):
+                if bounds[cell + 1] > bounds[cell]:
+                    totals[cell] += co_moments(values[bounds[cell]:bounds[cell + 1]])
+
+        # Rows without a class or gender have no cell to land in
+        for cell in np.flatnonzero(totals[:, _COUNT].any(axis=(1, 2))):
+            key = (class_labels[cell // len(gender_labels)], gender_labels[cell % len(gender_labels)])
+            moments = sign * totals[cell]
+            self.cells[key] = self.cells[key] + moments if key in self.cells else moments
+
+    def updated(self, delta):
+        """Cube after an upsert: the replaced rows folded out and their new values folded in"""
+        cube = CorrelationCube(self.variables)
+        cube.cells = dict(self.cells)
+        cube.add_frame(delta.before, sign=-1)
+        cube.add_frame(delta.after)
+        return cube
+
+    def _total(self, classes=None, genders=None):
+        """Co-moments summed over the selected cells"""
+        total = np.zeros((4, len(self.variables), len(self.variables)))
+        for (class_name, gender), moments in self.cells.items():
+            if (classes is None or class_name in classes) and (genders is None or gender in genders):
+                total += moments
+        return total
+
+    def moments(self, x, y, classes=None, genders=None):
+        """n, sum x, sum y, sum xy, sum xx, sum yy of a pair, as chart_data.fit_moments() gives them"""
+        total = self._total(classes, genders)
+        i, j = self._positions[x], self._positions[y]
+        return np.array([total[_COUNT, i, j], total[_SUM, i, j], total[_SUM, j, i],
+                         total[_CROSS, i, j], total[_SUMSQ, i, j], total[_SUMSQ, j, i]])
+
+    def fit(self, x, y, classes=None, genders=None):
+        """Correlation, least-squares line of y on x and their confidence intervals"""
+        return ols_fit(self.moments(x, y, classes, genders))
+
+    def matrix(self, classes=None, genders=None):
+        """Pearson correlation of every variable pair, each over the students who have both"""
+        count, sums, squares, cross = self._total(classes, genders)
+        covariance = count * cross - sums * sums.T
+        spread = count * squares - sums * sums
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = covariance / np.sqrt(spread * spread.T)
+        r[count < 2] = np.nan
+        return pd.DataFrame(np.clip(r, -1, 1), index=self.variables, columns=self.variables)
+
+    def group_fits(self, x, y, by='Class', labels=None):
+        """Per-class or per-gender table of the fit of y on x"""
+        key = 'classes' if by.lower() == 'class' else 'genders'
+        if labels is None:
+            labels = self.classes if key == 'classes' else self.genders
+        table = pd.DataFrame.from_dict({label: self.fit(x, y, **{key: [label]}) for label in labels},
+                                       orient='index')
+        table.index.name = by
+        return table
+
+    def group_correlations(self, y='OverallPercentage', by='Class', labels=None):
+        """Labels x variables table of each variable's correlation with ``y`` within each class or gender"""
+        key = 'classes' if by.lower() == 'class' else 'genders'
+        if labels is None:
+            labels = self.classes if key == 'classes' else self.genders
+        table = pd.DataFrame({label: self.matrix(**{key: [label]})[y] for label in labels}).T
+        table = table.drop(columns=[y])
+        table.index.name = by
+        return table
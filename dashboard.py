@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import json
+import os
+
+from analytics import CLASS_LEADERBOARD_SIZE, SUBJECT_LEADERBOARD_SIZE, StudentAnalytics, use_streaming
+from chart_data import CHART_ROW_THRESHOLD
+from figure_cache import figures
+from grading import DEFAULT_POLICY, GradingPolicy
+from instrumentation import exporters_from_env, span, tracing
 
 # Page configuration
 st.set_page_config(
@@ -43,97 +46,126 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-class StudentDashboard:
-    """Student Performance Dashboard using Streamlit"""
-    
-    def __init__(self, csv_file='students_data.csv'):
-        self.csv_file = csv_file
-        self.subjects = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'History']
-        self.load_data()
-    
-    def load_data(self):
-        """Load student data from CSV"""
-        self.df = pd.read_csv(self.csv_file)
-        self.classes = sorted(self.df['Class'].unique())
-    
-    def get_student_stats(self, student_id):
-        """Get comprehensive statistics for a student"""
-        student = self.df[self.df['StudentID'] == student_id].iloc[0]
-        class_students = self.df[self.df['Class'] == student['Class']]
-        
-        scores = [student[subject] for subject in self.subjects]
-        
-        # Calculate rank in class
-        class_students_sorted = class_students.sort_values('OverallPercentage', ascending=False)
-        rank = class_students_sorted[class_students_sorted['StudentID'] == student_id].index[0] - class_students_sorted.index[0] + 1
-        
+PAGES = ["Overview", "Student Analysis", "Class Analysis", "Subject Analysis", "Comparative Analysis",
+         "At-Risk Students"]
+# Pages that can be served from streamed aggregates alone
+STREAMING_PAGES = ["Overview", "Class Analysis", "Subject Analysis"]
+
+FILTER_LABELS = {
+    'ExamParticipation': 'Exam Participation',
+    'Attendance': 'Attendance (%)',
+    'AssignmentCompletion': 'Assignment Completion (%)',
+}
+
+
+def display_table(df):
+    """Widen float32 score columns for display, so 94.71 does not render as 94.709999"""
+    narrow = df.select_dtypes('float32').columns
+    return df.astype({column: 'float64' for column in narrow}).round({column: 2 for column in narrow})
+
+
+def page_selector(pages, key):
+    """Zero-based page picked for a leaderboard; no picker when it fits on one page"""
+    if pages <= 1:
+        return 0
+    return st.number_input("Page", min_value=1, max_value=pages, value=1, key=key) - 1
+
+
+def filter_sidebar(dashboard):
+    """Sidebar multiselects for every filter column; returns the picked values per column"""
+    with st.sidebar.expander("Filters", expanded=False):
         return {
-            'student': student,
-            'scores': scores,
-            'class_average': class_students['OverallPercentage'].mean(),
-            'rank': rank,
-            'total_in_class': len(class_students)
+            column: st.multiselect(FILTER_LABELS.get(column, column), options, key=f'filter_{column}')
+            for column, options in dashboard.filter_options().items()
         }
-    
-    def get_class_stats(self, class_name):
-        """Get comprehensive statistics for a class"""
-        class_df = self.df[self.df['Class'] == class_name]
-        
-        stats = {
-            'total_students': len(class_df),
-            'mean_score': class_df['OverallPercentage'].mean(),
-            'median_score': class_df['OverallPercentage'].median(),
-            'std_dev': class_df['OverallPercentage'].std(),
-            'min_score': class_df['OverallPercentage'].min(),
-            'max_score': class_df['OverallPercentage'].max(),
-            'avg_attendance': class_df['Attendance'].mean(),
-            'pass_rate': (class_df['OverallPercentage'] >= 50).sum() / len(class_df) * 100
+
+
+def configured_policy():
+    """Grading policy from the JSON file named by DASHBOARD_GRADING, or the default one"""
+    path = os.environ.get('DASHBOARD_GRADING')
+    return GradingPolicy.from_file(path) if path else DEFAULT_POLICY
+
+
+def grading_sidebar(configured):
+    """Sidebar inputs for subject weights and grade boundaries; returns the policy, None for the stored grades"""
+    with st.sidebar.expander("Grading Policy", expanded=False):
+        weights = {
+            subject: st.number_input(f"{subject} weight", min_value=0.0, value=weight, step=0.5,
+                                     key=f'weight_{subject}')
+            for subject, weight in configured.weights.items()
         }
-        
-        return stats, class_df
+        boundaries = st.text_input(
+            f"Boundaries for {', '.join(configured.grades[1:])}",
+            ', '.join(f'{boundary:g}' for boundary in configured.boundaries), key='grade_boundaries'
+        )
+        try:
+            policy = GradingPolicy(weights, [float(value) for value in boundaries.split(',')], configured.grades)
+        except ValueError as error:
+            st.error(f"Keeping the configured policy: {error}")
+            policy = configured
+    # The default policy is the one the stored grades were computed with
+    return None if policy.is_default else policy
 
 
-def main():
-    """Main dashboard function"""
+def timing_overlay(trace):
+    """Sidebar table of where the time of the rerun just finished went"""
+    with st.sidebar.expander("⏱️ Timings", expanded=True):
+        st.caption(f"This rerun took {trace.seconds * 1000:.0f} ms")
+        timings = pd.DataFrame(trace.rows(), columns=['Section', 'ms', 'Share'])
+        timings['ms'] = timings['ms'].round(1)
+        timings['Share'] = (timings['Share'] * 100).round(1).astype(str) + '%'
+        st.dataframe(timings, hide_index=True, use_container_width=True)
+
+
+def show_figure(spec):
+    """Show a cached figure spec through the public st.plotly_chart
+
+    Each render decodes its own copy, so sessions never share a figure dict.
+    """
+    st.plotly_chart(json.loads(spec), use_container_width=True, theme='streamlit')
+
+
+class StudentDashboard(StudentAnalytics):
+    """Student Performance Dashboard using Streamlit
     
-    # Initialize dashboard
-    dashboard = StudentDashboard()
+    All numbers come from the StudentAnalytics page methods; each page here
+    only lays them out as widgets and charts. Pages import page_figures,
+    and Plotly with it, themselves: the sidebar and the first widgets are
+    sent before Plotly is loaded.
+    """
     
-    # Title and header
-    st.title("📚 Student Performance Analytics Dashboard")
-    st.markdown("---")
-    
-    # Sidebar navigation
-    st.sidebar.title("Navigation")
-    page = st.sidebar.radio(
-        "Select View",
-        ["Overview", "Student Analysis", "Class Analysis", "Subject Analysis", "Comparative Analysis"]
-    )
+    def chart(self, build, page, name, *selection):
+        """Show a figure from the shared cache, keyed by page, chart, selection and data version"""
+        key = (self.data_version, self.streaming, self.chart_rows, page, name, *selection)
+        with span(f'chart:{page}/{name}'):
+            spec = figures.spec(key, build)
+            with span('figure:render'):
+                show_figure(spec)
     
     # ==================== OVERVIEW PAGE ====================
-    if page == "Overview":
+    def overview_page(self):
+        import page_figures
+
         st.header("📊 Overview Dashboard")
+        data = self.overview()
         
         # Key metrics
         col1, col2, col3, col4, col5 = st.columns(5)
         
         with col1:
-            st.metric("Total Students", len(dashboard.df))
+            st.metric("Total Students", data['total_students'])
         
         with col2:
-            st.metric("Total Classes", len(dashboard.classes))
+            st.metric("Total Classes", data['total_classes'])
         
         with col3:
-            avg_performance = dashboard.df['OverallPercentage'].mean()
-            st.metric("Avg Performance", f"{avg_performance:.2f}%")
+            st.metric("Avg Performance", f"{data['avg_performance']:.2f}%")
         
         with col4:
-            avg_attendance = dashboard.df['Attendance'].mean()
-            st.metric("Avg Attendance", f"{avg_attendance:.2f}%")
+            st.metric("Avg Attendance", f"{data['avg_attendance']:.2f}%")
         
         with col5:
-            pass_rate = (dashboard.df['OverallPercentage'] >= 50).sum() / len(dashboard.df) * 100
-            st.metric("Pass Rate", f"{pass_rate:.1f}%")
+            st.metric("Pass Rate", f"{data['pass_rate']:.1f}%")
         
         st.markdown("---")
         
@@ -142,72 +174,31 @@ def main():
         
         with col1:
             st.subheader("Grade Distribution")
-            grade_counts = dashboard.df['Grade'].value_counts().sort_index()
-            fig = px.bar(
-                x=grade_counts.index,
-                y=grade_counts.values,
-                labels={'x': 'Grade', 'y': 'Number of Students'},
-                color=grade_counts.values,
-                color_continuous_scale='Blues'
-            )
-            fig.update_layout(showlegend=False, height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            self.chart(lambda: page_figures.overview_grades_figure(data), 'Overview', 'grades')
         
         with col2:
             st.subheader("Performance Distribution")
-            fig = px.histogram(
-                dashboard.df,
-                x='OverallPercentage',
-                nbins=20,
-                labels={'OverallPercentage': 'Overall Percentage'},
-                color_discrete_sequence=['#1f77b4']
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            self.chart(lambda: page_figures.overview_performance_figure(self, data), 'Overview', 'performance')
         
         # Charts row 2
         col1, col2 = st.columns(2)
         
         with col1:
             st.subheader("Class-wise Performance")
-            class_performance = dashboard.df.groupby('Class')['OverallPercentage'].mean().sort_values(ascending=False)
-            fig = px.bar(
-                x=class_performance.index,
-                y=class_performance.values,
-                labels={'x': 'Class', 'y': 'Average Performance (%)'},
-                color=class_performance.values,
-                color_continuous_scale='Viridis'
-            )
-            fig.update_layout(showlegend=False, height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            self.chart(lambda: page_figures.overview_classes_figure(data), 'Overview', 'classes')
         
         with col2:
             st.subheader("Gender Distribution")
-            gender_counts = dashboard.df['Gender'].value_counts()
-            fig = px.pie(
-                values=gender_counts.values,
-                names=gender_counts.index,
-                hole=0.4,
-                color_discrete_sequence=['#1f77b4', '#ff7f0e']
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            self.chart(lambda: page_figures.overview_genders_figure(data), 'Overview', 'genders')
         
         # Subject-wise performance
         st.subheader("Subject-wise Average Performance")
-        subject_avg = dashboard.df[dashboard.subjects].mean().sort_values(ascending=False)
-        fig = px.bar(
-            x=subject_avg.index,
-            y=subject_avg.values,
-            labels={'x': 'Subject', 'y': 'Average Score'},
-            color=subject_avg.values,
-            color_continuous_scale='RdYlGn'
-        )
-        fig.update_layout(showlegend=False, height=400)
-        st.plotly_chart(fig, use_container_width=True)
+        self.chart(lambda: page_figures.overview_subjects_figure(data), 'Overview', 'subjects')
     
     # ==================== STUDENT ANALYSIS PAGE ====================
-    elif page == "Student Analysis":
+    def student_page(self):
+        import page_figures
+
         st.header("👤 Individual Student Analysis")
         
         # Student selection
@@ -216,444 +207,472 @@ def main():
         with col1:
             selected_student_id = st.selectbox(
                 "Select Student ID",
-                options=dashboard.df['StudentID'].tolist()
+                options=self.index.student_ids
             )
         
-        if selected_student_id:
-            stats = dashboard.get_student_stats(selected_student_id)
-            student = stats['student']
-            
-            # Student info card
-            st.markdown("### Student Information")
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.info(f"**Name:** {student['Name']}")
-            with col2:
-                st.info(f"**Class:** {student['Class']}")
-            with col3:
-                st.info(f"**Age:** {student['Age']}")
-            with col4:
-                st.info(f"**Gender:** {student['Gender']}")
-            
-            st.markdown("---")
-            
-            # Performance metrics
-            st.markdown("### Academic Performance")
-            col1, col2, col3, col4, col5 = st.columns(5)
-            
-            with col1:
-                st.metric("Overall %", f"{student['OverallPercentage']:.2f}%")
-            with col2:
-                st.metric("Grade", student['Grade'])
-            with col3:
-                st.metric("Class Rank", f"{stats['rank']}/{stats['total_in_class']}")
-            with col4:
-                diff = student['OverallPercentage'] - stats['class_average']
-                st.metric("vs Class Avg", f"{diff:+.2f}%", delta=f"{diff:.2f}%")
-            with col5:
-                st.metric("Attendance", f"{student['Attendance']:.1f}%")
-            
-            st.markdown("---")
-            
-            # Charts
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("Subject-wise Performance")
-                subject_scores = pd.DataFrame({
-                    'Subject': dashboard.subjects,
-                    'Score': [student[subject] for subject in dashboard.subjects]
-                }).sort_values('Score', ascending=False)
-                
-                fig = px.bar(
-                    subject_scores,
-                    x='Subject',
-                    y='Score',
-                    color='Score',
-                    color_continuous_scale='RdYlGn',
-                    labels={'Score': 'Score (%)'}
-                )
-                fig.add_hline(y=student['OverallPercentage'], line_dash="dash", 
-                             line_color="red", annotation_text="Overall Average")
-                fig.update_layout(height=400, showlegend=False)
-                st.plotly_chart(fig, use_container_width=True)
-            
-            with col2:
-                st.subheader("Performance Radar Chart")
-                fig = go.Figure()
-                
-                fig.add_trace(go.Scatterpolar(
-                    r=[student[subject] for subject in dashboard.subjects],
-                    theta=dashboard.subjects,
-                    fill='toself',
-                    name='Student',
-                    line_color='#1f77b4'
-                ))
-                
-                # Add class average
-                class_df = dashboard.df[dashboard.df['Class'] == student['Class']]
-                class_avg_scores = [class_df[subject].mean() for subject in dashboard.subjects]
-                
-                fig.add_trace(go.Scatterpolar(
-                    r=class_avg_scores,
-                    theta=dashboard.subjects,
-                    fill='toself',
-                    name='Class Average',
-                    line_color='orange',
-                    opacity=0.5
-                ))
-                
-                fig.update_layout(
-                    polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
-                    showlegend=True,
-                    height=400
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Additional stats
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("Statistical Summary")
-                stats_df = pd.DataFrame({
-                    'Metric': ['Mean', 'Median', 'Std Dev', 'Min Score', 'Max Score', 'Range'],
-                    'Value': [
-                        f"{np.mean(stats['scores']):.2f}",
-                        f"{np.median(stats['scores']):.2f}",
-                        f"{np.std(stats['scores']):.2f}",
-                        f"{min(stats['scores']):.2f}",
-                        f"{max(stats['scores']):.2f}",
-                        f"{max(stats['scores']) - min(stats['scores']):.2f}"
-                    ]
-                })
-                st.dataframe(stats_df, hide_index=True, use_container_width=True)
-            
-            with col2:
-                st.subheader("Strengths & Weaknesses")
-                subject_scores_sorted = sorted(
-                    [(subject, student[subject]) for subject in dashboard.subjects],
-                    key=lambda x: x[1],
-                    reverse=True
-                )
+        if not selected_student_id:
+            return
+        
+        profile = self.student_profile(selected_student_id)
+        student = profile['student']
+        
+        # Student info card
+        st.markdown("### Student Information")
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.info(f"**Name:** {student['Name']}")
+        with col2:
+            st.info(f"**Class:** {student['Class']}")
+        with col3:
+            st.info(f"**Age:** {student['Age']}")
+        with col4:
+            st.info(f"**Gender:** {student['Gender']}")
+        
+        st.markdown("---")
+        
+        # Performance metrics
+        st.markdown("### Academic Performance")
+        col1, col2, col3, col4, col5 = st.columns(5)
+        
+        with col1:
+            st.metric("Overall %", f"{student['OverallPercentage']:.2f}%")
+        with col2:
+            st.metric("Grade", student['Grade'])
+        with col3:
+            st.metric("Class Rank", f"{profile['rank']}/{profile['total_in_class']}")
+        with col4:
+            diff = student['OverallPercentage'] - profile['class_average']
+            st.metric("vs Class Avg", f"{diff:+.2f}%", delta=f"{diff:.2f}%")
+        with col5:
+            st.metric("Attendance", f"{student['Attendance']:.1f}%")
+        
+        st.caption(
+            f"Percentile rank: {profile['class_percentile']:.1f} in class, "
+            f"{profile['school_percentile']:.1f} school-wide"
+        )
+        
+        st.markdown("---")
+        
+        # Charts
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("Subject-wise Performance")
+            self.chart(lambda: page_figures.student_scores_figure(profile),
+                       'Student Analysis', 'subject_scores', selected_student_id)
+        
+        with col2:
+            st.subheader("Performance Radar Chart")
+            self.chart(lambda: page_figures.student_radar_figure(profile, self.subjects),
+                       'Student Analysis', 'radar', selected_student_id)
+        
+        # Additional stats
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("Statistical Summary")
+            summary = profile['summary']
+            stats_df = pd.DataFrame({
+                'Metric': summary.index,
+                'Value': [f"{value:.2f}" for value in summary]
+            })
+            st.dataframe(stats_df, hide_index=True, use_container_width=True)
+        
+        with col2:
+            st.subheader("Strengths & Weaknesses")
+            ranked = list(profile['ranked_subjects'].items())
+            
+            st.success(f"**Top Subject:** {ranked[0][0]} ({ranked[0][1]:.2f}%)")
+            st.success(f"**2nd Best:** {ranked[1][0]} ({ranked[1][1]:.2f}%)")
+            st.error(f"**Needs Focus:** {ranked[-1][0]} ({ranked[-1][1]:.2f}%)")
+            st.error(f"**2nd Weakest:** {ranked[-2][0]} ({ranked[-2][1]:.2f}%)")
+            
+            risk = profile['risk']
+            factor = risk['points'].idxmax()
+            note = f"**Risk Score:** {risk['score']:.1f} / 100"
+            if risk['score'] > 0:
+                note += f" (mostly {factor.lower()}, {risk['points'][factor]:.1f} points)"
+            (st.warning if risk['at_risk'] else st.info)(note)
+        
+        # Nearest students across the school by subject scores
+        st.markdown("---")
+        st.subheader("👥 Students With Similar Profiles")
+        peers = self.similar_students([selected_student_id])[selected_student_id]
+        st.caption("Closest subject scores school-wide; Score Gap is the typical per-subject difference in points.")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            columns = ['StudentID', 'Name', 'Class', 'Score Gap', 'OverallPercentage', 'Grade']
+            st.dataframe(display_table(peers[columns]), use_container_width=True)
+        
+        with col2:
+            self.chart(lambda: page_figures.student_peers_figure(profile, peers, self.subjects),
+                       'Student Analysis', 'peers', selected_student_id)
+        
+        # Progress across terms
+        if self.has_terms():
+            terms = self.student_terms(selected_student_id)
+            trajectory = terms['trajectory']
+            if len(trajectory):
+                st.markdown("---")
+                st.subheader("📈 Progress Across Terms")
+                self.chart(lambda: page_figures.student_terms_figure(trajectory, self.subjects),
+                           'Student Analysis', 'terms', selected_student_id, self.terms.version)
                 
-                st.success(f"**Top Subject:** {subject_scores_sorted[0][0]} ({subject_scores_sorted[0][1]:.2f}%)")
-                st.success(f"**2nd Best:** {subject_scores_sorted[1][0]} ({subject_scores_sorted[1][1]:.2f}%)")
-                st.error(f"**Needs Focus:** {subject_scores_sorted[-1][0]} ({subject_scores_sorted[-1][1]:.2f}%)")
-                st.error(f"**2nd Weakest:** {subject_scores_sorted[-2][0]} ({subject_scores_sorted[-2][1]:.2f}%)")
+                changes = terms['changes']
+                if changes is not None:
+                    subject_changes = changes[self.subjects].sort_values(ascending=False)
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric(f"Overall ({trajectory.index[-1]})", f"{trajectory['OverallPercentage'].iloc[-1]:.2f}%",
+                                  delta=f"{changes['OverallPercentage']:+.2f}%")
+                    with col2:
+                        st.metric("Most Improved Subject", subject_changes.index[0],
+                                  delta=f"{subject_changes.iloc[0]:+.2f}%")
+                    with col3:
+                        st.metric("Attendance", f"{trajectory['Attendance'].iloc[-1]:.1f}%",
+                                  delta=f"{changes['Attendance']:+.1f}%")
     
     # ==================== CLASS ANALYSIS PAGE ====================
-    elif page == "Class Analysis":
+    def class_page(self):
+        import page_figures
+        from risk import AT_RISK_SCORE
+
         st.header("🎓 Class-wise Analysis")
         
         # Class selection
-        selected_class = st.selectbox("Select Class", options=dashboard.classes)
+        selected_class = st.selectbox("Select Class", options=self.classes)
         
-        if selected_class:
-            stats, class_df = dashboard.get_class_stats(selected_class)
-            
-            # Class metrics
-            st.markdown("### Class Overview")
-            col1, col2, col3, col4, col5, col6 = st.columns(6)
-            
-            with col1:
-                st.metric("Total Students", stats['total_students'])
-            with col2:
-                st.metric("Mean Score", f"{stats['mean_score']:.2f}%")
-            with col3:
-                st.metric("Median Score", f"{stats['median_score']:.2f}%")
-            with col4:
-                st.metric("Std Dev", f"{stats['std_dev']:.2f}")
-            with col5:
-                st.metric("Attendance", f"{stats['avg_attendance']:.1f}%")
-            with col6:
-                st.metric("Pass Rate", f"{stats['pass_rate']:.1f}%")
-            
+        if not selected_class:
+            return
+        
+        report = self.class_report(selected_class)
+        stats = report['stats']
+        
+        # Class metrics
+        st.markdown("### Class Overview")
+        col1, col2, col3, col4, col5, col6 = st.columns(6)
+        
+        with col1:
+            st.metric("Total Students", stats['total_students'])
+        with col2:
+            st.metric("Mean Score", f"{stats['mean_score']:.2f}%")
+        with col3:
+            st.metric("Median Score", f"{stats['median_score']:.2f}%")
+        with col4:
+            st.metric("Std Dev", f"{stats['std_dev']:.2f}")
+        with col5:
+            st.metric("Attendance", f"{stats['avg_attendance']:.1f}%")
+        with col6:
+            st.metric("Pass Rate", f"{stats['pass_rate']:.1f}%")
+        
+        st.markdown("---")
+        
+        # Charts row 1
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("Score Distribution")
+            self.chart(lambda: page_figures.class_distribution_figure(self, report, selected_class),
+                       'Class Analysis', 'distribution', selected_class)
+        
+        with col2:
+            st.subheader("Grade Distribution")
+            self.chart(lambda: page_figures.class_grades_figure(report), 'Class Analysis', 'grades', selected_class)
+        
+        # Subject performance
+        st.subheader("Subject-wise Class Performance")
+        self.chart(lambda: page_figures.class_subjects_figure(report), 'Class Analysis', 'subjects', selected_class)
+        
+        # Top and bottom performers
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("🏆 Top 10 Performers")
+            pages = self.leaderboard_pages('OverallPercentage', CLASS_LEADERBOARD_SIZE, selected_class)
+            page = page_selector(pages, f'top_page_{selected_class}')
+            top = report['top'] if page == 0 else self.class_leaderboard(selected_class, page)
+            st.dataframe(display_table(top), use_container_width=True)
+        
+        with col2:
+            st.subheader("⚠️ Students Needing Support")
+            if report['watchlist'] is None:
+                # Streamed data has no risk scores; fall back to the lowest overall percentages
+                page = page_selector(pages, f'bottom_page_{selected_class}')
+                bottom = report['bottom'] if page == 0 else self.class_leaderboard(selected_class, page, bottom=True)
+                st.dataframe(display_table(bottom), use_container_width=True)
+            else:
+                page = page_selector(self.watchlist_pages(selected_class), f'watchlist_page_{selected_class}')
+                watchlist = report['watchlist'] if page == 0 else self.watchlist(selected_class, page)
+                if len(watchlist):
+                    st.dataframe(display_table(watchlist), use_container_width=True)
+                else:
+                    st.success(f"No student in {selected_class} has a risk score of {AT_RISK_SCORE} or more.")
+        
+        # Correlation analysis
+        st.subheader("Attendance vs Performance Analysis")
+        self.chart(lambda: page_figures.class_attendance_figure(report), 'Class Analysis', 'attendance', selected_class)
+        
+        fit = report['fit']
+        st.info(
+            f"**Correlation between Attendance and Performance:** {report['correlation']:.3f} "
+            f"(95% CI {fit['r_low']:.3f} to {fit['r_high']:.3f})  \n"
+            f"Each extra attendance point goes with {fit['slope']:+.2f} points of overall percentage "
+            f"(95% CI {fit['slope_low']:+.2f} to {fit['slope_high']:+.2f}, {fit['n']:,} students)"
+        )
+        
+        # Trend across terms
+        if self.has_terms():
             st.markdown("---")
+            st.subheader("📈 Class Trend Across Terms")
+            terms = self.class_terms(selected_class)
+            self.chart(lambda: page_figures.class_terms_figure(terms, selected_class, self.subjects),
+                       'Class Analysis', 'terms', selected_class, self.terms.version)
             
-            # Charts row 1
             col1, col2 = st.columns(2)
             
             with col1:
-                st.subheader("Score Distribution")
-                fig = px.histogram(
-                    class_df,
-                    x='OverallPercentage',
-                    nbins=15,
-                    labels={'OverallPercentage': 'Overall Percentage'},
-                    color_discrete_sequence=['#1f77b4']
-                )
-                fig.add_vline(x=stats['mean_score'], line_dash="dash", 
-                             line_color="red", annotation_text="Mean")
-                fig.add_vline(x=stats['median_score'], line_dash="dash", 
-                             line_color="green", annotation_text="Median")
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
+                st.subheader("Change From Previous Term")
+                st.dataframe(terms['deltas'].round(2), use_container_width=True)
             
             with col2:
-                st.subheader("Grade Distribution")
-                grade_counts = class_df['Grade'].value_counts()
-                fig = px.pie(
-                    values=grade_counts.values,
-                    names=grade_counts.index,
-                    hole=0.4,
-                    color_discrete_sequence=px.colors.sequential.Blues_r
-                )
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Subject performance
-            st.subheader("Subject-wise Class Performance")
-            subject_stats = []
-            for subject in dashboard.subjects:
-                subject_stats.append({
-                    'Subject': subject,
-                    'Mean': class_df[subject].mean(),
-                    'Median': class_df[subject].median(),
-                    'Std Dev': class_df[subject].std(),
-                    'Min': class_df[subject].min(),
-                    'Max': class_df[subject].max()
-                })
-            
-            subject_df = pd.DataFrame(subject_stats)
-            
-            fig = go.Figure()
-            fig.add_trace(go.Bar(name='Mean', x=subject_df['Subject'], y=subject_df['Mean']))
-            fig.add_trace(go.Bar(name='Median', x=subject_df['Subject'], y=subject_df['Median']))
-            fig.update_layout(barmode='group', height=400)
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Top and bottom performers
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("🏆 Top 10 Performers")
-                top_students = class_df.nlargest(10, 'OverallPercentage')[
-                    ['StudentID', 'Name', 'OverallPercentage', 'Grade']
-                ].reset_index(drop=True)
-                top_students.index += 1
-                st.dataframe(top_students, use_container_width=True)
-            
-            with col2:
-                st.subheader("⚠️ Students Needing Support")
-                bottom_students = class_df.nsmallest(10, 'OverallPercentage')[
-                    ['StudentID', 'Name', 'OverallPercentage', 'Grade', 'Attendance']
-                ].reset_index(drop=True)
-                bottom_students.index += 1
-                st.dataframe(bottom_students, use_container_width=True)
-            
-            # Correlation analysis
-            st.subheader("Attendance vs Performance Analysis")
-            fig = px.scatter(
-                class_df,
-                x='Attendance',
-                y='OverallPercentage',
-                color='Grade',
-                hover_data=['Name', 'StudentID'],
-                labels={'Attendance': 'Attendance (%)', 'OverallPercentage': 'Overall Percentage (%)'},
-                trendline="ols"
-            )
-            fig.update_layout(height=500)
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Correlation coefficient
-            correlation = class_df['Attendance'].corr(class_df['OverallPercentage'])
-            st.info(f"**Correlation between Attendance and Performance:** {correlation:.3f}")
+                if terms['improved'] is not None:
+                    st.subheader("🚀 Most Improved This Term")
+                    st.dataframe(terms['improved'], hide_index=True, use_container_width=True)
     
     # ==================== SUBJECT ANALYSIS PAGE ====================
-    elif page == "Subject Analysis":
+    def subject_page(self):
+        import page_figures
+
         st.header("📖 Subject-wise Analysis")
         
         # Subject selection
-        selected_subject = st.selectbox("Select Subject", options=dashboard.subjects)
+        selected_subject = st.selectbox("Select Subject", options=self.subjects)
         
-        if selected_subject:
-            subject_data = dashboard.df[selected_subject]
-            
-            # Subject metrics
-            col1, col2, col3, col4, col5 = st.columns(5)
-            
-            with col1:
-                st.metric("Mean Score", f"{subject_data.mean():.2f}%")
-            with col2:
-                st.metric("Median Score", f"{subject_data.median():.2f}%")
-            with col3:
-                st.metric("Std Dev", f"{subject_data.std():.2f}")
-            with col4:
-                st.metric("Min Score", f"{subject_data.min():.2f}%")
-            with col5:
-                st.metric("Max Score", f"{subject_data.max():.2f}%")
-            
-            st.markdown("---")
-            
-            # Charts
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.subheader("Score Distribution")
-                fig = px.histogram(
-                    x=subject_data,
-                    nbins=20,
-                    labels={'x': f'{selected_subject} Score'},
-                    color_discrete_sequence=['#1f77b4']
-                )
-                fig.add_vline(x=subject_data.mean(), line_dash="dash", 
-                             line_color="red", annotation_text="Mean")
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
-            
-            with col2:
-                st.subheader("Box Plot")
-                fig = px.box(
-                    y=subject_data,
-                    labels={'y': f'{selected_subject} Score'},
-                    color_discrete_sequence=['#1f77b4']
-                )
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
-            
-            # Class-wise comparison
-            st.subheader(f"{selected_subject} Performance by Class")
-            class_subject_means = dashboard.df.groupby('Class')[selected_subject].agg(['mean', 'median', 'std']).reset_index()
-            
-            fig = go.Figure()
-            fig.add_trace(go.Bar(
-                name='Mean',
-                x=class_subject_means['Class'],
-                y=class_subject_means['mean'],
-                error_y=dict(type='data', array=class_subject_means['std'])
-            ))
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Top performers in subject
-            st.subheader(f"🏆 Top 15 Performers in {selected_subject}")
-            top_in_subject = dashboard.df.nlargest(15, selected_subject)[
-                ['StudentID', 'Name', 'Class', selected_subject, 'OverallPercentage']
-            ].reset_index(drop=True)
-            top_in_subject.index += 1
-            st.dataframe(top_in_subject, use_container_width=True)
+        if not selected_subject:
+            return
+        
+        report = self.subject_report(selected_subject)
+        subject_summary = report['summary']
+        
+        # Subject metrics
+        col1, col2, col3, col4, col5 = st.columns(5)
+        
+        with col1:
+            st.metric("Mean Score", f"{subject_summary['mean']:.2f}%")
+        with col2:
+            st.metric("Median Score", f"{subject_summary['median']:.2f}%")
+        with col3:
+            st.metric("Std Dev", f"{subject_summary['std']:.2f}")
+        with col4:
+            st.metric("Min Score", f"{subject_summary['min']:.2f}%")
+        with col5:
+            st.metric("Max Score", f"{subject_summary['max']:.2f}%")
+        
+        st.markdown("---")
+        
+        # Charts
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("Score Distribution")
+            self.chart(lambda: page_figures.subject_distribution_figure(self, report, selected_subject),
+                       'Subject Analysis', 'distribution', selected_subject)
+        
+        with col2:
+            st.subheader("Box Plot")
+            self.chart(lambda: page_figures.subject_box_figure(report, selected_subject),
+                       'Subject Analysis', 'box', selected_subject)
+        
+        # Class-wise comparison
+        st.subheader(f"{selected_subject} Performance by Class")
+        self.chart(lambda: page_figures.subject_by_class_figure(report),
+                   'Subject Analysis', 'by_class', selected_subject)
+        
+        # Top performers in subject
+        st.subheader(f"🏆 Top 15 Performers in {selected_subject}")
+        pages = self.leaderboard_pages(selected_subject, SUBJECT_LEADERBOARD_SIZE)
+        page = page_selector(pages, f'subject_page_{selected_subject}')
+        top = report['top'] if page == 0 else self.subject_leaderboard(selected_subject, page)
+        st.dataframe(display_table(top), use_container_width=True)
     
     # ==================== COMPARATIVE ANALYSIS PAGE ====================
-    elif page == "Comparative Analysis":
+    def comparative_page(self):
+        import page_figures
+
         st.header("📊 Comparative Analysis")
         
         # Multi-class comparison
         st.subheader("Multi-Class Performance Comparison")
         selected_classes = st.multiselect(
             "Select Classes to Compare",
-            options=dashboard.classes,
-            default=dashboard.classes[:3]
+            options=self.classes,
+            default=self.classes[:3]
         )
         
         if selected_classes:
-            comparison_data = dashboard.df[dashboard.df['Class'].isin(selected_classes)]
+            comparison = self.class_comparison(selected_classes)
             
             # Box plot comparison
-            fig = px.box(
-                comparison_data,
-                x='Class',
-                y='OverallPercentage',
-                color='Class',
-                labels={'OverallPercentage': 'Overall Percentage (%)'},
-                title="Performance Distribution by Class"
-            )
-            fig.update_layout(height=500)
-            st.plotly_chart(fig, use_container_width=True)
+            self.chart(lambda: page_figures.comparison_boxes_figure(comparison),
+                       'Comparative Analysis', 'class_boxes', tuple(selected_classes))
             
             # Subject comparison
             st.subheader("Subject-wise Comparison Across Classes")
             
-            subject_comparison = []
-            for class_name in selected_classes:
-                class_data = dashboard.df[dashboard.df['Class'] == class_name]
-                for subject in dashboard.subjects:
-                    subject_comparison.append({
-                        'Class': class_name,
-                        'Subject': subject,
-                        'Average Score': class_data[subject].mean()
-                    })
-            
-            comparison_df = pd.DataFrame(subject_comparison)
-            
-            fig = px.bar(
-                comparison_df,
-                x='Subject',
-                y='Average Score',
-                color='Class',
-                barmode='group',
-                labels={'Average Score': 'Average Score (%)'}
-            )
-            fig.update_layout(height=500)
-            st.plotly_chart(fig, use_container_width=True)
+            self.chart(lambda: page_figures.comparison_subjects_figure(comparison),
+                       'Comparative Analysis', 'class_subjects', tuple(selected_classes))
             
             # Heatmap
             st.subheader("Performance Heatmap")
-            heatmap_data = []
-            for class_name in selected_classes:
-                class_data = dashboard.df[dashboard.df['Class'] == class_name]
-                row = [class_name] + [class_data[subject].mean() for subject in dashboard.subjects]
-                heatmap_data.append(row)
             
-            heatmap_df = pd.DataFrame(heatmap_data, columns=['Class'] + dashboard.subjects)
-            heatmap_df = heatmap_df.set_index('Class')
+            self.chart(lambda: page_figures.comparison_heatmap_figure(comparison),
+                       'Comparative Analysis', 'heatmap', tuple(selected_classes))
             
-            fig = px.imshow(
-                heatmap_df,
-                labels=dict(x="Subject", y="Class", color="Average Score"),
-                color_continuous_scale='RdYlGn',
-                aspect="auto"
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+            # Correlations across classes
+            st.subheader("🔗 What Goes With Performance, Class by Class")
+            correlations = self.class_correlations(selected_classes)
+            self.chart(lambda: page_figures.correlation_by_class_figure(correlations),
+                       'Comparative Analysis', 'correlations', tuple(selected_classes))
+            
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                self.chart(lambda: page_figures.correlation_matrix_figure(correlations),
+                           'Comparative Analysis', 'correlation_matrix', tuple(selected_classes))
+            
+            with col2:
+                st.markdown("**Least-squares fits of Overall Percentage**")
+                fits = correlations['fits'][['Variable', 'Class', 'n', 'r', 'slope', 'slope_low', 'slope_high']]
+                st.dataframe(fits.round(3).rename(columns={'slope_low': 'slope 95% low',
+                                                           'slope_high': 'slope 95% high'}),
+                             hide_index=True, use_container_width=True)
         
         st.markdown("---")
         
         # Gender comparison
         st.subheader("Gender-based Performance Analysis")
+        gender = self.gender_comparison()
         
         col1, col2 = st.columns(2)
         
         with col1:
-            gender_performance = dashboard.df.groupby('Gender')['OverallPercentage'].agg(['mean', 'median', 'std'])
-            st.dataframe(gender_performance, use_container_width=True)
+            st.dataframe(gender['summary'], use_container_width=True)
         
         with col2:
-            fig = px.box(
-                dashboard.df,
-                x='Gender',
-                y='OverallPercentage',
-                color='Gender',
-                labels={'OverallPercentage': 'Overall Percentage (%)'}
-            )
-            fig.update_layout(height=400, showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
+            self.chart(lambda: page_figures.gender_boxes_figure(gender), 'Comparative Analysis', 'gender_boxes')
         
         # Subject-wise gender comparison
-        gender_subject_data = []
-        for gender in dashboard.df['Gender'].unique():
-            gender_data = dashboard.df[dashboard.df['Gender'] == gender]
-            for subject in dashboard.subjects:
-                gender_subject_data.append({
-                    'Gender': gender,
-                    'Subject': subject,
-                    'Average Score': gender_data[subject].mean()
-                })
-        
-        gender_subject_df = pd.DataFrame(gender_subject_data)
-        
-        fig = px.bar(
-            gender_subject_df,
-            x='Subject',
-            y='Average Score',
-            color='Gender',
-            barmode='group',
-            labels={'Average Score': 'Average Score (%)'},
-            title="Subject-wise Performance by Gender"
+        self.chart(lambda: page_figures.gender_subjects_figure(gender), 'Comparative Analysis', 'gender_subjects')
+
+    # ==================== AT-RISK STUDENTS PAGE ====================
+    def risk_page(self):
+        import page_figures
+        from risk import AT_RISK_SCORE
+
+        st.header("⚠️ At-Risk Students")
+        data = self.risk_overview()
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            st.metric("Students At Risk", f"{data['at_risk']:,}")
+        with col2:
+            st.metric("Share of Students", f"{data['at_risk'] / max(data['total'], 1) * 100:.1f}%")
+        with col3:
+            st.metric("Mean Risk Score", f"{data['mean_score']:.1f}")
+        
+        st.caption(
+            f"Risk scores run from 0 to 100 and combine low overall percentage, the two weakest subjects, "
+            f"attendance, assignment completion and missed exams; {AT_RISK_SCORE} or more puts a student "
+            f"on the watchlist."
+        )
+        st.markdown("---")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.subheader("At-Risk Share by Class")
+            self.chart(lambda: page_figures.risk_classes_figure(data), 'At-Risk Students', 'classes')
+        
+        with col2:
+            st.subheader("Main Risk Factor")
+            self.chart(lambda: page_figures.risk_factors_figure(data), 'At-Risk Students', 'factors')
+        
+        # School-wide or one class's watchlist
+        st.subheader("📋 Watchlist")
+        scope = st.selectbox("Class", options=["All Classes"] + self.classes, key='watchlist_class')
+        class_name = None if scope == "All Classes" else scope
+        page = page_selector(self.watchlist_pages(class_name), f'watchlist_page_{scope}')
+        watchlist = data['watchlist'] if class_name is None and page == 0 else self.watchlist(class_name, page)
+        st.dataframe(display_table(watchlist), use_container_width=True)
+
+
+def main():
+    """Main dashboard function: one traced rerun, with its timings shown on request"""
+    with tracing('rerun', exporters_from_env()) as trace:
+        render(trace)
+    if st.session_state.get('show_timings'):
+        timing_overlay(trace)
+
+
+def render(trace):
+    """Build the dashboard, labelling the trace with the page shown"""
+    
+    # Initialize dashboard
+    data_file = os.environ.get('DASHBOARD_DATA', 'students_data.csv')
+    dashboard = StudentDashboard(
+        data_file,
+        streaming=use_streaming(data_file),
+        chart_rows=int(os.environ.get('DASHBOARD_CHART_ROWS', CHART_ROW_THRESHOLD)),
+        terms_dir=os.environ.get('DASHBOARD_TERMS', 'terms')
+    )
+    
+    # Title and header
+    st.title("📚 Student Performance Analytics Dashboard")
+    st.markdown("---")
+    
+    # Sidebar navigation
+    st.sidebar.title("Navigation")
+    page = st.sidebar.radio(
+        "Select View",
+        STREAMING_PAGES if dashboard.streaming else PAGES
+    )
+    trace.labels['page'] = page
+    st.sidebar.checkbox("Show timings", key='show_timings')
+    
+    if dashboard.streaming:
+        st.sidebar.caption(f"Streaming mode: {dashboard.cube.total_rows:,} students summarized, no rows kept in memory")
+    
+    if not dashboard.streaming:
+        dashboard.set_policy(grading_sidebar(configured_policy()))
+        dashboard.set_filters(filter_sidebar(dashboard))
+        if any(dashboard.filters.values()):
+            students = dashboard.matching_students
+            st.sidebar.caption(f"Filtered: {students:,} of {dashboard.total_students:,} students")
+            if not students:
+                st.warning("No students match the selected filters.")
+                return
+    
+    memory = dashboard.source_data.memory
+    if memory:
+        st.sidebar.caption(
+            f"Data in memory: {memory['after'] / 2**20:.1f} MB "
+            f"(was {memory['before'] / 2**20:.1f} MB, {memory['ratio']:.1f}x smaller)"
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+    
+    pages = {
+        "Overview": dashboard.overview_page,
+        "Student Analysis": dashboard.student_page,
+        "Class Analysis": dashboard.class_page,
+        "Subject Analysis": dashboard.subject_page,
+        "Comparative Analysis": dashboard.comparative_page,
+        "At-Risk Students": dashboard.risk_page,
+    }
+    with span(f'page:{page}'):
+        pages[page]()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,409 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from bitmaps import FILTER_COLUMNS, BitmapIndex, filter_key
+from column_store import ArrowFileStore, ColumnStore, MANIFEST, ensure_store, is_column_store
+from grading import GradedColumns
+from instrumentation import span
+from schema import SUBJECTS, apply_schema, read_students_csv
+from shared_store import SHARED_MANIFEST, SharedSnapshot, is_shared_store
+from student_index import StudentIndex
+
+# Copy-on-Write lets every session hold a cheap view of the shared frame;
+# a write through one of those views copies the touched column instead of
+# changing the data other sessions see.
+pd.set_option('mode.copy_on_write', True)
+
+# Filtered subsets kept per snapshot, least recently used dropped first
+MAX_SUBSETS = 32
+# Regraded snapshots kept per snapshot, one per grading policy
+MAX_GRADINGS = 8
+
+
+class Delta:
+    """Rows an upsert changed, indexed by row position
+
+    ``before`` holds the old values of replaced students; ``after`` holds
+    their new values followed by the appended students, whose positions are
+    listed in ``appended``.
+    """
+
+    def __init__(self, before, after, appended):
+        self.before = before
+        self.after = after
+        self.appended = appended
+
+
+class RowSubset:
+    """Store over some rows of another snapshot, reading its columns through it"""
+
+    memory = None
+
+    def __init__(self, data, positions):
+        self.data = data
+        self.positions = positions
+
+    def frame(self, columns=None):
+        frame = self.data.df if columns is None else self.data.columns(columns)
+        return frame.take(self.positions).reset_index(drop=True)
+
+    def row(self, position, columns=None):
+        row = self.data.row(self.positions[position], columns)
+        row.name = position
+        return row
+
+
+class GradedStore:
+    """Store over another snapshot with OverallPercentage and Grade taken from a grading policy"""
+
+    memory = None
+
+    def __init__(self, data, graded):
+        self.data = data
+        self.graded = graded
+
+    def frame(self, columns=None):
+        return self.graded.frame(self.data.df if columns is None else self.data.columns(columns))
+
+    def row(self, position, columns=None):
+        row = self.data.row(position, columns).copy()
+        if 'OverallPercentage' in row.index:
+            row['OverallPercentage'] = self.graded.overall[position]
+        if 'Grade' in row.index:
+            row['Grade'] = self.graded.grade[position]
+        return row
+
+
+class StudentData:
+    """Immutable snapshot of the student data shared by every session
+
+    ``version`` identifies the snapshot: the source file's version, plus a
+    revision number once upserts have been applied on top of it.
+    """
+
+    def __init__(self, df=None, version=None, source=None, store=None, aggregates=None, revision=0):
+        self._df = df
+        self.base_version = version
+        self.revision = revision
+        self.version = f"{version}+{revision}" if revision else version
+        self.source = source
+        self.store = store
+        self.aggregates = aggregates
+        self._derived = {}
+        # Name -> callable deriving a structure from the parent snapshot's, for filtered and regraded snapshots
+        self._narrowed = {}
+        self._subsets = OrderedDict()
+        self._graded = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def df(self):
+        """Full frame; for columnar sources it is only built when first asked for"""
+        if self._df is None:
+            if self.store is None:
+                raise RuntimeError('Streamed data keeps aggregates only, not rows')
+            with self._lock:
+                if self._df is None:
+                    self._df = self.store.frame()
+        return self._df
+
+    def columns(self, names):
+        """Frame of just the named columns, read from the store when there is one"""
+        if self._df is None and self.store is not None:
+            return self.store.frame(names)
+        return self.df[list(names)]
+
+    @property
+    def memory(self):
+        """Before/after memory report of the compact schema, when known"""
+        if self.aggregates is not None:
+            return None
+        if self.store is not None:
+            return self.store.memory
+        return self.df.attrs.get('memory')
+
+    def row(self, position, columns=None):
+        """One student as a Series, optionally of just some columns"""
+        if self._df is None and self.store is not None:
+            return self.store.row(position, columns)
+        row = self.df.iloc[position]
+        return row if columns is None else row[list(columns)]
+
+    def derived(self, name, builder):
+        """Return a structure built once per data version"""
+        try:
+            return self._derived[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._derived:
+                narrow = self._narrowed.pop(name, None)
+                with span(f'derive:{name}'):
+                    self._derived[name] = narrow() if narrow is not None else builder(self)
+            return self._derived[name]
+
+    @property
+    def index(self):
+        """StudentID lookup, rows of each class and per-class rank order"""
+        return self.derived(
+            'student_index', lambda data: StudentIndex(data.columns(['StudentID', 'Class', 'OverallPercentage']))
+        )
+
+    @property
+    def bitmaps(self):
+        """Packed row bitsets of every filter value"""
+        return self.derived('bitmaps', lambda data: BitmapIndex.from_frame(data.columns(FILTER_COLUMNS)))
+
+    def filtered(self, filters):
+        """Snapshot of just the students matching ``filters``, or this one when nothing is selected
+
+        ``filters`` maps a filter column to the values to keep; see
+        bitmaps.FILTER_COLUMNS. The matching rows come from ANDing and ORing
+        bitmaps. The subset reads its columns through this snapshot.
+        Derived structures with a ``subset(positions)`` method are narrowed
+        from this snapshot's when first used; any others are built from the
+        subset's rows. Subsets are
+        kept for repeat requests of the same filter while this snapshot
+        lives.
+        """
+        key = filter_key(filters)
+        if not key:
+            return self
+        with self._lock:
+            subset = self._subsets.get(key)
+            if subset is not None:
+                self._subsets.move_to_end(key)
+                return subset
+            bitmaps = self.bitmaps
+            positions = bitmaps.positions(bitmaps.mask(dict(key)))
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+            subset = StudentData(version=f"{self.version}/{digest}", source=self.source,
+                                 store=RowSubset(self, positions))
+            for name, value in self._derived.items():
+                if hasattr(value, 'subset'):
+                    subset._narrowed[name] = partial(value.subset, positions)
+            self._subsets[key] = subset
+            if len(self._subsets) > MAX_SUBSETS:
+                self._subsets.popitem(last=False)
+            return subset
+
+    def graded(self, policy):
+        """Snapshot with OverallPercentage and Grade derived from a grading.GradingPolicy
+
+        With no policy this snapshot, and its stored columns, are used as
+        they are. Otherwise both columns are recomputed for every row with
+        one matrix-vector product and one binning pass over the subject
+        scores; every other column is read through this snapshot. Derived
+        structures with a ``regraded(data)`` method are rebuilt from this
+        snapshot's for just those two columns when first used; any others
+        are built from scratch. The regraded snapshot is kept per policy, so
+        switching back to a policy costs nothing.
+        """
+        if policy is None:
+            return self
+        with self._lock:
+            snapshot = self._graded.get(policy)
+            if snapshot is not None:
+                self._graded.move_to_end(policy)
+                return snapshot
+            with span('grading'):
+                columns = GradedColumns.from_frame(self.columns(SUBJECTS), policy)
+            snapshot = self._regraded(columns)
+            for name, value in self._derived.items():
+                if hasattr(value, 'regraded'):
+                    snapshot._narrowed[name] = partial(value.regraded, snapshot)
+            self._graded[policy] = snapshot
+            if len(self._graded) > MAX_GRADINGS:
+                self._graded.popitem(last=False)
+            return snapshot
+
+    def _regraded(self, columns):
+        return StudentData(version=f"{self.version}~{columns.policy.digest}", source=self.source,
+                           store=GradedStore(self, columns))
+
+    def upsert(self, batch):
+        """New snapshot with a batch of students replaced or appended, matched on StudentID
+
+        Columns left out of the batch keep their values for existing students;
+        new students need every column. Derived structures with an
+        ``updated(delta)`` method are carried over by folding in just the
+        changed rows; any others are rebuilt on first use. Only the columns
+        the batch touches are copied, and the whole frame only when students
+        are appended.
+        """
+        if self.aggregates is not None:
+            raise RuntimeError('Streamed data keeps aggregates only, not rows')
+        unknown = batch.columns.difference(self.df.columns)
+        if len(unknown):
+            raise ValueError(f"Unknown columns in batch: {', '.join(unknown)}")
+        batch = apply_schema(batch.drop_duplicates('StudentID', keep='last').reset_index(drop=True))
+
+        with self._lock:
+            frame = self.df
+            positions = self.index.positions(batch['StudentID'])
+            existing = positions >= 0
+            added = batch[~existing]
+            missing = frame.columns.difference(batch.columns)
+            if len(added) and len(missing):
+                raise ValueError(f"New students need every column; missing {', '.join(missing)}")
+
+            replaced = positions[existing]
+            df = frame.copy(deep=False)
+            for column in batch.columns:
+                series = df[column]
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    new = pd.Index(batch[column].dropna().unique().astype(object)).difference(series.cat.categories)
+                    if len(new):
+                        series = series.cat.add_categories(new)
+                values = batch[column].astype(series.dtype)
+                if existing.any() and column != 'StudentID':
+                    # Copy-on-Write copies just this column; the old snapshot keeps its values
+                    series = series.copy()
+                    series.iloc[replaced] = values[existing].to_numpy()
+                df[column] = series
+                batch[column] = values
+
+            appended = np.arange(len(df), len(df) + len(added))
+            if len(added):
+                df = pd.concat([df, batch.loc[~existing, df.columns]], ignore_index=True)
+            df.attrs['memory'] = self.memory
+
+            delta = Delta(frame.take(replaced), df.take(np.concatenate([replaced, appended])), appended)
+            data = StudentData(df, self.base_version, source=self.source, revision=self.revision + 1)
+            for name, value in self._derived.items():
+                if hasattr(value, 'updated'):
+                    data._derived[name] = value.updated(delta)
+
+            # The policy used last follows with just the changed rows regraded; any
+            # others are derived again from the new snapshot if asked for
+            for policy, graded in list(self._graded.items())[-1:]:
+                regraded = data._regraded(graded.store.graded.updated(delta))
+                graded_delta = Delta(policy.regrade(delta.before), policy.regrade(delta.after), appended)
+                for name, value in graded._derived.items():
+                    if hasattr(value, 'updated'):
+                        regraded._derived[name] = value.updated(graded_delta)
+                data._graded[policy] = regraded
+            return data
+
+    def view(self):
+        """Return a per-caller view of the frame; writes to it never reach the snapshot"""
+        return self.df.copy(deep=False)
+
+    @property
+    def classes(self):
+        if self.aggregates is not None:
+            return self.aggregates.cube.classes
+        return self.derived('classes', lambda data: sorted(data.columns(['Class'])['Class'].unique()))
+
+
+def file_version(path):
+    """Version token for a file on disk, based on its mtime and size"""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+# Process-wide cache: (absolute path, streaming) -> StudentData for the latest file version
+_cache = {}
+_cache_lock = threading.Lock()
+_path_locks = {}
+
+
+def _path_lock(path):
+    with _cache_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def source_version(path):
+    """Version token for a CSV, Parquet/Feather file, column store or published snapshot directory"""
+    if is_shared_store(path):
+        return file_version(os.path.join(path, SHARED_MANIFEST))
+    if os.path.isdir(path):
+        return file_version(os.path.join(path, MANIFEST))
+    return file_version(path)
+
+
+def _open(path, version, reader, columnar, streaming):
+    """Read a source into a snapshot, going through a column store where possible"""
+    if streaming:
+        from streaming import stream_aggregates
+
+        return StudentData(version=version, source=path, aggregates=stream_aggregates(path))
+    if is_shared_store(path):
+        # Structures the publisher built come mapped; anything else is derived here on first use
+        snapshot = SharedSnapshot(path)
+        data = StudentData(version=version, source=path, store=snapshot.store)
+        data._derived.update(snapshot.structures)
+        return data
+    if is_column_store(path):
+        return StudentData(version=version, source=path, store=ColumnStore(path))
+    if path.endswith(('.parquet', '.feather')):
+        return StudentData(version=version, source=path, store=ArrowFileStore(path))
+    if columnar:
+        store_path = ensure_store(path, version, reader=reader)
+        return StudentData(version=version, source=path, store=ColumnStore(store_path))
+    return StudentData(reader(path), version, source=path)
+
+
+def load_students(path, reader=read_students_csv, columnar=False, streaming=False):
+    """Load a student file once per version and share the result across callers
+
+    ``path`` may be a CSV, a Parquet/Feather file, a column store directory
+    or a snapshot published by publisher.py, which is attached without a
+    copy: every worker process maps the same pages.
+    With ``columnar=True`` a CSV is converted to a column store next to it
+    the first time it is seen (and again whenever it changes), and later
+    loads memory-map that store instead of parsing text. With
+    ``streaming=True`` the CSV is read in chunks into aggregates only, for
+    files too large to hold in memory; no rows are kept.
+    """
+    path = os.path.abspath(path)
+    key = (path, streaming)
+    version = source_version(path)
+
+    cached = _cache.get(key)
+    if cached is not None and cached.base_version == version:
+        return cached
+
+    # Only one thread parses a given file; the others wait for its result
+    with _path_lock(key):
+        cached = _cache.get(key)
+        version = source_version(path)
+        if cached is not None and cached.base_version == version:
+            return cached
+
+        with span('read_source'):
+            data = _open(path, version, reader, columnar, streaming)
+        _cache[key] = data
+        return data
+
+
+def update_students(data, batch):
+    """Upsert a batch into the latest shared snapshot of ``data``'s source
+
+    Later load_students() calls for the source get the updated snapshot
+    until the file itself changes on disk; the file is not rewritten.
+    Published snapshots are shared by many processes, so their upserts go
+    through the publisher instead.
+    """
+    if is_shared_store(data.source):
+        raise RuntimeError('Published data is read-only; upsert through its publisher')
+    key = (data.source, data.aggregates is not None)
+    with _path_lock(key):
+        current = _cache.get(key)
+        if current is None or current.base_version != data.base_version:
+            current = data
+        updated = current.upsert(batch)
+        _cache[key] = updated
+        return updated
+
+
+def clear_cache():
+    """Drop every cached snapshot"""
+    with _cache_lock:
+        _cache.clear()
@@ -1,107 +1,242 @@
-import csv
-import random
+import argparse
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
 
-# Set random seed for reproducibility
-random.seed(42)
-np.random.seed(42)
+from grading import GRADE_BOUNDARIES, GRADES
+from schema import SUBJECTS
 
 # Student data configuration
-num_students = 1000
-classes = ['10A', '10B', '10C', '10D', '11A', '11B', '11C', '11D', '12A', '12B']
-subjects = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'History']
-
-# Generate student data
-students = []
-
-for i in range(1, num_students + 1):
-    student_id = f"STU{i:04d}"
-    first_names = ['Raj', 'Priya', 'Amit', 'Sneha', 'Vikram', 'Anjali', 'Rohan', 'Kavya', 
-                   'Arjun', 'Divya', 'Karan', 'Pooja', 'Rahul', 'Neha', 'Aditya', 'Riya',
-                   'Sanjay', 'Meera', 'Nikhil', 'Shruti', 'Varun', 'Ishita', 'Akash', 'Tanvi']
-    last_names = ['Sharma', 'Patel', 'Kumar', 'Singh', 'Reddy', 'Nair', 'Gupta', 'Mehta',
-                  'Joshi', 'Rao', 'Verma', 'Agarwal', 'Shah', 'Iyer', 'Desai', 'Kulkarni']
-    
-    name = f"{random.choice(first_names)} {random.choice(last_names)}"
-    student_class = random.choice(classes)
-    age = int(student_class[:2]) + random.randint(0, 1)
-    gender = random.choice(['Male', 'Female'])
-    
+CLASSES = ['10A', '10B', '10C', '10D', '11A', '11B', '11C', '11D', '12A', '12B']
+FIRST_NAMES = ['Raj', 'Priya', 'Amit', 'Sneha', 'Vikram', 'Anjali', 'Rohan', 'Kavya',
+               'Arjun', 'Divya', 'Karan', 'Pooja', 'Rahul', 'Neha', 'Aditya', 'Riya',
+               'Sanjay', 'Meera', 'Nikhil', 'Shruti', 'Varun', 'Ishita', 'Akash', 'Tanvi']
+LAST_NAMES = ['Sharma', 'Patel', 'Kumar', 'Singh', 'Reddy', 'Nair', 'Gupta', 'Mehta',
+              'Joshi', 'Rao', 'Verma', 'Agarwal', 'Shah', 'Iyer', 'Desai', 'Kulkarni']
+GENDERS = ['Male', 'Female']
+
+FIELDNAMES = ['StudentID', 'Name', 'Class', 'Age', 'Gender', 'Attendance', *SUBJECTS,
+              'OverallPercentage', 'Grade', 'AssignmentCompletion', 'ExamParticipation']
+
+DEFAULT_SHARD_SIZE = 1_000_000
+OUTPUT_FILES = {'csv': 'students_data.csv', 'parquet': 'students_data.parquet',
+                'columns': 'students_data.columns'}
+TERMS_DIR = 'terms'
+
+
+def assign_grades(overall_percentage):
+    """Letter grade for each OverallPercentage"""
+    codes = np.digitize(overall_percentage, GRADE_BOUNDARIES)
+    return pd.Categorical.from_codes(codes, categories=GRADES)
+
+
+def class_age(class_name):
+    """Base age of a class: its year number (10A -> 10), or 10 if it has none"""
+    match = re.match(r'\d+', class_name)
+    return int(match.group()) if match else 10
+
+
+def generate_students(start, count, rng, classes=CLASSES, id_width=4):
+    """Generate ``count`` students numbered from ``start + 1``, one column at a time"""
+    ids = pd.Series(np.arange(start + 1, start + count + 1)).astype(str).str.zfill(id_width)
+
+    first = rng.integers(len(FIRST_NAMES), size=count)
+    last = rng.integers(len(LAST_NAMES), size=count)
+    names = [f"{f} {l}" for f in FIRST_NAMES for l in LAST_NAMES]
+
+    class_codes = rng.integers(len(classes), size=count)
+    class_ages = np.array([class_age(c) for c in classes])
+    age = class_ages[class_codes] + rng.integers(0, 2, size=count)
+    gender = rng.integers(len(GENDERS), size=count)
+
     # Generate attendance (70-100%)
-    attendance = round(random.uniform(70, 100), 2)
-    
+    attendance = rng.uniform(70, 100, size=count).round(2)
+
     # Generate subject scores with some correlation to attendance
-    base_performance = (attendance - 70) / 30  # Normalize to 0-1
-    
-    scores = {}
-    for subject in subjects:
-        # Add some randomness but correlate with attendance
-        mean_score = 50 + (base_performance * 40) + random.uniform(-10, 10)
-        score = max(0, min(100, np.random.normal(mean_score, 12)))
-        scores[subject] = round(score, 2)
-    
-    # Calculate overall percentage
-    overall_percentage = round(sum(scores.values()) / len(scores), 2)
-    
-    # Determine grade
-    if overall_percentage >= 90:
-        grade = 'A+'
-    elif overall_percentage >= 80:
-        grade = 'A'
-    elif overall_percentage >= 70:
-        grade = 'B'
-    elif overall_percentage >= 60:
-        grade = 'C'
-    elif overall_percentage >= 50:
-        grade = 'D'
-    else:
-        grade = 'F'
-    
-    # Generate assignment completion (60-100%)
-    assignment_completion = round(random.uniform(60, 100), 2)
-    
-    # Generate exam participation
-    exam_participation = random.choice(['Yes', 'Yes', 'Yes', 'Yes', 'No'])
-    
-    student = {
-        'StudentID': student_id,
-        'Name': name,
-        'Class': student_class,
+    base_performance = (attendance - 70) / 30
+    mean_score = 50 + (base_performance * 40)[:, None] + rng.uniform(-10, 10, size=(count, len(SUBJECTS)))
+    scores = np.clip(rng.normal(mean_score, 12), 0, 100).round(2)
+
+    # Calculate overall percentage and grade
+    overall_percentage = (scores.sum(axis=1) / len(SUBJECTS)).round(2)
+
+    df = pd.DataFrame({
+        'StudentID': 'STU' + ids,
+        'Name': pd.Categorical.from_codes(first * len(LAST_NAMES) + last, categories=names),
+        'Class': pd.Categorical.from_codes(class_codes, categories=classes),
         'Age': age,
-        'Gender': gender,
+        'Gender': pd.Categorical.from_codes(gender, categories=GENDERS),
         'Attendance': attendance,
-        'Mathematics': scores['Mathematics'],
-        'Physics': scores['Physics'],
-        'Chemistry': scores['Chemistry'],
-        'Biology': scores['Biology'],
-        'English': scores['English'],
-        'History': scores['History'],
-        'OverallPercentage': overall_percentage,
-        'Grade': grade,
-        'AssignmentCompletion': assignment_completion,
-        'ExamParticipation': exam_participation
-    }
-    
-    students.append(student)
-
-# Write to CSV
-csv_file = 'students_data.csv'
-fieldnames = ['StudentID', 'Name', 'Class', 'Age', 'Gender', 'Attendance',
-              'Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'History',
-              'OverallPercentage', 'Grade', 'AssignmentCompletion', 'ExamParticipation']
+    })
+    for i, subject in enumerate(SUBJECTS):
+        df[subject] = scores[:, i]
+    df['OverallPercentage'] = overall_percentage
+    df['Grade'] = assign_grades(overall_percentage)
+    # Generate assignment completion (60-100%) and exam participation (80% Yes)
+    df['AssignmentCompletion'] = rng.uniform(60, 100, size=count).round(2)
+    df['ExamParticipation'] = np.where(rng.random(count) < 0.8, 'Yes', 'No')
+    return df[FIELDNAMES]
+
+
+def shard_plan(num_students, shard_size, seed):
+    """(start, count, seed) for every shard; seeds depend only on the seed and shard number"""
+    starts = range(0, num_students, shard_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    return [(start, min(shard_size, num_students - start), shard_seed)
+            for start, shard_seed in zip(starts, seeds)]
+
+
+def write_csv(df, path, header=True):
+    """Write a frame as CSV, through pyarrow's writer when it is installed"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        df.to_csv(path, index=False, header=header)
+        return
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # The CSV writer does not take dictionary columns, so write categoricals as plain text
+    schema = pa.schema([pa.field(f.name, pa.string() if pa.types.is_dictionary(f.type) else f.type)
+                        for f in table.schema])
+    pa_csv.write_csv(table.cast(schema), path,
+                     pa_csv.WriteOptions(include_header=header, quoting_style='needed'))
+
+
+def write_frame(df, path, fmt='csv'):
+    """Write a whole frame as CSV, Parquet or a column store"""
+    if fmt == 'csv':
+        write_csv(df, path)
+    elif fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        from column_store import write_store
+        from schema import apply_schema
+
+        write_store(apply_schema(df), path)
+
+
+def _generate_shard(args):
+    start, count, seed, classes, id_width, csv_path = args
+    df = generate_students(start, count, np.random.default_rng(seed), classes, id_width)
+    class_counts = df['Class'].value_counts()
+    if csv_path is None:
+        return df, class_counts
+    # CSV text formatting is the slow part, so each worker writes its own shard
+    write_csv(df, csv_path, header=start == 0)
+    return csv_path, class_counts
+
+
+def generate(num_students, output, fmt='csv', classes=CLASSES, seed=42,
+             shard_size=DEFAULT_SHARD_SIZE, workers=None):
+    """Generate a roster across a process pool and write it as CSV, Parquet or a column store
+
+    Returns the number of students per class.
+    """
+    plan = shard_plan(num_students, shard_size, seed)
+    workers = workers or min(len(plan), os.cpu_count() or 1)
+    tmp_dir = tempfile.mkdtemp(prefix='students-', dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        id_width = max(4, len(str(num_students)))
+        jobs = [(start, count, shard_seed, classes, id_width,
+                 os.path.join(tmp_dir, f"part-{i:05d}.csv") if fmt == 'csv' else None)
+                for i, (start, count, shard_seed) in enumerate(plan)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_generate_shard, jobs))
+        else:
+            results = [_generate_shard(job) for job in jobs]
+        parts = [part for part, _ in results]
+        class_counts = sum(counts for _, counts in results).sort_index()
+
+        if fmt == 'csv':
+            with open(output, 'wb') as out:
+                for part in parts:
+                    with open(part, 'rb') as f:
+                        shutil.copyfileobj(f, out)
+        else:
+            write_frame(pd.concat(parts, ignore_index=True), output, fmt)
+        return class_counts
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def generate_terms(num_students, output_dir, terms, fmt='csv', classes=CLASSES, seed=42):
+    """Write ``terms`` successive snapshots of one roster into a directory, one file per term
+
+    Students keep their ID and class. Each has a trend of their own that
+    moves every subject score from term to term, plus some noise, and
+    attendance wanders a little. Files are named term-01, term-02, ... so
+    they sort in term order. Returns the written paths.
+    """
+    rng = np.random.default_rng(seed)
+    df = generate_students(0, num_students, rng, classes, id_width=max(4, len(str(num_students))))
+    trend = rng.normal(0, 2, size=(num_students, 1))
+    suffix = os.path.splitext(OUTPUT_FILES[fmt])[1]
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = []
+    for term in range(1, terms + 1):
+        if term > 1:
+            noise = rng.normal(0, 4, size=(num_students, len(SUBJECTS)))
+            scores = np.clip(df[SUBJECTS].to_numpy() + trend + noise, 0, 100).round(2)
+            df[SUBJECTS] = scores
+            df['OverallPercentage'] = (scores.sum(axis=1) / len(SUBJECTS)).round(2)
+            df['Grade'] = assign_grades(df['OverallPercentage'])
+            df['Attendance'] = np.clip(df['Attendance'] + rng.normal(0, 3, size=num_students), 0, 100).round(2)
+        path = os.path.join(output_dir, f"term-{term:02d}{suffix}")
+        write_frame(df, path, fmt)
+        paths.append(path)
+    return paths
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic student performance data')
+    parser.add_argument('--rows', type=int, default=1000, help='number of students (default: 1000)')
+    parser.add_argument('--classes', default=','.join(CLASSES),
+                        help='comma-separated class list (default: %(default)s)')
+    parser.add_argument('--format', choices=sorted(OUTPUT_FILES), default='csv', help='output format')
+    parser.add_argument('--output', help='output path (default depends on the format)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed (default: 42)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help='students per shard; output depends on seed and shard size only')
+    parser.add_argument('--terms', type=int,
+                        help=f'write this many successive terms of one roster into a directory '
+                             f'(--output, default: {TERMS_DIR}/) instead of a single file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    classes = [c.strip() for c in args.classes.split(',') if c.strip()]
+
+    if args.terms:
+        output = args.output or TERMS_DIR
+        paths = generate_terms(args.rows, output, args.terms, fmt=args.format, classes=classes, seed=args.seed)
+        print(f"✓ Successfully generated {args.terms} terms of {args.rows} student records in {output}/")
+        for path in paths:
+            print(f"  {path}")
+        return
+
+    output = args.output or OUTPUT_FILES[args.format]
+
+    class_counts = generate(args.rows, output, fmt=args.format, classes=classes, seed=args.seed,
+                            shard_size=args.shard_size, workers=args.workers)
+
+    print(f"✓ Successfully generated {args.rows} student records in {output}")
+    if args.format == 'csv':
+        sample = pd.read_csv(output, nrows=1)
+        print(f"\nSample data:")
+        print(f"First student: {sample.iloc[0].to_dict()}")
+    print(f"\nClass distribution:")
+    for cls, count in class_counts.items():
+        print(f"  {cls}: {count} students")
+
 
-with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(students)
-
-print(f"✓ Successfully generated {num_students} student records in {csv_file}")
-print(f"\nSample data:")
-print(f"First student: {students[0]}")
-print(f"\nClass distribution:")
-class_counts = {}
-for student in students:
-    class_name = student['Class']
-    class_counts[class_name] = class_counts.get(class_name, 0) + 1
-for cls, count in sorted(class_counts.items()):
-    print(f"  {cls}: {count} students")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from schema import SUBJECTS
+
+# Grade boundaries: OverallPercentage >= boundary earns the grade
+GRADE_BOUNDARIES = [50, 60, 70, 80, 90]
+GRADES = ['F', 'D', 'C', 'B', 'A', 'A+']
+
+
+class GradingPolicy:
+    """Subject weights and grade boundaries that OverallPercentage and Grade are derived from
+
+    OverallPercentage is the weighted mean of the subject scores; a student
+    earns the grade whose boundary their OverallPercentage reaches. Subjects
+    left out of ``weights`` keep a weight of 1. The default policy weighs
+    every subject equally with the boundaries the data is generated with,
+    so it reproduces the stored grades. Its OverallPercentage can be a cent
+    off the stored one on half-cent ties: the stored scores are rounded,
+    and the stored percentage may have been computed before they were.
+    """
+
+    def __init__(self, weights=None, boundaries=GRADE_BOUNDARIES, grades=GRADES):
+        weights = {subject: 1.0 for subject in SUBJECTS} | dict(weights or {})
+        unknown = set(weights).difference(SUBJECTS)
+        if unknown:
+            raise ValueError(f"Unknown subjects in weights: {', '.join(sorted(unknown))}")
+        if any(weight < 0 for weight in weights.values()) or not sum(weights.values()) > 0:
+            raise ValueError('Weights must be non-negative with a positive total')
+        boundaries = [float(boundary) for boundary in boundaries]
+        if any(low >= high for low, high in zip(boundaries, boundaries[1:])):
+            raise ValueError('Grade boundaries must be strictly increasing')
+        if len(grades) != len(boundaries) + 1:
+            raise ValueError(f"{len(boundaries)} boundaries need {len(boundaries) + 1} grades, got {len(grades)}")
+
+        self.weights = {subject: float(weights[subject]) for subject in SUBJECTS}
+        self.boundaries = boundaries
+        self.grades = list(grades)
+
+    @classmethod
+    def from_dict(cls, config):
+        """Policy from ``{'weights': {...}, 'boundaries': [...], 'grades': [...]}``; missing keys keep the defaults"""
+        return cls(config.get('weights'), config.get('boundaries', GRADE_BOUNDARIES), config.get('grades', GRADES))
+
+    @classmethod
+    def from_file(cls, path):
+        """Policy from a JSON file laid out as for from_dict"""
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {'weights': self.weights, 'boundaries': self.boundaries, 'grades': self.grades}
+
+    @property
+    def key(self):
+        """Hashable identity: policies with the same weights, boundaries and grades share cached results"""
+        total = sum(self.weights.values())
+        # Weights only matter relative to each other, so 1,1,... and 2,2,... are the same policy
+        return (tuple(round(weight / total, 12) for weight in self.weights.values()),
+                tuple(self.boundaries), tuple(self.grades))
+
+    @property
+    def digest(self):
+        return hashlib.sha1(repr(self.key).encode()).hexdigest()[:12]
+
+    def __eq__(self, other):
+        return isinstance(other, GradingPolicy) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def is_default(self):
+        return self == DEFAULT_POLICY
+
+    def overall(self, scores):
+        """OverallPercentage of every row of an (n, subjects) score matrix, to two decimals
+
+        One matrix-vector product with the normalised weights. A missing score
+        leaves the row's percentage missing, as it would be in the source.
+        """
+        weights = np.array(list(self.weights.values()), dtype=np.float64)
+        weights /= weights.sum()
+        overall = scores @ weights
+        return overall.round(2).astype(np.float32)
+
+    def grade(self, overall):
+        """Grade of every OverallPercentage as a categorical, lowest grade first; missing stays missing
+
+        The grade code is the number of boundaries reached. Counting them with
+        one comparison pass per boundary is several times faster than
+        np.digitize's binary search for the handful of boundaries a policy has.
+        """
+        codes = np.zeros(len(overall), dtype=np.int8)
+        for boundary in self.boundaries:
+            codes += overall >= boundary
+        codes[np.isnan(overall)] = -1
+        return pd.Categorical.from_codes(codes, categories=self.grades)
+
+    def apply(self, scores):
+        """(OverallPercentage, Grade) of every row of a frame of subject scores"""
+        overall = self.overall(scores[SUBJECTS].to_numpy(dtype=np.float64, na_value=np.nan))
+        return overall, self.grade(overall)
+
+    def regrade(self, frame):
+        """Frame with OverallPercentage and Grade recomputed from its subject columns"""
+        return GradedColumns.from_frame(frame, self).frame(frame)
+
+
+DEFAULT_POLICY = GradingPolicy()
+
+
+class GradedColumns:
+    """OverallPercentage and Grade of every row of a snapshot under one policy"""
+
+    def __init__(self, policy, overall, grade):
+        self.policy = policy
+        self.overall = overall
+        self.grade = grade
+
+    @classmethod
+    def from_frame(cls, df, policy):
+        return cls(policy, *policy.apply(df))
+
+    def updated(self, delta):
+        """Columns after an upsert: only the replaced and appended rows are recomputed"""
+        rows = len(self.overall) + len(delta.appended)
+        positions = delta.after.index.to_numpy()
+        overall = np.empty(rows, dtype=np.float32)
+        overall[:len(self.overall)] = self.overall
+        codes = np.full(rows, -1, dtype=np.int8)
+        codes[:len(self.grade)] = self.grade.codes
+        changed, changed_grades = self.policy.apply(delta.after)
+        overall[positions] = changed
+        codes[positions] = changed_grades.codes
+        return GradedColumns(self.policy, overall,
+                             pd.Categorical.from_codes(codes, categories=self.policy.grades))
+
+    def frame(self, frame):
+        """Frame of every row with its OverallPercentage and Grade columns replaced by these"""
+        frame = frame.copy(deep=False)
+        if 'OverallPercentage' in frame:
+            frame['OverallPercentage'] = self.overall
+        if 'Grade' in frame:
+            frame['Grade'] = pd.Series(self.grade, index=frame.index)
+        return frame
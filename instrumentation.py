@@ -0,0 +1,185 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds of the Prometheus histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Trace of the rerun running in this thread; spans outside a trace are not recorded
+_current = ContextVar('trace', default=None)
+
+
+class Trace:
+    """Timed sections of one dashboard rerun, in the order they started
+
+    Each span is ``[name, depth, seconds]``; depth is how many spans it is
+    nested in, so the list reads as an indented tree.
+    """
+
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = dict(labels or {})
+        self.spans = []
+        self.depth = 0
+        self.started = time.time()
+        self.seconds = None
+
+    def rows(self):
+        """(section, milliseconds, share of the whole rerun) per span, sections indented by depth"""
+        total = self.seconds or sum(seconds for _, depth, seconds in self.spans if depth == 0) or 1
+        return [('\u2003' * depth + name, seconds * 1000, seconds / total) for name, depth, seconds in self.spans]
+
+    def to_dict(self):
+        return {
+            'time': self.started,
+            'trace': self.name,
+            **self.labels,
+            'total_ms': round(self.seconds * 1000, 3),
+            'spans': [{'name': name, 'depth': depth, 'ms': round(seconds * 1000, 3)}
+                      for name, depth, seconds in self.spans],
+        }
+
+
+@contextmanager
+def span(name):
+    """Time a section into the current trace, if there is one"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    record = [name, trace.depth, 0.0]
+    trace.spans.append(record)
+    trace.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record[2] = time.perf_counter() - start
+        trace.depth -= 1
+
+
+def timed(function=None, name=None):
+    """Decorator timing every call as a span, named after the function unless ``name`` is given"""
+    if function is None:
+        return functools.partial(timed, name=name)
+    label = name or function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return function(*args, **kwargs)
+        with span(label):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def tracing(name, exporters=(), **labels):
+    """Record every span inside the block into a new Trace, then hand it to the exporters"""
+    trace = Trace(name, labels)
+    token = _current.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.seconds = time.perf_counter() - start
+        _current.reset(token)
+        for exporter in exporters:
+            exporter.export(trace)
+
+
+class JsonlExporter:
+    """Appends each trace as one JSON line"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict(), separators=(',', ':'), default=str) + '\n'
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+class PrometheusExporter:
+    """Per-span latency histograms of every trace so far, rewritten as a Prometheus text file
+
+    The file is replaced atomically after each trace, so a node_exporter
+    textfile collector or a scraper never reads half of it. Span names are
+    the labels; they carry pages and chart names but never selections, so
+    the number of series stays bounded.
+    """
+
+    def __init__(self, path, buckets=BUCKETS):
+        self.path = path
+        self.buckets = tuple(buckets)
+        # span name -> [bucket counts..., sum, count]
+        self.series = {}
+        self.traces = 0
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        series = self.series.setdefault(name, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                series[i] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+    def export(self, trace):
+        with self._lock:
+            self.traces += 1
+            self.observe(trace.name, trace.seconds)
+            for name, _, seconds in trace.spans:
+                self.observe(name, seconds)
+            text = self.render()
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, self.path)
+
+    def render(self):
+        lines = [
+            '# HELP dashboard_traces_total Dashboard reruns traced by this process.',
+            '# TYPE dashboard_traces_total counter',
+            f'dashboard_traces_total {self.traces}',
+            '# HELP dashboard_span_seconds Time spent in each instrumented section.',
+            '# TYPE dashboard_span_seconds histogram',
+        ]
+        for name, series in sorted(self.series.items()):
+            label = name.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'dashboard_span_seconds_bucket{{span="{label}",le="{bound:g}"}} {count}')
+            lines.append(f'dashboard_span_seconds_bucket{{span="{label}",le="+Inf"}} {series[-1]}')
+            lines.append(f'dashboard_span_seconds_sum{{span="{label}"}} {series[-2]:.6f}')
+            lines.append(f'dashboard_span_seconds_count{{span="{label}"}} {series[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+# Exporters live here rather than in the dashboard script, which Streamlit re-runs on every interaction
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def exporters_from_env():
+    """Exporters named by DASHBOARD_METRICS_JSONL and DASHBOARD_METRICS_PROM, one of each per path
+
+    ``{pid}`` in a path is replaced by the process ID, so several server
+    processes can keep separate Prometheus files.
+    """
+    configured = []
+    with _exporters_lock:
+        for variable, kind in (('DASHBOARD_METRICS_JSONL', JsonlExporter),
+                               ('DASHBOARD_METRICS_PROM', PrometheusExporter)):
+            path = os.environ.get(variable)
+            if not path:
+                continue
+            path = path.format(pid=os.getpid())
+            if (kind, path) not in _exporters:
+                _exporters[kind, path] = kind(path)
+            configured.append(_exporters[kind, path])
+    return configured
@@ -0,0 +1,458 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.colors import qualitative, sequential
+
+# Figures of every dashboard page, built from the StudentAnalytics page methods'
+# output without Streamlit, so the dashboard and batch reports share them.
+# plotly.express is imported inside the figures that use it: it is the slowest
+# import of the dashboard, and the Overview and Student pages never need it.
+
+
+def _plain_groups(frame, columns):
+    """Frame with its categorical ``columns`` as plain values
+
+    plotly.express groups by its colour and axis columns itself, and pandas
+    warns about ``observed=`` on every groupby of a categorical. Traces
+    follow the order values appear in either way.
+    """
+    categorical = [column for column in columns if isinstance(frame[column].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return frame
+    return frame.astype({column: object for column in categorical})
+
+
+def histogram_chart(analytics, metric, nbins, label, rows=None, classes=None):
+    """Histogram of raw rows, or pre-binned from the cube when there are no rows"""
+    if rows is not None:
+        fig = go.Figure(go.Histogram(x=rows, nbinsx=nbins, marker_color='#1f77b4'))
+        fig.update_layout(xaxis_title=label, yaxis_title='count')
+        return fig
+    bins = analytics.score_histogram(metric, nbins, classes=classes)
+    fig = go.Figure(go.Bar(
+        x=bins['center'],
+        y=bins['count'],
+        width=bins['end'] - bins['start'],
+        marker_color='#1f77b4'
+    ))
+    fig.update_layout(xaxis_title=label, yaxis_title='count', bargap=0)
+    return fig
+
+
+def box_chart(box, label, rows=None):
+    """Box plot of raw rows, or drawn from precomputed quartiles when there are no rows"""
+    if rows is not None:
+        import plotly.express as px
+
+        return px.box(
+            y=rows,
+            labels={'y': label},
+            color_discrete_sequence=['#1f77b4']
+        )
+    fig = go.Figure(go.Box(
+        name=label,
+        q1=[box['q1']],
+        median=[box['median']],
+        q3=[box['q3']],
+        lowerfence=[box['lowerfence']],
+        upperfence=[box['upperfence']],
+        mean=[box['mean']],
+        marker_color='#1f77b4'
+    ))
+    fig.update_layout(yaxis_title=label)
+    return fig
+
+
+def grouped_box_chart(boxes, rows, by, metric, label, **kwargs):
+    """One box per class or gender, from raw rows or from precomputed quartiles"""
+    if rows is not None:
+        import plotly.express as px
+
+        return px.box(_plain_groups(rows, [by]), x=by, y=metric, color=by, labels={metric: label}, **kwargs)
+    fig = go.Figure()
+    colors = qualitative.Plotly
+    for i, (group, box) in enumerate(boxes.iterrows()):
+        fig.add_trace(go.Box(
+            name=str(group),
+            x=[str(group)],
+            q1=[box['q1']],
+            median=[box['median']],
+            q3=[box['q3']],
+            lowerfence=[box['lowerfence']],
+            upperfence=[box['upperfence']],
+            mean=[box['mean']],
+            marker_color=colors[i % len(colors)]
+        ))
+    fig.update_layout(xaxis_title=by, yaxis_title=label, title=kwargs.get('title'))
+    return fig
+
+
+def attendance_chart(report):
+    """Attendance vs score: every student, or a density grid with sampled points above the row threshold
+
+    The trendline is the closed-form least-squares fit from the report.
+    """
+    if report['density'] is not None:
+        grid, edges = report['density']
+        centers = (edges[:-1] + edges[1:]) / 2
+        fig = go.Figure(go.Heatmap(x=centers, y=centers, z=grid.T, colorscale='Blues',
+                                   colorbar=dict(title='Students')))
+        attended = centers[grid.sum(axis=1) > 0]
+        line_x = np.array([attended.min(), attended.max()]) if len(attended) else np.array([])
+        sample = report['sample']
+        if sample is not None:
+            fig.add_trace(go.Scatter(
+                x=sample['Attendance'], y=sample['OverallPercentage'], mode='markers', name='Sampled students',
+                marker=dict(size=4, color='#ff7f0e', opacity=0.6),
+                customdata=sample[['Name', 'StudentID']].astype(str).to_numpy(),
+                hovertemplate='%{customdata[0]} (%{customdata[1]})<br>Attendance %{x}<br>Overall %{y}<extra></extra>'
+            ))
+        fig.update_layout(xaxis_title='Attendance (%)', yaxis_title='Overall Percentage (%)')
+    else:
+        import plotly.express as px
+
+        class_df = report['students']
+        fig = px.scatter(
+            _plain_groups(class_df, ['Grade']),
+            x='Attendance',
+            y='OverallPercentage',
+            color='Grade',
+            hover_data=['Name', 'StudentID'],
+            labels={'Attendance': 'Attendance (%)', 'OverallPercentage': 'Overall Percentage (%)'}
+        )
+        attendance = class_df['Attendance'].dropna()
+        line_x = np.array([attendance.min(), attendance.max()]) if len(attendance) else np.array([])
+    fit = report['fit']
+    if len(line_x) and not np.isnan(fit['slope']):
+        fig.add_trace(go.Scatter(x=line_x, y=fit['intercept'] + fit['slope'] * line_x,
+                                 mode='lines', name='OLS trendline', line_color='red'))
+    return fig
+
+
+def colored_bar_chart(values, x_label, y_label, colorscale):
+    """Bars coloured by their own height, as px.bar(color=...) draws them"""
+    return go.Figure(
+        go.Bar(
+            x=values.index,
+            y=values.values,
+            marker=dict(color=values.values, coloraxis='coloraxis'),
+            hovertemplate=f'{x_label}=%{{x}}<br>{y_label}=%{{y}}<extra></extra>'
+        ),
+        layout=dict(xaxis_title=x_label, yaxis_title=y_label,
+                    coloraxis=dict(colorscale=colorscale, colorbar=dict(title=y_label)))
+    )
+
+
+def donut_chart(counts, colors):
+    return go.Figure(go.Pie(values=counts.values, labels=counts.index, hole=0.4, marker=dict(colors=colors)))
+
+
+# ==================== OVERVIEW ====================
+
+def overview_grades_figure(data):
+    fig = colored_bar_chart(data['grade_counts'], 'Grade', 'Number of Students', 'Blues')
+    fig.update_layout(showlegend=False, height=400)
+    return fig
+
+
+def overview_performance_figure(analytics, data):
+    fig = histogram_chart(analytics, 'OverallPercentage', 20, 'Overall Percentage', rows=data['performance'])
+    fig.update_layout(height=400)
+    return fig
+
+
+def overview_classes_figure(data):
+    fig = colored_bar_chart(data['class_performance'], 'Class', 'Average Performance (%)', 'Viridis')
+    fig.update_layout(showlegend=False, height=400)
+    return fig
+
+
+def overview_genders_figure(data):
+    fig = donut_chart(data['gender_counts'], ['#1f77b4', '#ff7f0e'])
+    fig.update_layout(height=400)
+    return fig
+
+
+def overview_subjects_figure(data):
+    fig = colored_bar_chart(data['subject_averages'], 'Subject', 'Average Score', 'RdYlGn')
+    fig.update_layout(showlegend=False, height=400)
+    return fig
+
+
+# ==================== STUDENT ANALYSIS ====================
+
+def student_scores_figure(profile):
+    """Subject scores of one student against their overall percentage"""
+    subject_scores = profile['subject_scores']
+    overall = profile['student']['OverallPercentage']
+    # Built in one go with graph_objects: batch reports draw this once per student,
+    # and px.bar plus add_hline cost several times as much
+    return go.Figure(
+        go.Bar(
+            x=subject_scores['Subject'],
+            y=subject_scores['Score'],
+            marker=dict(color=subject_scores['Score'], coloraxis='coloraxis'),
+            hovertemplate='Subject=%{x}<br>Score (%)=%{y}<extra></extra>'
+        ),
+        layout=dict(
+            xaxis_title='Subject',
+            yaxis_title='Score (%)',
+            coloraxis=dict(colorscale='RdYlGn', colorbar=dict(title='Score (%)')),
+            shapes=[dict(type='line', xref='x domain', x0=0, x1=1, y0=overall, y1=overall,
+                         line=dict(dash='dash', color='red'))],
+            annotations=[dict(xref='x domain', x=1, y=overall, text='Overall Average', showarrow=False,
+                              xanchor='right', yanchor='bottom')],
+            height=400,
+            showlegend=False
+        )
+    )
+
+
+def student_radar_figure(profile, subjects):
+    """One student's subject scores over their class averages"""
+    fig = go.Figure()
+
+    fig.add_trace(go.Scatterpolar(
+        r=profile['scores'],
+        theta=subjects,
+        fill='toself',
+        name='Student',
+        line_color='#1f77b4'
+    ))
+
+    # Add class average
+    fig.add_trace(go.Scatterpolar(
+        r=profile['class_subject_averages'].tolist(),
+        theta=subjects,
+        fill='toself',
+        name='Class Average',
+        line_color='orange',
+        opacity=0.5
+    ))
+
+    fig.update_layout(
+        polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
+        showlegend=True,
+        height=400
+    )
+    return fig
+
+
+def student_peers_figure(profile, peers, subjects):
+    """One student's subject scores next to the average of the students most like them"""
+    fig = go.Figure([
+        go.Bar(x=subjects, y=profile['scores'], name='Student', marker_color='#1f77b4'),
+        go.Bar(x=subjects, y=peers[subjects].mean().round(2).tolist(), name='Similar Students',
+               marker_color='lightslategray'),
+    ])
+    fig.update_layout(barmode='group', xaxis_title='Subject', yaxis_title='Score (%)', height=400)
+    return fig
+
+
+# ==================== CLASS ANALYSIS ====================
+
+def class_distribution_figure(analytics, report, class_name):
+    """Overall percentage histogram of a class with its mean and median marked"""
+    stats = report['stats']
+    fig = histogram_chart(
+        analytics, 'OverallPercentage', 15, 'Overall Percentage',
+        rows=report['scores'],
+        classes=[class_name]
+    )
+    fig.add_vline(x=stats['mean_score'], line_dash="dash", 
+                 line_color="red", annotation_text="Mean")
+    fig.add_vline(x=stats['median_score'], line_dash="dash", 
+                 line_color="green", annotation_text="Median")
+    fig.update_layout(height=400)
+    return fig
+
+
+def class_grades_figure(report):
+    fig = donut_chart(report['grade_counts'], sequential.Blues_r)
+    fig.update_layout(height=400)
+    return fig
+
+
+def class_subjects_figure(report):
+    subject_df = report['subject_stats']
+    fig = go.Figure()
+    fig.add_trace(go.Bar(name='Mean', x=subject_df['Subject'], y=subject_df['Mean']))
+    fig.add_trace(go.Bar(name='Median', x=subject_df['Subject'], y=subject_df['Median']))
+    fig.update_layout(barmode='group', height=400)
+    return fig
+
+
+def class_attendance_figure(report):
+    fig = attendance_chart(report)
+    fig.update_layout(height=500)
+    return fig
+
+
+# ==================== SUBJECT ANALYSIS ====================
+
+def subject_distribution_figure(analytics, report, subject):
+    fig = histogram_chart(analytics, subject, 20, f'{subject} Score', rows=report['scores'])
+    fig.add_vline(x=report['summary']['mean'], line_dash="dash", 
+                 line_color="red", annotation_text="Mean")
+    fig.update_layout(height=400)
+    return fig
+
+
+def subject_box_figure(report, subject):
+    fig = box_chart(report['box'], f'{subject} Score', rows=report['scores'])
+    fig.update_layout(height=400)
+    return fig
+
+
+def subject_by_class_figure(report):
+    class_subject_means = report['by_class']
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        name='Mean',
+        x=class_subject_means['Class'],
+        y=class_subject_means['mean'],
+        error_y=dict(type='data', array=class_subject_means['std'])
+    ))
+    fig.update_layout(height=400)
+    return fig
+
+
+# ==================== COMPARATIVE ANALYSIS ====================
+
+def comparison_boxes_figure(comparison):
+    fig = grouped_box_chart(
+        comparison['boxes'], comparison['scores'], 'Class', 'OverallPercentage',
+        'Overall Percentage (%)', title="Performance Distribution by Class"
+    )
+    fig.update_layout(height=500)
+    return fig
+
+
+def comparison_subjects_figure(comparison):
+    import plotly.express as px
+
+    fig = px.bar(
+        comparison['subject_long'],
+        x='Subject',
+        y='Average Score',
+        color='Class',
+        barmode='group',
+        labels={'Average Score': 'Average Score (%)'}
+    )
+    fig.update_layout(height=500)
+    return fig
+
+
+def comparison_heatmap_figure(comparison):
+    import plotly.express as px
+
+    fig = px.imshow(
+        comparison['subject_averages'],
+        labels=dict(x="Subject", y="Class", color="Average Score"),
+        color_continuous_scale='RdYlGn',
+        aspect="auto"
+    )
+    fig.update_layout(height=400)
+    return fig
+
+
+def correlation_by_class_figure(correlations):
+    """Each class's correlation of every variable with OverallPercentage, on a -1 to 1 scale"""
+    import plotly.express as px
+
+    fig = px.imshow(
+        correlations['by_class'],
+        labels=dict(x="Variable", y="Class", color="r"),
+        color_continuous_scale='RdBu',
+        zmin=-1,
+        zmax=1,
+        aspect="auto",
+        text_auto='.2f'
+    )
+    fig.update_layout(height=400, title="Correlation with Overall Percentage")
+    return fig
+
+
+def correlation_matrix_figure(correlations):
+    """Pairwise correlations of every variable across the selected classes"""
+    import plotly.express as px
+
+    fig = px.imshow(
+        correlations['matrix'],
+        color_continuous_scale='RdBu',
+        zmin=-1,
+        zmax=1,
+        aspect="auto",
+        text_auto='.2f'
+    )
+    fig.update_layout(height=500, title="Correlation Matrix of the Selected Classes")
+    return fig
+
+
+def gender_boxes_figure(gender):
+    fig = grouped_box_chart(
+        gender['boxes'], gender['scores'], 'Gender', 'OverallPercentage', 'Overall Percentage (%)'
+    )
+    fig.update_layout(height=400, showlegend=False)
+    return fig
+
+
+def gender_subjects_figure(gender):
+    import plotly.express as px
+
+    fig = px.bar(
+        gender['subject_long'],
+        x='Subject',
+        y='Average Score',
+        color='Gender',
+        barmode='group',
+        labels={'Average Score': 'Average Score (%)'},
+        title="Subject-wise Performance by Gender"
+    )
+    fig.update_layout(height=400)
+    return fig
+
+
+# ==================== AT-RISK STUDENTS ====================
+
+def risk_classes_figure(data):
+    """Share of each class on the watchlist"""
+    fig = colored_bar_chart(data['by_class']['Share (%)'].round(2), 'Class', 'At Risk (%)', 'Reds')
+    fig.update_layout(showlegend=False, height=400)
+    return fig
+
+
+def risk_factors_figure(data):
+    """Watchlisted students by the factor adding most to their risk"""
+    fig = donut_chart(data['by_factor'], sequential.Reds_r)
+    fig.update_layout(height=400)
+    return fig
+
+
+# ==================== TERM TRENDS ====================
+
+def student_terms_figure(trajectory, subjects):
+    """One student's overall percentage and subject scores over the terms"""
+    fig = go.Figure()
+    for subject in subjects:
+        fig.add_trace(go.Scatter(x=trajectory.index, y=trajectory[subject], mode='lines+markers', name=subject,
+                                 line=dict(width=1), opacity=0.6))
+    fig.add_trace(go.Scatter(x=trajectory.index, y=trajectory['OverallPercentage'], mode='lines+markers',
+                             name='Overall', line=dict(color='#1f77b4', width=4)))
+    fig.update_layout(xaxis=dict(title='Term', type='category'), yaxis_title='Score (%)', height=400)
+    return fig
+
+
+def class_terms_figure(report, class_name, subjects):
+    """A class's average over the terms against the school's; subject lines start hidden"""
+    trend = report['trend']
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=trend.index, y=trend['OverallPercentage'], mode='lines+markers',
+                             name=f'{class_name} overall', line=dict(color='#1f77b4', width=4)))
+    fig.add_trace(go.Scatter(x=report['school'].index, y=report['school'], mode='lines+markers',
+                             name='School overall', line=dict(color='gray', dash='dash')))
+    for subject in subjects:
+        fig.add_trace(go.Scatter(x=trend.index, y=trend[subject], mode='lines+markers', name=subject,
+                                 visible='legendonly'))
+    fig.update_layout(xaxis=dict(title='Term', type='category'), yaxis_title='Average Score (%)', height=400)
+    return fig
@@ -0,0 +1,206 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Students per leaf of the tree, at most; each leaf is a box the search can rule out whole
+LEAF_SIZE = 256
+# Leaves scored against a query with one matrix product
+BLOCK_LEAVES = 16
+# Nearest leaves put in order first; most queries stop within them, so the rest are rarely sorted
+FIRST_LEAVES = 64
+# Queries handed to a worker thread at a time in batch mode
+QUERY_BLOCK = 256
+# Changed students held aside, and scanned by every query, before the tree is rebuilt
+MIN_PENDING = 4096
+
+
+def _split(columns, leaf_size):
+    """Tree order of the rows and where each leaf starts, from median splits along each box's widest side
+
+    A node's box follows from its parent's split, so only the split column
+    is read at each step. Leaves come out left to right, so they are
+    contiguous runs of the order.
+    """
+    n = columns.shape[1]
+    order = np.arange(n)
+    starts = []
+    stack = [(0, n, columns.min(axis=1), columns.max(axis=1))] if n else []
+    while stack:
+        start, stop, lo, hi = stack.pop()
+        if stop - start <= leaf_size:
+            starts.append(start)
+            continue
+        dim = int(np.argmax(hi - lo))
+        rows = order[start:stop]
+        keys = columns[dim, rows]
+        middle = (stop - start) // 2
+        part = np.argpartition(keys, middle)
+        order[start:stop] = rows[part]
+        split = keys[part[middle]]
+        left_hi, right_lo = hi.copy(), lo.copy()
+        left_hi[dim] = right_lo[dim] = split
+        stack += [(start + middle, stop, right_lo, hi), (start, start + middle, lo, left_hi)]
+    return order, np.array(starts, dtype=np.int64)
+
+
+def _nearest_first(lower):
+    """Blocks of BLOCK_LEAVES leaves in order of lower bound, sorting past the first FIRST_LEAVES only if asked"""
+    first = min(FIRST_LEAVES, len(lower))
+    part = np.argpartition(lower, first - 1) if 0 < first < len(lower) else np.arange(len(lower))
+    for stage in (part[:first], part[first:]):
+        stage = stage[np.argsort(lower[stage])]
+        for i in range(0, len(stage), BLOCK_LEAVES):
+            yield stage[i:i + BLOCK_LEAVES]
+
+
+class PeerIndex:
+    """Nearest neighbours of every student by subject scores, as Euclidean distance
+
+    Scores are held centred, as float32, and split into leaves of at most
+    LEAF_SIZE students by repeated median splits, so each leaf is a small
+    box. A query takes the leaves nearest box first, BLOCK_LEAVES at a
+    time, scores each block with one matrix product
+    (|x|² - 2 x·q + |q|²), and stops once no box left can hold anything
+    closer than its k-th best so far. The k found are re-ranked on exact
+    distances, ties by row. Missing scores count as the subject's mean.
+
+    Upserts mask the changed students out of the tree and keep their new
+    scores aside, where every query scans them, until enough pile up to
+    rebuild.
+    """
+
+    def __init__(self, columns, center, order, values, norms, starts, pending_rows=None, pending_values=None):
+        self.columns = list(columns)
+        self.center = center
+        # Tree slot -> row position, and each slot's centred scores and squared norm (inf when masked)
+        self.order = order
+        self.values = values
+        self.norms = norms
+        self.starts = starts
+        self.stops = np.append(starts[1:], len(order)).astype(np.int64)
+        self.lo = np.minimum.reduceat(values, starts) if len(starts) else np.empty((0, values.shape[1]))
+        self.hi = np.maximum.reduceat(values, starts) if len(starts) else np.empty((0, values.shape[1]))
+        self.slots = np.empty(len(order), dtype=np.int64)
+        self.slots[order] = np.arange(len(order))
+        self.pending_rows = np.empty(0, dtype=np.int64) if pending_rows is None else pending_rows
+        self.pending_values = (np.empty((0, values.shape[1]), dtype=np.float32)
+                               if pending_values is None else pending_values)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame of just the score columns"""
+        scores = df.to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid='ignore'):
+            center = np.nan_to_num(np.nanmean(scores, axis=0)) if len(scores) else np.zeros(scores.shape[1])
+        return cls._build(df.columns, center, cls._centred(scores, center))
+
+    @classmethod
+    def _build(cls, columns, center, values):
+        order, starts = _split(np.ascontiguousarray(values.T), LEAF_SIZE)
+        values = values[order]
+        norms = np.einsum('ij,ij->i', values, values)
+        return cls(columns, center, order, values, norms, starts)
+
+    @staticmethod
+    def _centred(scores, center):
+        return np.where(np.isnan(scores), 0, scores - center).astype(np.float32)
+
+    def __len__(self):
+        return max(len(self.order), int(self.pending_rows.max()) + 1 if len(self.pending_rows) else 0)
+
+    def scores(self, rows):
+        """Centred scores of the given rows, as the index holds them"""
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.empty((len(rows), self.values.shape[1]), dtype=np.float32)
+        in_tree = rows < len(self.slots)
+        values[in_tree] = self.values[self.slots[rows[in_tree]]]
+        pending = np.isin(rows, self.pending_rows)
+        if pending.any():
+            sorter = np.argsort(self.pending_rows)
+            found = sorter[np.searchsorted(self.pending_rows, rows[pending], sorter=sorter)]
+            values[pending] = self.pending_values[found]
+        return values
+
+    def _lower_bounds(self, queries):
+        """Squared distance from each query to each leaf's box, a lower bound on its students' distances"""
+        gap = np.maximum(self.lo[None] - queries[:, None], 0) + np.maximum(queries[:, None] - self.hi[None], 0)
+        return np.einsum('ijk,ijk->ij', gap, gap)
+
+    def _search(self, query, lower, k):
+        """Rows of the k nearest to one centred query, in no particular order"""
+        query_norm = float(query @ query)
+        best = self.pending_values - query
+        best_distances = np.einsum('ij,ij->i', best, best)
+        best_rows = self.pending_rows
+        kth = np.inf
+        for leaves in _nearest_first(lower):
+            if lower[leaves[0]] > kth:
+                break
+            slots = np.concatenate([np.arange(self.starts[leaf], self.stops[leaf]) for leaf in leaves])
+            distances = self.norms[slots] - 2 * (self.values[slots] @ query) + query_norm
+            best_distances = np.concatenate([best_distances, distances])
+            best_rows = np.concatenate([best_rows, self.order[slots]])
+            if len(best_distances) > k:
+                kept = np.argpartition(best_distances, k - 1)[:k]
+                best_distances, best_rows = best_distances[kept], best_rows[kept]
+            if len(best_distances) == k:
+                kth = best_distances.max()
+        return best_rows[np.isfinite(best_distances)]
+
+    def _exact(self, query, rows):
+        """Rows ordered by exact distance to a query, ties by row, with the distances"""
+        difference = self.scores(rows).astype(np.float64) - query
+        distances = np.sqrt(np.einsum('ij,ij->i', difference, difference))
+        order = np.lexsort((rows, distances))
+        return rows[order], distances[order]
+
+    def _neighbours(self, queries, k, exclude):
+        found = []
+        for query, row in zip(queries, exclude):
+            rows, distances = self._exact(query, self._search(query, self._lower_bounds(query[None])[0], k + 1))
+            keep = rows != row
+            found.append((rows[keep][:k], distances[keep][:k]))
+        return found
+
+    def nearest(self, rows, k, workers=1):
+        """The k students nearest each given student (itself left out): a list of (rows, distances)
+
+        Distances are in score points over all subjects. With ``workers`` > 1
+        the queries are spread over a thread pool QUERY_BLOCK at a time: the
+        matrix products and partitions release the GIL, and the threads share
+        the one index.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        queries = self.scores(rows)
+        if workers <= 1 or len(rows) <= QUERY_BLOCK:
+            return self._neighbours(queries, k, rows)
+        chunks = range(0, len(rows), QUERY_BLOCK)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = pool.map(lambda start: self._neighbours(queries[start:start + QUERY_BLOCK], k,
+                                                            rows[start:start + QUERY_BLOCK]), chunks)
+            return [found for part in parts for found in part]
+
+    def updated(self, delta):
+        """Index after an upsert: changed students masked out of the tree and held aside with their new scores"""
+        rows = delta.after.index.to_numpy().astype(np.int64)
+        values = self._centred(delta.after[self.columns].to_numpy(dtype=np.float64, na_value=np.nan), self.center)
+        norms = self.norms.copy()
+        in_tree = rows < len(self.slots)
+        norms[self.slots[rows[in_tree]]] = np.inf
+
+        kept = ~np.isin(self.pending_rows, rows)
+        pending_rows = np.concatenate([self.pending_rows[kept], rows])
+        pending_values = np.concatenate([self.pending_values[kept], values])
+        if len(pending_rows) > max(MIN_PENDING, len(self.order) // 16):
+            return self._rebuilt(pending_rows, pending_values)
+        index = copy.copy(self)
+        index.norms, index.pending_rows, index.pending_values = norms, pending_rows, pending_values
+        return index
+
+    def _rebuilt(self, pending_rows, pending_values):
+        values = np.zeros((max(len(self.order), int(pending_rows.max()) + 1), self.values.shape[1]),
+                          dtype=np.float32)
+        values[self.order] = self.values
+        values[pending_rows] = pending_values
+        return PeerIndex._build(self.columns, self.center, values)
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+
+from analytics import StudentAnalytics
+from shared_store import default_shared_path, write_shared
+
+# Seconds between checks of the source for a new version
+DEFAULT_INTERVAL = 2.0
+
+
+class Publisher:
+    """One loader for many worker processes: reads the student data and publishes it, prebuilt, to share
+
+    Each publish writes the columns and every array-backed structure the
+    pages use (statistics cube, rankings, correlations, risk index, peer
+    index, filter bitmaps) under ``path``. Workers point DASHBOARD_DATA at
+    ``path``: load_students maps the published files instead of loading
+    the source, so every worker reads the same pages and memory stays flat
+    as workers are added. Workers see a new version on their next
+    load_students call, which checks the published manifest as it would
+    a source file. The StudentID lookup is left out; its hash table is
+    built in each process anyway.
+    """
+
+    def __init__(self, source, path=None):
+        self.source = source
+        self.path = path or default_shared_path(source)
+        self.analytics = StudentAnalytics(source)
+        self.published = None
+        # Columns upserts have touched since the last publish
+        self.changed = set()
+
+    def structures(self):
+        """Structures of the current snapshot to publish, under the names StudentData derives them by"""
+        analytics = self.analytics
+        data = analytics.source_data
+        return {
+            'classes': data.classes,
+            'bitmaps': data.bitmaps,
+            'stats_cube': analytics.cube,
+            'rankings': analytics.rankings,
+            'correlations': analytics.correlations,
+            'risk': analytics.risk,
+            'peers': analytics.peers,
+        }
+
+    def refresh(self):
+        """Publish the latest snapshot of the source unless it already is; True when it was published"""
+        self.analytics.load_data()
+        data = self.analytics.source_data
+        if data is self.published:
+            return False
+        # After a new source version every column is new; after upserts, just the ones they touched
+        same_source = self.published is not None and self.published.base_version == data.base_version
+        write_shared(data, self.path, self.structures(), changed=self.changed if same_source else None)
+        self.published = data
+        self.changed = set()
+        return True
+
+    def upsert(self, batch):
+        """Replace or append students, as StudentAnalytics.upsert does, and publish the result"""
+        self.analytics.upsert(batch)
+        # Students are matched on StudentID, so it only changes by appending, which rewrites every column
+        self.changed.update(batch.columns.drop('StudentID', errors='ignore'))
+        self.refresh()
+
+    def run(self, interval=DEFAULT_INTERVAL, log=print):
+        """Publish now, then again whenever the source changes"""
+        while True:
+            start = time.perf_counter()
+            if self.refresh():
+                log(f"✓ Published {self.analytics.data_version} to {self.path}/ "
+                    f"in {time.perf_counter() - start:.1f}s")
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Publish the student data to shared memory for worker processes')
+    parser.add_argument('--data', default=os.environ.get('DASHBOARD_DATA', 'students_data.csv'),
+                        help='student data file (default: %(default)s)')
+    parser.add_argument('--output', help='published snapshot directory, e.g. under /dev/shm '
+                                         '(default: next to the data file, with a .shared suffix)')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help='seconds between checks for a new version (default: %(default)s)')
+    parser.add_argument('--once', action='store_true', help='publish once and exit')
+    args = parser.parse_args(argv)
+
+    publisher = Publisher(args.data, args.output)
+    if args.once:
+        publisher.refresh()
+        print(f"✓ Published {publisher.analytics.data_version} to {publisher.path}/")
+        return
+    try:
+        publisher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
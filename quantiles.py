@@ -0,0 +1,147 @@
+import numpy as np
+
+# Box plot whiskers reach the furthest values within this many IQRs of the quartiles
+WHISKER_IQR = 1.5
+
+
+def _box(quantile, values_within):
+    """Quartiles and Tukey whiskers from a quantile function and a range lookup"""
+    q1, median, q3 = quantile([0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    lower, upper = values_within(q1 - WHISKER_IQR * iqr, q3 + WHISKER_IQR * iqr)
+    return {'q1': q1, 'median': median, 'q3': q3, 'lowerfence': lower, 'upperfence': upper}
+
+
+def _percentile(below, equal, count):
+    """Mid-rank percentile: values below plus half of the ties, as a percentage"""
+    return (below + equal / 2) / count * 100 if count else np.nan
+
+
+class SortedValues:
+    """Exact quantiles and ranks over every value of a group, kept sorted
+
+    For groups small enough to hold in full. Missing values are dropped.
+    Insertions and removals return a new object and cost one pass over the
+    group, so upserts never re-sort it.
+    """
+
+    def __init__(self, values, presorted=False):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.values = values if presorted else np.sort(values)
+
+    @property
+    def count(self):
+        return len(self.values)
+
+    def quantile(self, qs):
+        """Quantiles with pandas' linear interpolation between ranks"""
+        if not self.count:
+            return np.full(len(qs), np.nan)
+        return np.quantile(self.values, qs)
+
+    def box_stats(self):
+        if not self.count:
+            return None
+
+        def values_within(low, high):
+            inside = self.values[np.searchsorted(self.values, low, side='left'):
+                                 np.searchsorted(self.values, high, side='right')]
+            return inside[0], inside[-1]
+        return _box(self.quantile, values_within)
+
+    def counts_around(self, value):
+        """Number of values strictly below and equal to ``value``"""
+        below = np.searchsorted(self.values, value, side='left')
+        return int(below), int(np.searchsorted(self.values, value, side='right') - below)
+
+    def rank(self, value):
+        """1-based rank of a value from the top (ties share the best rank)"""
+        return self.count - int(np.searchsorted(self.values, value, side='right')) + 1
+
+    def percentile_rank(self, value):
+        return _percentile(*self.counts_around(value), self.count)
+
+    def insert(self, values):
+        added = np.sort(np.asarray(values, dtype=np.float64))
+        added = added[~np.isnan(added)]
+        return SortedValues(np.insert(self.values, np.searchsorted(self.values, added), added), presorted=True)
+
+    def remove(self, values):
+        """Copy with one occurrence of each value taken out"""
+        removed = np.sort(np.asarray(values, dtype=np.float64))
+        removed = removed[~np.isnan(removed)]
+        # Equal removed values take consecutive slots of the run they belong to
+        offsets = np.arange(len(removed)) - np.searchsorted(removed, removed, side='left')
+        return SortedValues(np.delete(self.values, np.searchsorted(self.values, removed, side='left') + offsets),
+                            presorted=True)
+
+    def merge(self, other):
+        return self.insert(other.values)
+
+
+class GridHistogram:
+    """Counts on a fixed grid of ``bins_per_point`` bins per point, starting at 0
+
+    A bounded-size quantile sketch: two histograms merge by adding their
+    counts and rows are removed by subtracting them. Values that sit on the
+    grid (scores stored to two decimals, with 100 bins per point) give
+    exactly the quantiles and ranks of the raw values; anything else is
+    resolved to the nearest bin.
+    """
+
+    def __init__(self, counts, bins_per_point):
+        self.counts = np.asarray(counts)
+        self.bins_per_point = bins_per_point
+
+    @classmethod
+    def from_values(cls, values, bins_per_point, high=100):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        bins = np.clip(np.rint(values * bins_per_point), 0, high * bins_per_point).astype(np.int64)
+        return cls(np.bincount(bins, minlength=high * bins_per_point + 1), bins_per_point)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def _bin(self, value):
+        return int(np.clip(np.rint(value * self.bins_per_point), 0, len(self.counts) - 1))
+
+    def quantile(self, qs):
+        """Quantiles with pandas' linear interpolation between ranks"""
+        n = self.count
+        if n == 0:
+            return np.full(len(qs), np.nan)
+        cumulative = np.cumsum(self.counts)
+        positions = np.asarray(qs, dtype=np.float64) * (n - 1)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.minimum(lower + 1, n - 1)
+        lower_values = np.searchsorted(cumulative, lower, side='right') / self.bins_per_point
+        upper_values = np.searchsorted(cumulative, upper, side='right') / self.bins_per_point
+        return lower_values + (upper_values - lower_values) * (positions - lower)
+
+    def box_stats(self):
+        if not self.counts.any():
+            return None
+        present = np.flatnonzero(self.counts) / self.bins_per_point
+
+        def values_within(low, high):
+            inside = present[(present >= low) & (present <= high)]
+            return inside[0], inside[-1]
+        return _box(self.quantile, values_within)
+
+    def counts_around(self, value):
+        """Number of values strictly below and equal to ``value``'s bin"""
+        position = self._bin(value)
+        return int(self.counts[:position].sum()), int(self.counts[position])
+
+    def rank(self, value):
+        """1-based rank of a value from the top (ties share the best rank)"""
+        return int(self.counts[self._bin(value) + 1:].sum()) + 1
+
+    def percentile_rank(self, value):
+        return _percentile(*self.counts_around(value), self.count)
+
+    def merge(self, other):
+        return GridHistogram(self.counts + other.counts, self.bins_per_point)
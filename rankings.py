@@ -0,0 +1,170 @@
+import numpy as np
+
+
+def _score_order(scores, rows):
+    """Order of rows by (score, row)
+
+    Rows usually arrive ascending, as groupby indices do, and scores are
+    kept to two decimals; the order is then a stable sort of the scores in
+    hundredths, which as int16 keys NumPy runs as a radix sort. Anything
+    else falls back to a lexsort.
+    """
+    if len(rows) > 1 and (rows[1:] > rows[:-1]).all():
+        hundredths = np.rint(scores * 100)
+        if (np.abs(hundredths) < 2**15).all() and ((hundredths / 100).astype(np.float32) == scores).all():
+            return np.argsort(hundredths.astype(np.int16), kind='stable')
+    return np.lexsort((rows, scores))
+
+
+class RankedRows:
+    """Row positions of one group ordered by score, for top-N and bottom-N pages
+
+    Rows are kept ascending by (score, row); missing scores are dropped.
+    Bottom pages are plain slices. Top pages walk the same order backwards
+    with each run of tied scores kept in row order, so both directions
+    list ties the way ``nsmallest``/``nlargest`` do. Scores are held as
+    float32, which still tells apart every score stored to two decimals.
+    """
+
+    def __init__(self, scores, rows, presorted=False):
+        if not presorted:
+            scores = np.asarray(scores, dtype=np.float32)
+            # Row positions fit in int32: rosters that large are streamed, not ranked
+            rows = np.asarray(rows, dtype=np.int32)
+            valid = ~np.isnan(scores)
+            scores, rows = scores[valid], rows[valid]
+            order = _score_order(scores, rows)
+            scores, rows = scores[order], rows[order]
+        self.scores = scores
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def bottom(self, start, stop):
+        """Positions ``start:stop`` of the order from the lowest score up"""
+        return self.rows[start:stop].astype(np.int64)
+
+    def top(self, start, stop):
+        """Positions ``start:stop`` of the order from the highest score down, with their scores"""
+        n = len(self.rows)
+        i = np.arange(max(start, 0), min(stop, n))
+        values = self.scores[n - 1 - i]
+        # Rank i sits in its score's run [lo, hi), which the top order lists from n - hi on
+        lo = np.searchsorted(self.scores, values, side='left')
+        hi = np.searchsorted(self.scores, values, side='right')
+        return self.rows[lo + i - (n - hi)].astype(np.int64), values
+
+    def _slots(self, other):
+        """Where each of another (sorted) group's rows sits, or would sit, in this order"""
+        lo = np.searchsorted(self.scores, other.scores, side='left')
+        hi = np.searchsorted(self.scores, other.scores, side='right')
+        # Within a run of tied scores the rows are ascending
+        for i in np.flatnonzero(hi > lo):
+            lo[i] += np.searchsorted(self.rows[lo[i]:hi[i]], other.rows[i])
+        return lo
+
+    def remove(self, scores, rows):
+        """Copy without the given rows, found by their current scores"""
+        slots = self._slots(RankedRows(scores, rows))
+        return RankedRows(np.delete(self.scores, slots), np.delete(self.rows, slots), presorted=True)
+
+    def insert(self, scores, rows):
+        """Copy with rows added in place, without re-sorting the group"""
+        added = RankedRows(scores, rows)
+        slots = self._slots(added)
+        return RankedRows(np.insert(self.scores, slots, added.scores),
+                          np.insert(self.rows, slots, added.rows), presorted=True)
+
+
+class Rankings:
+    """Score order of every (class, metric) pair, from which leaderboards are sliced
+
+    School-wide pages merge the first rows of each class's order, so only
+    per-class orders are stored. Upserts move just the changed rows.
+    """
+
+    def __init__(self, groups, metrics):
+        self.groups = groups
+        self.metrics = list(metrics)
+
+    @classmethod
+    def from_frame(cls, df, metrics):
+        """Build the orders from a frame with a Class column and the metric columns"""
+        class_rows = df.groupby('Class', sort=False, observed=True).indices
+        groups = {}
+        for metric in metrics:
+            scores = df[metric].to_numpy(dtype=np.float64)
+            for class_name, rows in class_rows.items():
+                groups[metric, class_name] = RankedRows(scores[rows], rows)
+        return cls(groups, metrics)
+
+    def _classes(self, metric, class_name):
+        if class_name is not None:
+            group = self.groups.get((metric, class_name))
+            return [group] if group is not None else []
+        return [group for (group_metric, _), group in self.groups.items() if group_metric == metric]
+
+    def count(self, metric, class_name=None):
+        """Number of ranked students, in one class or school-wide"""
+        return sum(len(group) for group in self._classes(metric, class_name))
+
+    def page(self, metric, start, stop, class_name=None, bottom=False):
+        """Row positions ranked ``start:stop`` by a metric, best first unless ``bottom``"""
+        groups = self._classes(metric, class_name)
+        if len(groups) == 1:
+            group = groups[0]
+            return group.bottom(start, stop) if bottom else group.top(start, stop)[0]
+        if not groups:
+            return np.empty(0, dtype=np.int64)
+
+        # Any row on the page is within the first ``stop`` of its own class
+        if bottom:
+            picked = [(group.bottom(0, stop), group.scores[:stop]) for group in groups]
+        else:
+            picked = [group.top(0, stop) for group in groups]
+        rows = np.concatenate([rows for rows, _ in picked])
+        scores = np.concatenate([scores for _, scores in picked])
+        order = np.lexsort((rows, scores if bottom else -scores))
+        return rows[order[start:stop]]
+
+    def subset(self, positions):
+        """Rankings of just the rows at ``positions`` (ascending), renumbered 0..len(positions)-1
+
+        Renumbering keeps row order, so each class's order is filtered
+        rather than sorted again.
+        """
+        # New number of every old row, -1 for rows left out
+        size = max([int(group.rows.max()) + 1 for group in self.groups.values() if len(group)]
+                   + [int(positions[-1]) + 1 if len(positions) else 0])
+        renumbered = np.full(size, -1, dtype=np.int32)
+        renumbered[positions] = np.arange(len(positions), dtype=np.int32)
+        groups = {}
+        for key, group in self.groups.items():
+            rows = renumbered[group.rows]
+            kept = rows >= 0
+            groups[key] = RankedRows(group.scores[kept], rows[kept], presorted=True)
+        return Rankings(groups, self.metrics)
+
+    def regraded(self, data):
+        """Rankings of a regraded snapshot: only the OverallPercentage orders are sorted again"""
+        if 'OverallPercentage' not in self.metrics:
+            return self
+        groups = dict(self.groups)
+        scores = data.columns(['OverallPercentage'])['OverallPercentage'].to_numpy(dtype=np.float64)
+        for class_name, rows in data.index.class_rows.items():
+            groups['OverallPercentage', class_name] = RankedRows(scores[rows], rows)
+        return Rankings(groups, self.metrics)
+
+    def updated(self, delta):
+        """Rankings after an upsert; only the classes the batch touches are re-spliced"""
+        groups = dict(self.groups)
+        for metric in self.metrics:
+            for frame, removing in ((delta.before, True), (delta.after, False)):
+                scores = frame[metric].to_numpy(dtype=np.float64)
+                positions = frame.index.to_numpy()
+                for class_name, rows in frame.groupby('Class', sort=False, observed=True).indices.items():
+                    group = groups.get((metric, class_name), RankedRows([], []))
+                    change = group.remove if removing else group.insert
+                    groups[metric, class_name] = change(scores[rows], positions[rows])
+        return Rankings(groups, self.metrics)
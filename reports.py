@@ -0,0 +1,302 @@
+import argparse
+import html
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analytics import StudentAnalytics
+from chart_data import CHART_ROW_THRESHOLD
+from page_figures import (class_attendance_figure, class_distribution_figure, class_grades_figure,
+                          class_subjects_figure, student_radar_figure, student_scores_figure)
+
+# Reports handed to a worker at a time; each batch is one task and one progress update
+DEFAULT_BATCH_SIZE = 250
+PLOTLY_JS = 'plotly.min.js'
+REPORT_DIRS = {'student': 'students', 'class': 'classes'}
+
+# Subplot type each report figure needs when a PDF lays them out on one page
+_SUBPLOT_TYPES = {'pie': 'domain', 'scatterpolar': 'polar', 'table': 'table'}
+
+_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="../{plotly_js}"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2rem; color: #2c3e50; }}
+h1 {{ color: #1f77b4; }}
+table {{ border-collapse: collapse; margin: 0.5rem 0 1.5rem; }}
+th, td {{ border: 1px solid #ddd; padding: 4px 10px; }}
+.metrics td {{ text-align: right; }}
+.figures {{ display: flex; flex-wrap: wrap; }}
+.figures > div {{ flex: 1 1 480px; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+# Each worker process loads the roster once and keeps it for every batch it renders
+_analytics = None
+
+
+# ==================== REPORT CONTENT ====================
+
+def student_document(analytics, student_id, peers=None):
+    """Title, headline numbers, tables and figures of one student's report
+
+    ``peers`` is the student's table from StudentAnalytics.similar_students(),
+    when a whole batch's have been found together.
+    """
+    profile = analytics.student_profile(student_id)
+    if peers is None:
+        peers = analytics.similar_students([student_id])[student_id]
+    student = profile['student']
+    ranked = profile['ranked_subjects']
+    return {
+        'title': f"{student['Name']} ({student_id}) - Class {student['Class']}",
+        'metrics': {
+            'Overall %': f"{student['OverallPercentage']:.2f}%",
+            'Grade': student['Grade'],
+            'Class Rank': f"{profile['rank']}/{profile['total_in_class']}",
+            'vs Class Avg': f"{student['OverallPercentage'] - profile['class_average']:+.2f}%",
+            'Percentile Rank': (f"{profile['class_percentile']:.1f} in class, "
+                                f"{profile['school_percentile']:.1f} school-wide"),
+            'Attendance': f"{student['Attendance']:.1f}%",
+            'Top Subject': f"{ranked.index[0]} ({ranked.iloc[0]:.2f}%)",
+            'Needs Focus': f"{ranked.index[-1]} ({ranked.iloc[-1]:.2f}%)",
+        },
+        'tables': [
+            ('Statistical Summary', profile['summary'].round(2).to_frame('Value')),
+            ('Students With Similar Profiles',
+             peers[['StudentID', 'Name', 'Class', 'Score Gap', 'OverallPercentage', 'Grade']]),
+        ],
+        'figures': [
+            ('Subject-wise Performance', student_scores_figure(profile)),
+            ('Performance Radar Chart', student_radar_figure(profile, analytics.subjects)),
+        ],
+    }
+
+
+def class_document(analytics, class_name):
+    """Title, headline numbers, tables and figures of one class's report"""
+    report = analytics.class_report(class_name)
+    stats = report['stats']
+    return {
+        'title': f"Class {class_name}",
+        'metrics': {
+            'Total Students': f"{stats['total_students']:,}",
+            'Mean Score': f"{stats['mean_score']:.2f}%",
+            'Median Score': f"{stats['median_score']:.2f}%",
+            'Std Dev': f"{stats['std_dev']:.2f}",
+            'Attendance': f"{stats['avg_attendance']:.1f}%",
+            'Pass Rate': f"{stats['pass_rate']:.1f}%",
+            'Attendance/Performance Correlation': f"{report['correlation']:.3f}",
+        },
+        'tables': [
+            ('Subject-wise Class Performance', report['subject_stats'].set_index('Subject').round(2)),
+            ('Top 10 Performers', report['top']),
+            # The risk watchlist, as on the Class Analysis page; streamed data has only the lowest scores
+            ('Students Needing Support', report['bottom'] if report['watchlist'] is None else report['watchlist']),
+        ],
+        'figures': [
+            ('Score Distribution', class_distribution_figure(analytics, report, class_name)),
+            ('Grade Distribution', class_grades_figure(report)),
+            ('Subject-wise Class Performance', class_subjects_figure(report)),
+            ('Attendance vs Performance', class_attendance_figure(report)),
+        ],
+    }
+
+
+# ==================== RENDERING ====================
+
+def render_html(document, plotly_js=PLOTLY_JS):
+    """Standalone HTML page; plotly.js is loaded from one shared copy beside the report folders"""
+    rows = ''.join(f"<tr><th>{html.escape(label)}</th><td>{html.escape(str(value))}</td></tr>"
+                   for label, value in document['metrics'].items())
+    body = [f'<table class="metrics">{rows}</table>']
+    for heading, table in document['tables']:
+        body.append(f"<h2>{html.escape(heading)}</h2>{table.to_html(float_format=lambda value: f'{value:.2f}')}")
+    body.append('<div class="figures">')
+    for heading, fig in document['figures']:
+        body.append(f"<div><h2>{html.escape(heading)}</h2>"
+                    f"{fig.to_html(full_html=False, include_plotlyjs=False, config={'displaylogo': False})}</div>")
+    body.append('</div>')
+    return _PAGE.format(title=html.escape(document['title']), plotly_js=plotly_js, body='\n'.join(body))
+
+
+def combined_figure(document, columns=2):
+    """The whole report on one figure, for static export: headline numbers, then every chart"""
+    from plotly.subplots import make_subplots
+    import plotly.graph_objects as go
+
+    figures = document['figures']
+    specs = [[{'type': 'table', 'colspan': columns}] + [None] * (columns - 1)]
+    for start in range(0, len(figures), columns):
+        row = [{'type': _SUBPLOT_TYPES.get(fig.data[0].type, 'xy') if fig.data else 'xy'}
+               for _, fig in figures[start:start + columns]]
+        specs.append(row + [None] * (columns - len(row)))
+    combined = make_subplots(rows=len(specs), cols=columns, specs=specs, vertical_spacing=0.06,
+                             subplot_titles=['Summary'] + [heading for heading, _ in figures])
+    combined.add_trace(go.Table(cells=dict(values=[list(document['metrics']), list(document['metrics'].values())],
+                                           align=['left', 'right'])), row=1, col=1)
+
+    for i, (_, fig) in enumerate(figures):
+        row, col = 2 + i // columns, 1 + i % columns
+        for trace in fig.data:
+            combined.add_trace(trace, row=row, col=col)
+        subplot = combined.get_subplot(row, col)
+        if hasattr(subplot, 'xaxis'):
+            subplot.xaxis.title = fig.layout.xaxis.title
+            subplot.yaxis.title = fig.layout.yaxis.title
+            # Mean/median and trend lines are drawn against the source figure's own axes
+            x_id = subplot.xaxis.plotly_name.replace('axis', '')
+            y_id = subplot.yaxis.plotly_name.replace('axis', '')
+            for item, add in ((fig.layout.shapes, combined.add_shape),
+                              (fig.layout.annotations, combined.add_annotation)):
+                for element in item:
+                    # Unset references mean the figure's own x and y axes
+                    add(element.update(xref=(element.xref or 'x').replace('x', x_id, 1),
+                                       yref=(element.yref or 'y').replace('y', y_id, 1)))
+        elif fig.layout.polar.radialaxis.range:
+            subplot.radialaxis.range = fig.layout.polar.radialaxis.range
+        if fig.layout.coloraxis.colorscale:
+            combined.update_layout(coloraxis=dict(colorscale=fig.layout.coloraxis.colorscale, showscale=False))
+
+    combined.update_layout(title=document['title'], barmode='group', height=150 + 400 * (len(specs) - 1),
+                           width=1100)
+    return combined
+
+
+def write_report(analytics, kind, key, output_dir, fmt='html', peers=None):
+    """Render one student's or class's report to ``output_dir``; returns its path"""
+    document = student_document(analytics, key, peers) if kind == 'student' else class_document(analytics, key)
+    path = os.path.join(output_dir, REPORT_DIRS[kind], f"{_file_name(key)}.{fmt}")
+    if fmt == 'pdf':
+        # kaleido keeps one renderer process per worker, so a batch's images share its start-up
+        combined = combined_figure(document)
+        combined.write_image(path, format='pdf', width=combined.layout.width, height=combined.layout.height)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(render_html(document))
+    return path
+
+
+def _file_name(key):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(key))
+
+
+# ==================== BATCH RUN ====================
+
+def _init_worker(data_file, chart_rows):
+    global _analytics
+    _analytics = StudentAnalytics(data_file, chart_rows=chart_rows)
+
+
+def _write_batch(kind, keys, output_dir, fmt):
+    # A batch's similar students are found in one call; batches already run in parallel across workers
+    peers = _analytics.similar_students(keys) if kind == 'student' else {}
+    for key in keys:
+        write_report(_analytics, kind, key, output_dir, fmt, peers.get(key))
+    return len(keys)
+
+
+def print_progress(done, total, elapsed):
+    rate = done / elapsed if elapsed else 0.0
+    eta = (total - done) / rate if rate else float('nan')
+    print(f"  {done:>9,}/{total:,} reports ({done / total:.0%})  {rate:,.0f} reports/s  ETA {eta:,.0f}s",
+          flush=True)
+
+
+def generate_reports(data_file, output_dir, kinds=('class', 'student'), classes=None, fmt='html',
+                     workers=None, batch_size=DEFAULT_BATCH_SIZE, chart_rows=CHART_ROW_THRESHOLD,
+                     progress=print_progress):
+    """Write the class and/or student reports of a roster across a process pool
+
+    Reports are split into batches of ``batch_size``; each worker loads the
+    roster once (the column store is memory-mapped, so workers share its
+    pages) and renders whole batches. ``progress(done, total, elapsed)`` is
+    called as batches finish. Returns the number of reports, the time taken
+    and the throughput.
+    """
+    analytics = StudentAnalytics(data_file, chart_rows=chart_rows)
+    classes = analytics.classes if classes is None else [c for c in classes if c in analytics.class_rows]
+    jobs = []
+    for kind in kinds:
+        if kind == 'class':
+            keys = classes
+        else:
+            student_ids = analytics.index.student_ids
+            keys = [student_ids[position] for class_name in classes for position in analytics.class_rows[class_name]]
+        os.makedirs(os.path.join(output_dir, REPORT_DIRS[kind]), exist_ok=True)
+        jobs += [(kind, keys[start:start + batch_size]) for start in range(0, len(keys), batch_size)]
+    total = sum(len(keys) for _, keys in jobs)
+
+    if fmt == 'html':
+        from plotly.offline import get_plotlyjs
+
+        with open(os.path.join(output_dir, PLOTLY_JS), 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+
+    workers = workers or min(len(jobs), os.cpu_count() or 1) or 1
+    start = time.perf_counter()
+    done = 0
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(data_file, chart_rows)) as pool:
+            futures = [pool.submit(_write_batch, kind, keys, output_dir, fmt) for kind, keys in jobs]
+            for future in as_completed(futures):
+                done += future.result()
+                progress(done, total, time.perf_counter() - start)
+    else:
+        global _analytics
+        _analytics = analytics
+        for kind, keys in jobs:
+            done += _write_batch(kind, keys, output_dir, fmt)
+            progress(done, total, time.perf_counter() - start)
+
+    elapsed = time.perf_counter() - start
+    return {'reports': total, 'seconds': elapsed, 'per_second': total / elapsed if elapsed else float('nan')}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Write per-class and per-student reports without the dashboard')
+    parser.add_argument('--data', default=os.environ.get('DASHBOARD_DATA', 'students_data.csv'),
+                        help='student data file (default: %(default)s)')
+    parser.add_argument('--output', default='reports', help='output directory (default: %(default)s)')
+    parser.add_argument('--kind', choices=['all', 'class', 'student'], default='all',
+                        help='which reports to write (default: %(default)s)')
+    parser.add_argument('--classes', help='comma-separated classes to report on (default: every class)')
+    parser.add_argument('--format', choices=['html', 'pdf'], default='html',
+                        help='html (interactive charts) or pdf (static, needs kaleido)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='reports per worker task (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if args.format == 'pdf':
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error('PDF reports need the kaleido package: pip install kaleido')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    kinds = ('class', 'student') if args.kind == 'all' else (args.kind,)
+    classes = [c.strip() for c in args.classes.split(',') if c.strip()] if args.classes else None
+
+    print(f"Writing {'/'.join(kinds)} reports from {args.data} to {args.output}/")
+    result = generate_reports(args.data, args.output, kinds=kinds, classes=classes, fmt=args.format,
+                              workers=args.workers, batch_size=args.batch_size,
+                              chart_rows=int(os.environ.get('DASHBOARD_CHART_ROWS', CHART_ROW_THRESHOLD)))
+    print(f"✓ {result['reports']:,} reports in {result['seconds']:.1f}s ({result['per_second']:,.1f} reports/s)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
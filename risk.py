@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from data_store import Delta
+from rankings import Rankings
+from schema import SUBJECTS
+
+# Each factor's risk rises linearly from 0 at its safe level to 1 at its critical level
+RISK_BANDS = {
+    'Low overall': ('OverallPercentage', 70, 40),
+    'Weak subjects': (None, 60, 30),  # mean of the two weakest subjects, as Student Analysis picks them
+    'Attendance': ('Attendance', 90, 70),
+    'Assignments': ('AssignmentCompletion', 85, 60),
+}
+# Share of the risk score each factor carries; a missed exam counts fully
+RISK_WEIGHTS = {'Low overall': 0.35, 'Weak subjects': 0.2, 'Attendance': 0.2, 'Assignments': 0.15,
+                'Missed exams': 0.1}
+RISK_FACTORS = list(RISK_WEIGHTS)
+RISK_COLUMNS = ['OverallPercentage', 'Attendance', 'AssignmentCompletion', 'ExamParticipation'] + SUBJECTS
+
+# Scores from here up put a student on the watchlist
+AT_RISK_SCORE = 40
+# Subjects averaged for the weak-subjects factor
+WEAKEST_SUBJECTS = 2
+
+
+def _band(values, safe, critical):
+    return np.clip((safe - values) / (safe - critical), 0, 1)
+
+
+def _values(df, column):
+    return df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def weakest_subjects_mean(df):
+    """Mean of each row's WEAKEST_SUBJECTS lowest subject scores, over the subjects it has
+
+    The lowest scores are carried along one subject column at a time, which
+    avoids partitioning an (n, subjects) copy of the scores.
+    """
+    lowest = [np.full(len(df), np.inf) for _ in range(WEAKEST_SUBJECTS)]
+    for subject in SUBJECTS:
+        values = _values(df, subject)
+        for low in lowest:
+            # np.maximum keeps a missing score missing, and np.fmin then skips it
+            displaced = np.maximum(low, values)
+            np.fmin(low, values, out=low)
+            values = displaced
+    lowest = np.array(lowest)
+    present = np.isfinite(lowest)
+    with np.errstate(invalid='ignore'):
+        return np.where(present, lowest, 0).sum(axis=0) / present.sum(axis=0)
+
+
+def risk_factors(df):
+    """Each factor's risk, 0 to 1, for every row: an (n, factors) matrix in RISK_FACTORS order
+
+    Missing values carry no risk.
+    """
+    factors = np.empty((len(df), len(RISK_FACTORS)), order='F')
+    for i, factor in enumerate(RISK_FACTORS):
+        if factor in RISK_BANDS:
+            column, safe, critical = RISK_BANDS[factor]
+            values = weakest_subjects_mean(df) if column is None else _values(df, column)
+            factors[:, i] = _band(values, safe, critical)
+        else:
+            factors[:, i] = _values(df, 'ExamParticipation') == 0
+    return np.nan_to_num(factors, copy=False)
+
+
+def _overall_contribution(overall):
+    """Share of the risk score, 0 to 1, that the overall percentage adds: the only policy-dependent factor"""
+    _, safe, critical = RISK_BANDS[RISK_FACTORS[0]]
+    return np.nan_to_num(_band(overall, safe, critical)) * RISK_WEIGHTS[RISK_FACTORS[0]]
+
+
+def _other_factors(factors):
+    """Sum, largest and factor position of every contribution but the overall percentage's"""
+    contributions = factors[:, 1:] * np.array([RISK_WEIGHTS[factor] for factor in RISK_FACTORS[1:]])
+    return contributions.sum(axis=1), contributions.max(axis=1), contributions.argmax(axis=1).astype(np.int8) + 1
+
+
+def _combine(overall, others):
+    total, largest, main = others
+    scores = ((overall + total) * 100).round(2).astype(np.float32)
+    # The overall percentage comes first, so it wins ties as argmax would pick it
+    main = np.where(scores > 0, np.where(overall >= largest, 0, main), -1).astype(np.int8)
+    return scores, main
+
+
+def risk_scores(factors):
+    """Risk score, 0 to 100, of every row of a factor matrix, and the factor adding most to it (-1 for none)"""
+    return _combine(factors[:, 0] * RISK_WEIGHTS[RISK_FACTORS[0]], _other_factors(factors))
+
+
+def student_risk(row):
+    """Risk score of one student and each factor's share of it, in points"""
+    factors = risk_factors(pd.DataFrame([row]))[0]
+    points = pd.Series(factors * [RISK_WEIGHTS[factor] for factor in RISK_FACTORS] * 100, index=RISK_FACTORS)
+    score = float(risk_scores(factors[None, :])[0][0])
+    return {'score': score, 'points': points.round(2), 'at_risk': score >= AT_RISK_SCORE}
+
+
+class RiskIndex:
+    """Risk score of every student and the watchlist order, school-wide and per class
+
+    Scores are computed for all students at once: the factor matrix times
+    the weights. Each class's students are kept sorted by score, so any
+    page of a class's watchlist is a slice and the school-wide one merges
+    the head of each class's. Upserts rescore only the changed students
+    and splice them into place. The factors that do not depend on the
+    grading policy are kept summed, so a new policy recomputes just the
+    overall percentage's share before re-sorting.
+    """
+
+    def __init__(self, scores, main, rankings, others):
+        self.scores = scores
+        self.main = main
+        self.rankings = rankings
+        # Sum, largest and position of the contributions other than the overall percentage's
+        self.others = others
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with a Class column and RISK_COLUMNS"""
+        factors = risk_factors(df)
+        others = _other_factors(factors)
+        scores, main = _combine(factors[:, 0] * RISK_WEIGHTS[RISK_FACTORS[0]], others)
+        return cls(scores, main, _rankings(df['Class'], scores), others)
+
+    def page(self, start, stop, class_name=None):
+        """Row positions on the watchlist ``start:stop``, highest risk first"""
+        return self.rankings.page('Risk', start, stop, class_name=class_name)
+
+    def count(self, class_name=None):
+        """Students in one class, or school-wide, on the watchlist"""
+        return int(self.counts().get(class_name, 0) if class_name is not None else self.counts().sum())
+
+    def counts(self):
+        """Students on the watchlist per class, read off each class's sorted scores"""
+        return pd.Series({
+            class_name: len(group) - int(np.searchsorted(group.scores, AT_RISK_SCORE, side='left'))
+            for (_, class_name), group in self.rankings.groups.items()
+        }, dtype=np.int64).sort_index()
+
+    def factors(self, rows):
+        """Name of the factor adding most to each row's score"""
+        return pd.Categorical.from_codes(self.main[rows], categories=RISK_FACTORS)
+
+    def subset(self, positions):
+        """Index of just the rows at ``positions``, renumbered as rankings.Rankings.subset does"""
+        return RiskIndex(self.scores[positions], self.main[positions], self.rankings.subset(positions),
+                         tuple(values[positions] for values in self.others))
+
+    def regraded(self, data):
+        """Index of a regraded snapshot: the overall percentage's share recomputed, every class re-sorted"""
+        frame = data.columns(['Class', 'OverallPercentage'])
+        overall = _overall_contribution(frame['OverallPercentage'].to_numpy(dtype=np.float64, na_value=np.nan))
+        scores, main = _combine(overall, self.others)
+        return RiskIndex(scores, main, _rankings(frame['Class'], scores), self.others)
+
+    def updated(self, delta):
+        """Index after an upsert: the changed students rescored and moved within their classes"""
+        positions = delta.after.index.to_numpy()
+        factors = risk_factors(delta.after)
+        changed = _other_factors(factors)
+        rescored, main = _combine(factors[:, 0] * RISK_WEIGHTS[RISK_FACTORS[0]], changed)
+
+        appended = len(delta.appended)
+        scores = np.concatenate([self.scores, np.zeros(appended, dtype=np.float32)])
+        codes = np.concatenate([self.main, np.full(appended, -1, dtype=np.int8)])
+        others = tuple(np.concatenate([values, np.zeros(appended, dtype=values.dtype)]) for values in self.others)
+        before = pd.DataFrame({'Class': delta.before['Class'], 'Risk': self.scores[delta.before.index.to_numpy()]})
+        scores[positions], codes[positions] = rescored, main
+        for values, new in zip(others, changed):
+            values[positions] = new
+        after = pd.DataFrame({'Class': delta.after['Class'], 'Risk': rescored}, index=delta.after.index)
+        return RiskIndex(scores, codes, self.rankings.updated(Delta(before, after, delta.appended)), others)
+
+
+def _rankings(classes, scores):
+    return Rankings.from_frame(pd.DataFrame({'Class': classes, 'Risk': scores}), ['Risk'])
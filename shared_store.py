@@ -0,0 +1,148 @@
+import json
+import mmap
+import os
+import pickle
+import shutil
+import uuid
+
+from column_store import MANIFEST, ColumnStore, write_store
+
+SHARED_MANIFEST = 'shared.json'
+SHARED_SUFFIX = '.shared'
+STRUCTURES_PICKLE = 'structures.pickle'
+STRUCTURES_BUFFERS = 'structures.bin'
+
+# Array buffers start at multiples of this in the structures file
+ALIGNMENT = 64
+
+
+def default_shared_path(source):
+    """Published snapshot that sits next to its source, e.g. students_data.shared/"""
+    return os.path.splitext(source.rstrip(os.sep))[0] + SHARED_SUFFIX
+
+
+def is_shared_store(path):
+    return os.path.isfile(os.path.join(path, SHARED_MANIFEST))
+
+
+def _link_columns(store, columns, target):
+    """Files of some columns of a store, hard-linked under ``target`` where possible; they are never rewritten"""
+    for column in columns:
+        entry = store.manifest['columns'][column]
+        for part in ('file', 'offsets'):
+            if part in entry:
+                source = os.path.join(store.path, entry[part])
+                try:
+                    os.link(source, os.path.join(target, entry[part]))
+                except OSError:
+                    shutil.copyfile(source, os.path.join(target, entry[part]))
+
+
+def _write_columns(data, target, base, changed):
+    """Columns of a snapshot as a store under ``target``, writing as few files as it can
+
+    A column store's files are linked. Otherwise, when ``changed`` names
+    the columns that differ from the published store ``base``, which has
+    the same rows, only those are written and the rest are linked from it.
+    """
+    if isinstance(data.store, ColumnStore):
+        os.makedirs(target)
+        _link_columns(data.store, data.store.columns, target)
+        manifest = data.store.manifest
+    else:
+        frame = data.df
+        kept = []
+        if base is not None and changed is not None and base.rows == len(frame):
+            kept = [column for column in frame.columns if column not in changed and column in base.manifest['columns']]
+        manifest = write_store(frame.drop(columns=kept), target, source_version=data.version)
+        _link_columns(base, kept, target)
+        entries = {**manifest['columns'], **{column: base.manifest['columns'][column] for column in kept}}
+        manifest['columns'] = {column: entries[column] for column in frame.columns}
+    with open(os.path.join(target, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+
+def _write_structures(structures, target):
+    """Pickle structures with their arrays out of band, packed into one file; returns each array's span"""
+    buffers = []
+    payload = pickle.dumps(structures, protocol=5, buffer_callback=buffers.append)
+    spans = []
+    offset = 0
+    with open(os.path.join(target, STRUCTURES_BUFFERS), 'wb') as f:
+        for buffer in buffers:
+            raw = buffer.raw()
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            f.seek(offset)
+            f.write(raw)
+            spans.append((offset, raw.nbytes))
+            offset += raw.nbytes
+    with open(os.path.join(target, STRUCTURES_PICKLE), 'wb') as f:
+        f.write(payload)
+    return spans
+
+
+def write_shared(data, path, structures, changed=None):
+    """Publish a snapshot: its columns and prebuilt structures under a new generation of ``path``
+
+    Columns of a column store are linked rather than copied; an upserted
+    snapshot is written out as a new store, of just the ``changed``
+    columns when those are known. Every array inside
+    ``structures`` (name -> object) goes into one file that workers map,
+    so they share the loader's copy. The manifest is swapped in last, and
+    the generation before stays until the next publish.
+    """
+    os.makedirs(path, exist_ok=True)
+    generation = uuid.uuid4().hex[:12]
+    target = os.path.join(path, generation)
+    previous = None
+    if is_shared_store(path):
+        with open(os.path.join(path, SHARED_MANIFEST), encoding='utf-8') as f:
+            previous = json.load(f)['generation']
+    _write_columns(data, target, ColumnStore(os.path.join(path, previous)) if previous else None, changed)
+
+    manifest = {'generation': generation, 'previous': previous, 'version': data.version,
+                'structures': _write_structures(structures, target)}
+    manifest_tmp = os.path.join(path, f"{SHARED_MANIFEST}.{generation}")
+    with open(manifest_tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_tmp, os.path.join(path, SHARED_MANIFEST))
+
+    # The generation before stays for workers still attaching to it; older ones go
+    for name in os.listdir(path):
+        if name not in (generation, previous) and os.path.isdir(os.path.join(path, name)):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return manifest
+
+
+class SharedSnapshot:
+    """A published snapshot attached read-only: columns and structure arrays are mapped, not copied"""
+
+    def __init__(self, path):
+        self.path = path
+        while True:
+            with open(os.path.join(path, SHARED_MANIFEST), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            try:
+                self._attach(os.path.join(path, self.manifest['generation']))
+                return
+            except FileNotFoundError:
+                # Two publishes went by while attaching; only give up if the manifest has not moved on
+                with open(os.path.join(path, SHARED_MANIFEST), encoding='utf-8') as f:
+                    if json.load(f)['generation'] == self.manifest['generation']:
+                        raise
+
+    def _attach(self, generation_path):
+        # Every file is mapped now, so a later publish removing this generation cannot pull it away
+        self.store = ColumnStore(generation_path)
+        self.store.map_all()
+        with open(os.path.join(generation_path, STRUCTURES_PICKLE), 'rb') as f:
+            payload = f.read()
+        with open(os.path.join(generation_path, STRUCTURES_BUFFERS), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            view = memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b'')
+        self.structures = pickle.loads(payload, buffers=[view[start:start + length]
+                                                         for start, length in self.manifest['structures']])
+
+    @property
+    def version(self):
+        return self.manifest['version']
@@ -0,0 +1,384 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from quantiles import GridHistogram
+
+PASS_MARK = 50
+MAX_SCORE = 100
+
+# Axes each cube array is laid out on, and the value new cells start from
+_LAYOUT = {
+    'rows': (('class', 'gender'), 0),
+    'count': (('class', 'gender', 'metric'), 0),
+    'sum': (('class', 'gender', 'metric'), 0.0),
+    'sumsq': (('class', 'gender', 'metric'), 0.0),
+    'passed': (('class', 'gender', 'metric'), 0),
+    'min': (('class', 'gender', 'metric'), np.inf),
+    'max': (('class', 'gender', 'metric'), -np.inf),
+    'hist': (('class', 'gender', 'metric', 'bin'), 0),
+    'grades': (('class', 'gender', 'grade'), 0),
+}
+_DTYPES = {
+    'rows': np.int64, 'count': np.int64, 'sum': np.float64, 'sumsq': np.float64,
+    'passed': np.int64, 'min': np.float64, 'max': np.float64, 'hist': np.int32,
+    'grades': np.int64,
+}
+# Histogram changes from upserts held as (bin, count) pairs, at most this many, before the histogram is copied
+MAX_PENDING_BINS = 1 << 16
+
+
+class StatsCube:
+    """Count, sum, sum of squares, min, max, pass count and a score histogram
+    for every (Class, Gender, metric) cell
+
+    The histogram has ``bins_per_point`` bins per score point over 0-100, so
+    with the default of 100 it holds scores stored to two decimals exactly and
+    medians, quantiles, min and max read from it match the raw rows.
+    Every statistic is additive, so frames can be folded in one at a time.
+
+    The histogram is the one large array. A cube updated from an upsert
+    shares it with the cube it came from and holds the batch's changes
+    aside as (bin, count) pairs until enough pile up to copy it.
+    """
+
+    def __init__(self, metrics, bins_per_point=100):
+        self.metrics = list(metrics)
+        self.bins_per_point = bins_per_point
+        self.labels = {'class': [], 'gender': [], 'grade': [],
+                       'metric': self.metrics, 'bin': None}
+        self._positions = {'class': {}, 'gender': {}, 'grade': {},
+                           'metric': {m: i for i, m in enumerate(self.metrics)}}
+        sizes = {'class': 0, 'gender': 0, 'grade': 0, 'metric': len(self.metrics),
+                 'bin': MAX_SCORE * bins_per_point + 1}
+        for name, (axes, fill) in _LAYOUT.items():
+            shape = tuple(sizes[axis] for axis in axes)
+            setattr(self, name, np.full(shape, fill, dtype=_DTYPES[name]))
+        # Flat positions into ``hist`` and their pending counts, for a histogram shared with another cube
+        self.pending_bins = np.empty(0, dtype=np.int64)
+        self.pending_counts = np.empty(0, dtype=np.int64)
+        self._hist_shared = False
+
+    @classmethod
+    def from_frame(cls, df, metrics, bins_per_point=100):
+        """Build a cube from a full student frame"""
+        cube = cls(metrics, bins_per_point=bins_per_point)
+        cube.add_frame(df)
+        return cube
+
+    @property
+    def classes(self):
+        return sorted(self.labels['class'])
+
+    @property
+    def genders(self):
+        return sorted(self.labels['gender'])
+
+    def _extend(self, axis, values):
+        """Add unseen labels on an axis and grow every array laid out on it"""
+        positions = self._positions[axis]
+        new = [value for value in pd.unique(values) if value not in positions]
+        if not new:
+            return
+        for value in new:
+            positions[value] = len(self.labels[axis])
+            self.labels[axis].append(value)
+        # Pending bins are flat positions, which padding the histogram moves
+        if axis in _LAYOUT['hist'][0]:
+            self._settle_hist()
+        for name, (axes, fill) in _LAYOUT.items():
+            if axis in axes:
+                array = getattr(self, name)
+                pad = [(0, 0)] * array.ndim
+                pad[axes.index(axis)] = (0, len(new))
+                setattr(self, name, np.pad(array, pad, constant_values=fill))
+
+    def _codes(self, axis, values):
+        """Integer positions of a column's values along an axis"""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Dictionary-encoded columns only need their categories remapped
+            categories = values.cat.categories
+            self._extend(axis, categories)
+            positions = self._positions[axis]
+            lookup = np.array([positions[category] for category in categories] + [-1], dtype=np.int64)
+            return lookup[values.cat.codes.to_numpy()]
+        values = values.to_numpy()
+        self._extend(axis, values)
+        return pd.Categorical(values, categories=self.labels[axis]).codes.astype(np.int64)
+
+    def add_frame(self, df, sign=1, metrics=None):
+        """Fold the rows of a frame into the cube (``sign=-1`` removes them)
+
+        With ``metrics`` only those metrics and the grades are folded in, for
+        rows whose other columns the cube already holds.
+        """
+        if len(df) == 0:
+            return
+        class_codes = self._codes('class', df['Class'])
+        gender_codes = self._codes('gender', df['Gender'])
+        # Rows without a class or gender have no cell to land in
+        known = (class_codes >= 0) & (gender_codes >= 0)
+        if not known.all():
+            df, class_codes, gender_codes = df[known], class_codes[known], gender_codes[known]
+        n_classes, n_genders = len(self.labels['class']), len(self.labels['gender'])
+        n_cells = n_classes * n_genders
+        cells = class_codes * n_genders + gender_codes
+        shape = (n_classes, n_genders)
+
+        if metrics is None:
+            self.rows += sign * np.bincount(cells, minlength=n_cells).reshape(shape)
+
+        n_metrics, n_bins = len(self.metrics), self.hist.shape[-1]
+        # Frames with fewer rows than a histogram has bins only touch a few of them
+        dense = len(df) >= n_bins
+        if dense:
+            self._settle_hist()
+        lowest, highest = self.min.reshape(-1), self.max.reshape(-1)
+        stale = []
+        for m, metric in enumerate(self.metrics):
+            if metrics is not None and metric not in metrics:
+                continue
+            values = df[metric].to_numpy(dtype=np.float64)
+            valid = ~np.isnan(values)
+            metric_cells, values = cells[valid], values[valid]
+
+            self.count[..., m] += sign * np.bincount(metric_cells, minlength=n_cells).reshape(shape)
+            self.sum[..., m] += sign * np.bincount(metric_cells, values, minlength=n_cells).reshape(shape)
+            self.sumsq[..., m] += sign * np.bincount(metric_cells, values * values, minlength=n_cells).reshape(shape)
+            self.passed[..., m] += sign * np.bincount(metric_cells[values >= PASS_MARK],
+                                                      minlength=n_cells).reshape(shape)
+
+            bins = np.clip(np.rint(values * self.bins_per_point), 0, n_bins - 1).astype(np.int64)
+            if dense:
+                hist = np.bincount(metric_cells * n_bins + bins, minlength=n_cells * n_bins)
+                self.hist[..., m, :] += (sign * hist).reshape(shape + (n_bins,)).astype(np.int32)
+            else:
+                metric_cells = metric_cells * n_metrics + m
+                self._add_bins(metric_cells * n_bins + bins, sign)
+                scores = bins / self.bins_per_point
+                if sign > 0:
+                    np.minimum.at(lowest, metric_cells, scores)
+                    np.maximum.at(highest, metric_cells, scores)
+                else:
+                    # Only a cell losing its lowest or highest score needs it read off the histogram again
+                    stale.append(metric_cells[(scores == lowest[metric_cells]) | (scores == highest[metric_cells])])
+
+        if dense:
+            self._refresh_extremes()
+        elif stale:
+            self._refresh_extremes(np.unique(np.concatenate(stale)))
+
+        if 'Grade' in df:
+            grade_codes = self._codes('grade', df['Grade'])
+            n_grades = len(self.labels['grade'])
+            graded = grade_codes >= 0
+            counts = np.bincount(cells[graded] * n_grades + grade_codes[graded], minlength=n_cells * n_grades)
+            self.grades += sign * counts.reshape(shape + (n_grades,))
+
+    def updated(self, delta):
+        """Cube after an upsert: the replaced rows folded out and their new values folded in
+
+        Only the small per-cell arrays are copied; the histogram is shared
+        and the batch's changes to it are held as pending bins.
+        """
+        cube = copy.copy(self)
+        cube.labels = {axis: None if labels is None else list(labels) for axis, labels in self.labels.items()}
+        cube._positions = {axis: dict(positions) for axis, positions in self._positions.items()}
+        for name in _LAYOUT:
+            if name != 'hist':
+                setattr(cube, name, getattr(self, name).copy())
+        self._hist_shared = cube._hist_shared = True
+        cube.add_frame(delta.before, sign=-1)
+        cube.add_frame(delta.after)
+        return cube
+
+    def regraded(self, data):
+        """Cube of a regraded snapshot: OverallPercentage and the grades are folded in again, the rest kept"""
+        cube = copy.deepcopy(self)
+        cube._settle_hist()
+        metrics = [metric for metric in ['OverallPercentage'] if metric in self._positions['metric']]
+        for metric in metrics:
+            m = self._positions['metric'][metric]
+            for name, (axes, fill) in _LAYOUT.items():
+                if 'metric' in axes:
+                    getattr(cube, name)[:, :, m] = fill
+        # Grades are relabelled too, so the grade axis starts empty
+        cube.labels['grade'], cube._positions['grade'] = [], {}
+        cube.grades = np.zeros(cube.grades.shape[:2] + (0,), dtype=_DTYPES['grades'])
+        cube.add_frame(data.columns(['Class', 'Gender', 'Grade'] + metrics), metrics=metrics)
+        return cube
+
+    def _add_bins(self, positions, sign):
+        """Add ``sign`` to the histogram at flat ``positions``; as pending bins when it is shared"""
+        if not self._hist_shared:
+            np.add.at(self.hist.reshape(-1), positions, sign)
+            return
+        positions, counts = np.unique(positions, return_counts=True)
+        positions, inverse = np.unique(np.concatenate([self.pending_bins, positions]), return_inverse=True)
+        counts = np.bincount(inverse, np.concatenate([self.pending_counts, sign * counts])).astype(np.int64)
+        kept = counts != 0
+        self.pending_bins, self.pending_counts = positions[kept], counts[kept]
+        if len(self.pending_bins) > MAX_PENDING_BINS:
+            self._settle_hist()
+
+    def _settle_hist(self):
+        """Fold the pending bins into a histogram of this cube's own"""
+        if not self._hist_shared and not len(self.pending_bins):
+            return
+        hist = self.hist.copy() if self._hist_shared else self.hist
+        hist.reshape(-1)[self.pending_bins] += self.pending_counts.astype(hist.dtype)
+        self.hist, self._hist_shared = hist, False
+        self.pending_bins, self.pending_counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    def _refresh_extremes(self, cells=None):
+        """Read min/max off the histograms, which also keeps them right after removals
+
+        ``cells`` limits this to some flat (class, gender, metric) positions.
+        """
+        n_bins = self.hist.shape[-1]
+        hist = self.hist.reshape(-1, n_bins)
+        hist = hist if cells is None else hist[cells]
+        if len(self.pending_bins):
+            pending_cells, bins = np.divmod(self.pending_bins, n_bins)
+            rows = pending_cells if cells is None else np.searchsorted(cells, pending_cells)
+            found = rows < len(hist)
+            found[found] = (pending_cells if cells is None else cells[rows[found]]) == pending_cells[found]
+            hist = hist.astype(np.int64)
+            np.add.at(hist, (rows[found], bins[found]), self.pending_counts[found])
+        filled = hist > 0
+        first = np.argmax(filled, axis=-1)
+        last = filled.shape[-1] - 1 - np.argmax(filled[..., ::-1], axis=-1)
+        empty = ~filled.any(axis=-1)
+        low = np.where(empty, np.inf, first / self.bins_per_point)
+        high = np.where(empty, -np.inf, last / self.bins_per_point)
+        if cells is None:
+            self.min, self.max = low.reshape(self.min.shape), high.reshape(self.max.shape)
+        else:
+            self.min.reshape(-1)[cells], self.max.reshape(-1)[cells] = low, high
+
+    def _index(self, axis, labels):
+        if labels is None:
+            return np.arange(len(self.labels[axis]))
+        positions = self._positions[axis]
+        return np.array([positions[label] for label in labels if label in positions], dtype=np.int64)
+
+    def _cells(self, name, classes=None, genders=None):
+        """Slice an array down to the selected classes and genders"""
+        array = getattr(self, name)
+        return array[self._index('class', classes)][:, self._index('gender', genders)]
+
+    def histogram(self, metric, classes=None, genders=None):
+        """Counts per score bin (bin ``i`` holds scores of ``i / bins_per_point``)"""
+        m = self._positions['metric'][metric]
+        counts = self._cells('hist', classes, genders)[:, :, m, :].sum(axis=(0, 1), dtype=np.int64)
+        if len(self.pending_bins):
+            n_bins = self.hist.shape[-1]
+            cells, bins = np.divmod(self.pending_bins, n_bins)
+            cells, metrics = np.divmod(cells, len(self.metrics))
+            class_codes, gender_codes = np.divmod(cells, len(self.labels['gender']))
+            selected = ((metrics == m) & np.isin(class_codes, self._index('class', classes))
+                        & np.isin(gender_codes, self._index('gender', genders)))
+            counts += np.bincount(bins[selected], self.pending_counts[selected], minlength=n_bins).astype(np.int64)
+        return counts
+
+    def distribution(self, metric, classes=None, genders=None):
+        """Quantile sketch of a metric over the selected cells"""
+        return GridHistogram(self.histogram(metric, classes, genders), self.bins_per_point)
+
+    def quantile(self, metric, q, classes=None, genders=None):
+        """Quantile of a metric with pandas' linear interpolation between ranks"""
+        values = self.distribution(metric, classes, genders).quantile(np.atleast_1d(q))
+        return values[0] if np.ndim(q) == 0 else values
+
+    def percentile_rank(self, metric, value, classes=None, genders=None):
+        """Percentage of the selected students scoring below ``value``, counting ties as half"""
+        return self.distribution(metric, classes, genders).percentile_rank(value)
+
+    def summary(self, metric, classes=None, genders=None):
+        """Count, mean, median, std, min, max and pass rate of a metric"""
+        m = self._positions['metric'][metric]
+        count = self._cells('count', classes, genders)[..., m].sum()
+        total = self._cells('sum', classes, genders)[..., m].sum()
+        total_sq = self._cells('sumsq', classes, genders)[..., m].sum()
+        passed = self._cells('passed', classes, genders)[..., m].sum()
+        mean = total / count if count else np.nan
+        std = np.sqrt(max(total_sq - total * mean, 0) / (count - 1)) if count > 1 else np.nan
+        return {
+            'count': int(count),
+            'mean': mean,
+            'median': self.quantile(metric, 0.5, classes, genders) if count else np.nan,
+            'std': std,
+            'min': self._cells('min', classes, genders)[..., m].min() if count else np.nan,
+            'max': self._cells('max', classes, genders)[..., m].max() if count else np.nan,
+            'pass_rate': passed / count * 100 if count else np.nan,
+        }
+
+    def box_stats(self, metric, classes=None, genders=None):
+        """Quartiles and Tukey whiskers (furthest values within 1.5 IQR) of a metric"""
+        box = self.distribution(metric, classes, genders).box_stats()
+        if box is not None:
+            box['mean'] = self.summary(metric, classes, genders)['mean']
+        return box
+
+    def group_summary(self, metric, by='Class', labels=None):
+        """Per-class or per-gender summary table of a metric"""
+        key, labels = self._grouping(by, labels)
+        rows = {label: self.summary(metric, **{key: [label]}) for label in labels}
+        table = pd.DataFrame.from_dict(rows, orient='index')
+        table.index.name = by
+        return table
+
+    def group_box_stats(self, metric, by='Class', labels=None):
+        """Per-class or per-gender box plot statistics of a metric; empty groups are left out"""
+        key, labels = self._grouping(by, labels)
+        rows = {label: self.box_stats(metric, **{key: [label]}) for label in labels}
+        table = pd.DataFrame.from_dict({label: box for label, box in rows.items() if box is not None},
+                                       orient='index', columns=['q1', 'median', 'q3', 'lowerfence',
+                                                                'upperfence', 'mean'])
+        table.index.name = by
+        return table
+
+    def means(self, metrics, classes=None, genders=None):
+        """Mean of each metric over the selected cells"""
+        index = [self._positions['metric'][metric] for metric in metrics]
+        count = self._cells('count', classes, genders)[..., index].sum(axis=(0, 1))
+        total = self._cells('sum', classes, genders)[..., index].sum(axis=(0, 1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.Series(total / count, index=list(metrics))
+
+    def mean_table(self, metrics, by='Class', labels=None):
+        """Labels x metrics table of means, e.g. for the class/subject heatmap"""
+        key, labels = self._grouping(by, labels)
+        table = pd.DataFrame({label: self.means(metrics, **{key: [label]}) for label in labels}).T
+        table.index.name = by
+        return table
+
+    def row_counts(self, by='Class', classes=None, genders=None):
+        """Number of students per class or per gender"""
+        rows = self._cells('rows', classes, genders)
+        if by.lower() == 'class':
+            labels, counts = self._labels_for('class', classes), rows.sum(axis=1)
+        else:
+            labels, counts = self._labels_for('gender', genders), rows.sum(axis=0)
+        return pd.Series(counts, index=labels).sort_index()
+
+    def grade_counts(self, classes=None, genders=None):
+        """Number of students per grade"""
+        counts = self._cells('grades', classes, genders).sum(axis=(0, 1))
+        series = pd.Series(counts, index=self.labels['grade']).sort_index()
+        return series[series > 0]
+
+    def _grouping(self, by, labels):
+        """Selection keyword and labels for a per-class or per-gender table"""
+        if by.lower() == 'class':
+            return 'classes', self.classes if labels is None else labels
+        return 'genders', self.genders if labels is None else labels
+
+    def _labels_for(self, axis, labels):
+        return [self.labels[axis][i] for i in self._index(axis, labels)]
+
+    @property
+    def total_rows(self):
+        return int(self.rows.sum())
+
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from chart_data import DENSITY_BINS, density_grid
+from correlations import CorrelationCube
+from schema import SUBJECTS, apply_schema
+from stats_cube import StatsCube
+
+DEFAULT_CHUNKSIZE = 250_000
+
+# Columns the streamed pages need; the rest of the file is never parsed
+STREAM_COLUMNS = ['StudentID', 'Name', 'Class', 'Gender', 'Attendance', 'AssignmentCompletion', *SUBJECTS,
+                  'OverallPercentage', 'Grade']
+TOP_COLUMNS = ['StudentID', 'Name', 'Class', 'OverallPercentage', 'Grade', 'Attendance']
+
+
+class StreamingAggregates:
+    """Everything the Overview, Class and Subject pages need, folded chunk by chunk
+
+    Holds the statistics cube, top/bottom students per class and per subject,
+    pairwise correlation moments and a 2D attendance/score density grid per class.
+    Memory is bounded by the chunk size plus the number of classes.
+    """
+
+    def __init__(self, subjects=SUBJECTS, top_k=15):
+        self.subjects = list(subjects)
+        self.top_k = top_k
+        self.cube = StatsCube(self.subjects + ['OverallPercentage', 'Attendance'])
+        self.class_top = None
+        self.class_bottom = None
+        self.subject_top = dict.fromkeys(self.subjects)
+        self.correlations = CorrelationCube()
+        self.density = {}
+        self.rows = 0
+
+    def add_chunk(self, chunk):
+        """Fold one chunk of rows into the aggregates"""
+        self.rows += len(chunk)
+        self.cube.add_frame(chunk)
+        self.correlations.add_frame(chunk)
+
+        ranked = chunk[TOP_COLUMNS].sort_values('OverallPercentage', ascending=False)
+        best = ranked.groupby('Class', observed=True).head(self.top_k)
+        self.class_top = _keep_per_class(self.class_top, best, self.top_k, ascending=False)
+        ranked = ranked.iloc[::-1]
+        worst = ranked.groupby('Class', observed=True).head(self.top_k)
+        self.class_bottom = _keep_per_class(self.class_bottom, worst, self.top_k, ascending=True)
+
+        for subject in self.subjects:
+            best = chunk.nlargest(self.top_k, subject)[TOP_COLUMNS + [subject]]
+            merged = _concat(self.subject_top[subject], best)
+            self.subject_top[subject] = merged.nlargest(self.top_k, subject)
+
+        x = chunk['Attendance'].to_numpy(dtype=np.float64)
+        y = chunk['OverallPercentage'].to_numpy(dtype=np.float64)
+        for class_name, rows in chunk.groupby('Class', observed=True).indices.items():
+            grid, _ = density_grid(x[rows], y[rows])
+            self.density[class_name] = self.density.get(class_name, 0) + grid
+
+    def top_students(self, class_name, n=10, bottom=False, offset=0):
+        """Best (or weakest) students of a class by OverallPercentage, within the ``top_k`` kept"""
+        table = self.class_bottom if bottom else self.class_top
+        table = table[table['Class'] == class_name]
+        if bottom:
+            return table.nsmallest(offset + n, 'OverallPercentage').iloc[offset:]
+        return table.nlargest(offset + n, 'OverallPercentage').iloc[offset:]
+
+    def top_in_subject(self, subject, n=15, offset=0):
+        """Best students school-wide in one subject, within the ``top_k`` kept"""
+        return self.subject_top[subject].nlargest(offset + n, subject).iloc[offset:]
+
+    def attendance_fit(self, class_name):
+        """Correlation and least-squares line of OverallPercentage on Attendance"""
+        return self.correlations.fit('Attendance', 'OverallPercentage', classes=[class_name])
+
+    def density_grid(self, class_name):
+        """Students per (Attendance, OverallPercentage) cell, with the bin edges"""
+        edges = np.linspace(0, 100, DENSITY_BINS + 1)
+        return self.density.get(class_name, np.zeros((DENSITY_BINS, DENSITY_BINS))), edges
+
+
+def _concat(current, new):
+    # Chunks carry their own categories, so keep text as plain strings here
+    new = new.astype({column: object for column in new.select_dtypes('category').columns})
+    if current is None:
+        return new.reset_index(drop=True)
+    return pd.concat([current, new], ignore_index=True)
+
+
+def _keep_per_class(current, candidates, k, ascending):
+    """Merge candidate rows into a per-class top-k table"""
+    merged = _concat(current, candidates).sort_values('OverallPercentage', ascending=ascending, kind='stable')
+    return merged.groupby('Class', observed=True, sort=False).head(k).reset_index(drop=True)
+
+
+def stream_aggregates(path, chunksize=DEFAULT_CHUNKSIZE, subjects=SUBJECTS):
+    """Read a student CSV in chunks and fold it into StreamingAggregates"""
+    aggregates = StreamingAggregates(subjects)
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [column for column in STREAM_COLUMNS if column in header]
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+        aggregates.add_chunk(apply_schema(chunk))
+    return aggregates
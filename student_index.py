@@ -0,0 +1,108 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from quantiles import SortedValues
+
+
+class StudentIndex:
+    """StudentID -> row position lookup, rows of each class and per-class score order for ranking"""
+
+    def __init__(self, df, score_column='OverallPercentage'):
+        self.score_column = score_column
+        self.ids = pd.Index(df['StudentID'].to_numpy())
+        self._base_ids = self._student_ids = self.ids.tolist()
+        # Students appended by upserts; kept apart so the hash table behind ``ids`` is never rebuilt
+        self.added_ids = {}
+        # Their IDs in row order, one tuple per batch, so an upsert never copies the full ID list
+        self.added_chunks = ()
+
+        # Scores of each class sorted ascending, so a rank is one binary search
+        scores = df[score_column].to_numpy(dtype=np.float64)
+        self.class_rows = df.groupby('Class', sort=False, observed=True).indices
+        self.class_scores = {class_name: SortedValues(scores[rows]) for class_name, rows in self.class_rows.items()}
+
+    @property
+    def student_ids(self):
+        """Every StudentID in row order; after appends, put together on first use"""
+        if self._student_ids is None:
+            self._student_ids = self._base_ids + [student_id for chunk in self.added_chunks for student_id in chunk]
+        return self._student_ids
+
+    def position(self, student_id):
+        """Row position of a student, raising KeyError for unknown IDs"""
+        if student_id in self.added_ids:
+            return self.added_ids[student_id]
+        location = self.ids.get_loc(student_id)
+        # Duplicated IDs resolve to their first row, like the old boolean filter
+        if isinstance(location, slice):
+            return location.start
+        if isinstance(location, np.ndarray):
+            return int(np.flatnonzero(location)[0])
+        return location
+
+    def positions(self, student_ids):
+        """Row positions of several students, -1 for IDs not in the index"""
+        student_ids = np.asarray(student_ids, dtype=object)
+        if self.ids.is_unique:
+            positions = self.ids.get_indexer(student_ids)
+        else:
+            positions = np.array([self.position(student_id) if student_id in self.ids else -1
+                                  for student_id in student_ids], dtype=np.int64)
+        if self.added_ids:
+            missing = np.flatnonzero(positions < 0)
+            positions[missing] = [self.added_ids.get(student_ids[i], -1) for i in missing]
+        return positions
+
+    def class_rank(self, class_name, score):
+        """1-based rank of a score within its class (ties share the best rank)"""
+        scores = self.class_scores[class_name]
+        return scores.rank(score), scores.count
+
+    def class_percentile(self, class_name, score):
+        """Percentage of the class scoring below ``score``, counting ties as half"""
+        return self.class_scores[class_name].percentile_rank(score)
+
+    def regraded(self, data):
+        """Index of a regraded snapshot: the same rows, with each class's scores read again"""
+        index = copy.copy(self)
+        scores = data.columns([self.score_column])[self.score_column].to_numpy(dtype=np.float64)
+        index.class_scores = {class_name: SortedValues(scores[rows]) for class_name, rows in self.class_rows.items()}
+        return index
+
+    def updated(self, delta):
+        """Index after an upsert; only the classes the batch touches are rebuilt"""
+        index = copy.copy(self)
+        index.class_rows = dict(self.class_rows)
+        index.class_scores = dict(self.class_scores)
+
+        appended = delta.after.loc[delta.appended, 'StudentID'].tolist()
+        if appended:
+            index.added_ids = {**self.added_ids, **dict(zip(appended, delta.appended.tolist()))}
+            index.added_chunks = self.added_chunks + (tuple(appended),)
+            index._student_ids = None
+
+        for frame, sign in ((delta.before, -1), (delta.after, 1)):
+            scores = frame[self.score_column].to_numpy(dtype=np.float64)
+            for class_name, rows in frame.groupby('Class', sort=False, observed=True).indices.items():
+                class_scores = index.class_scores.get(class_name, SortedValues([]))
+                if sign < 0:
+                    index.class_scores[class_name] = class_scores.remove(scores[rows])
+                else:
+                    index.class_scores[class_name] = class_scores.insert(scores[rows])
+
+        # Row lists only change for students who moved class or were appended
+        before = delta.before['Class'].astype(object)
+        after = delta.after['Class'].astype(object)
+        moved = before.index[before.ne(after.reindex(before.index)).to_numpy()]
+        for class_name, positions in before.loc[moved].groupby(before.loc[moved], sort=False).groups.items():
+            rows = index.class_rows[class_name]
+            index.class_rows[class_name] = rows[~np.isin(rows, positions.to_numpy())]
+        joined = after.loc[moved.append(pd.Index(delta.appended))]
+        for class_name, positions in joined.groupby(joined, sort=False).groups.items():
+            rows = index.class_rows.get(class_name, np.empty(0, dtype=np.int64))
+            positions = np.sort(positions.to_numpy())
+            index.class_rows[class_name] = np.insert(rows, np.searchsorted(rows, positions), positions)
+        return index
+
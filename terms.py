@@ -0,0 +1,162 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from column_store import STORE_SUFFIX, is_column_store
+from data_store import load_students, source_version
+from schema import SUBJECTS
+
+TERM_METRICS = SUBJECTS + ['OverallPercentage', 'Attendance']
+SOURCE_SUFFIXES = ('.csv', '.parquet', '.feather')
+
+
+class TermSummary:
+    """Per-class student counts and metric sums of one term
+
+    Class and school-wide means over any set of terms are read from these
+    few numbers, without touching the term's rows again.
+    """
+
+    def __init__(self, students, sums, counts):
+        self.students = students
+        self.sums = sums
+        self.counts = counts
+
+    @classmethod
+    def from_frame(cls, df, metrics):
+        values = df[metrics].astype(np.float64)
+        grouped = values.groupby(df['Class'].astype(object), sort=True)
+        return cls(df['Class'].astype(object).value_counts(), grouped.sum(), grouped.count())
+
+    def means(self, class_name=None):
+        """Mean of every metric in one class, or school-wide; NaN when the class is absent"""
+        if class_name is None:
+            return self.sums.sum() / self.counts.sum(), int(self.students.sum())
+        if class_name not in self.sums.index:
+            return pd.Series(np.nan, index=self.sums.columns), 0
+        return self.sums.loc[class_name] / self.counts.loc[class_name], int(self.students[class_name])
+
+
+class TermStore:
+    """Snapshots of successive terms, one partition per term, for trend queries
+
+    A term directory holds one student file per term (CSV, Parquet, Feather
+    or a column store), named so the names sort in term order:
+    ``2024-1.csv``, ``2024-2.csv``. Partitions are opened on first use
+    through load_students, so each CSV is converted to a column store once
+    and memory-mapped afterwards, shared with every other caller and
+    reloaded when its file changes. Queries only read the terms they are
+    given: class trends come from a small per-term summary, and a student's
+    trajectory from one row of each term, found through that term's
+    StudentID index.
+    """
+
+    def __init__(self, directory, columnar=True, metrics=TERM_METRICS):
+        self.directory = directory
+        self.columnar = columnar
+        self.metrics = list(metrics)
+
+    def sources(self):
+        """Term name -> source path, in term order"""
+        entries = sorted(os.listdir(self.directory))
+        stems = {os.path.splitext(name)[0] for name in entries if name.endswith(SOURCE_SUFFIXES)}
+        sources = {}
+        for name in entries:
+            path = os.path.join(self.directory, name)
+            stem, suffix = os.path.splitext(name)
+            if suffix in SOURCE_SUFFIXES and os.path.isfile(path):
+                sources[stem] = path
+            elif suffix == STORE_SUFFIX and stem not in stems and is_column_store(path):
+                # Stores converted from a CSV in the directory belong to that CSV's term
+                sources[stem] = path
+        return dict(sorted(sources.items()))
+
+    @property
+    def terms(self):
+        return list(self.sources())
+
+    @property
+    def version(self):
+        """Version token of the whole store: every term's name and file version"""
+        return tuple((term, source_version(path)) for term, path in self.sources().items())
+
+    def select(self, terms=None):
+        """The given terms in term order, or every term; unknown names raise KeyError"""
+        known = self.terms
+        if terms is None:
+            return known
+        missing = set(terms).difference(known)
+        if missing:
+            raise KeyError(f"Unknown terms: {', '.join(sorted(missing))}")
+        terms = set(terms)
+        return [term for term in known if term in terms]
+
+    def partition(self, term):
+        """Snapshot of one term, loaded on first use"""
+        try:
+            path = self.sources()[term]
+        except KeyError:
+            raise KeyError(f"Unknown term {term}") from None
+        return load_students(path, columnar=self.columnar)
+
+    def summary(self, term):
+        """Per-class counts and sums of one term, built once per term file version"""
+        return self.partition(term).derived(
+            'term_summary', lambda data: TermSummary.from_frame(data.columns(['Class'] + self.metrics), self.metrics)
+        )
+
+    # ==================== TREND QUERIES ====================
+
+    def student_trajectory(self, student_id, terms=None, columns=None):
+        """One student's class and metrics in every term they appear in, indexed by term"""
+        columns = ['Class', 'Grade'] + self.metrics if columns is None else list(columns)
+        rows = {}
+        for term in self.select(terms):
+            data = self.partition(term)
+            position = data.index.positions([student_id])[0]
+            if position >= 0:
+                rows[term] = data.row(position, columns)
+        trajectory = pd.DataFrame.from_dict(rows, orient='index', columns=columns).rename_axis('Term')
+        # Scores are stored to two decimals; rounding drops the float32 noise of widening them
+        metrics = [column for column in columns if column in self.metrics]
+        return trajectory.astype({metric: np.float64 for metric in metrics}).round({metric: 2 for metric in metrics})
+
+    def class_trend(self, class_name=None, terms=None):
+        """Mean of every metric per term for one class, or school-wide, with the student count"""
+        rows, students = {}, {}
+        for term in self.select(terms):
+            rows[term], students[term] = self.summary(term).means(class_name)
+        trend = pd.DataFrame.from_dict(rows, orient='index', columns=self.metrics).rename_axis('Term')
+        trend.insert(0, 'Students', pd.Series(students, dtype=np.int64))
+        return trend
+
+    def term_deltas(self, class_name=None, terms=None):
+        """Change of each metric's mean from the previous term; the first term has none"""
+        return self.class_trend(class_name, terms)[self.metrics].diff().iloc[1:]
+
+    def student_changes(self, metric, before, after, class_name=None):
+        """Each student's change in a metric between two terms, largest rise first
+
+        Students are matched on StudentID; those missing from either term are
+        left out. ``class_name`` filters on the class held in ``after``.
+        """
+        earlier, later = self.partition(before), self.partition(after)
+        frame = later.columns(['StudentID', 'Name', 'Class', metric])
+        if class_name is not None:
+            rows = later.index.class_rows.get(class_name, np.empty(0, dtype=np.int64))
+            frame = frame.take(rows)
+        positions = earlier.index.positions(frame['StudentID'].to_numpy())
+        found = positions >= 0
+        frame = frame[found]
+        previous = earlier.columns([metric])[metric].to_numpy(dtype=np.float64)[positions[found]].round(2)
+        current = frame[metric].to_numpy(dtype=np.float64).round(2)
+        changes = pd.DataFrame({
+            'StudentID': frame['StudentID'].to_numpy(),
+            'Name': frame['Name'].astype(object).to_numpy(),
+            'Class': frame['Class'].astype(object).to_numpy(),
+            before: previous,
+            after: current,
+            'Change': (current - previous).round(2),
+        })
+        return changes.dropna(subset=['Change']).sort_values('Change', ascending=False, kind='stable')